@@ -0,0 +1,42 @@
+"""Micro-benchmark for the crossfade mixer.
+
+Measures the cost of mixing one 20 ms frame and how many guilds could be
+crossfading at once within the frame budget.
+
+Run from the music_bot directory: python -m benchmarks.mixing_benchmark
+"""
+import time
+import numpy as np
+from services.mixing_source import FRAME_BYTES, crossfade_ramps, mix_frames
+
+FRAME_BUDGET = 0.020  # Seconds between voice packets
+CROSSFADE_FRAMES = 150  # 3 seconds
+ITERATIONS = 20000
+
+def main():
+    rng = np.random.default_rng(0)
+    outgoing = rng.integers(-32768, 32767, FRAME_BYTES // 2, dtype=np.int16).tobytes()
+    incoming = rng.integers(-32768, 32767, FRAME_BYTES // 2, dtype=np.int16).tobytes()
+    fade_out, fade_in = crossfade_ramps(CROSSFADE_FRAMES)
+
+    for index in range(1000):
+        mix_frames(outgoing, incoming, fade_out[index % CROSSFADE_FRAMES], fade_in[index % CROSSFADE_FRAMES])
+
+    samples = []
+    for index in range(ITERATIONS):
+        started = time.perf_counter()
+        mix_frames(outgoing, incoming, fade_out[index % CROSSFADE_FRAMES], fade_in[index % CROSSFADE_FRAMES])
+        samples.append(time.perf_counter() - started)
+
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    p99 = samples[int(len(samples) * 0.99)]
+    print(f"frames mixed:      {ITERATIONS}")
+    print(f"mean per frame:    {mean * 1e6:.1f} us")
+    print(f"p50 per frame:     {samples[len(samples) // 2] * 1e6:.1f} us")
+    print(f"p99 per frame:     {p99 * 1e6:.1f} us")
+    print(f"budget used:       {mean / FRAME_BUDGET * 100:.3f}% of a 20 ms frame")
+    print(f"guilds per frame:  {int(FRAME_BUDGET / p99)} crossfading at once (p99)")
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,173 @@
 import asyncio
 import discord
 import json
-import requests
 import os
 import logging
-from typing import Optional, Dict, List
+import time
+import urllib.parse
+from typing import Optional, Dict, List, Set
 from models.song import Song
 from services.queue_manager import QueueManager
 from services.queue_downloader import QueueDownloader
 from services.audio_player import AudioPlayer
+from services.playback_controller import PlaybackController
+from services.broadcaster import Broadcaster
+from services.metadata_store import MetadataStore
+from services.queue_journal import QueueJournal
 
 logger = logging.getLogger(__name__)
 
 class MusicBot:
-    def __init__(self, bot, youtube, guilds):
+    def __init__(self, bot, build_youtube):
         self.bot = bot
-        self.youtube = youtube
-        self.guilds = guilds
         
         # Initialize services
-        self.download_dir = "music"
+        self.download_dir = os.getenv("MUSIC_DATA_DIR", "music")
         os.makedirs(self.download_dir, exist_ok=True)
         
+        # Per-guild state is created on first use and released once the guild is idle
         self.queue_managers = {}  # Dictionary to hold queue managers for each guild
-        self.queue_tasks = {}  # Dictionary to hold queue tasks for each guild
+        self.playback_controllers = {}  # Dictionary to hold playback state machines for each guild
+        self.playlist_tasks: Dict[int, Set[asyncio.Task]] = {}  # Playlists still being queued per guild
+        self.last_active: Dict[int, float] = {}  # guild_id -> monotonic time of the last queue or playback change
+        self.idle_timeout = float(os.getenv("GUILD_IDLE_TIMEOUT", "600"))
+        self.guilds_released = 0
+        self.released_guilds: Set[int] = set()  # Released guilds whose saved queue comes back on next use
         
+        # Track details shared by URL lookups, searches and playback
+        self.metadata_store = MetadataStore(
+            os.getenv("METADATA_DB_PATH", os.path.join(self.download_dir, "metadata.db")),
+            refresh_after=float(os.getenv("METADATA_REFRESH_SECONDS", str(7 * 24 * 3600)))
+        )
+        self.metadata_refreshes: Set[str] = set()  # Video ids being refreshed in the background
+        asyncio.create_task(self.metadata_store.load())
+
+        # Queue state saved across restarts, read back before the gateway is ready
+        self.queue_journal = QueueJournal(
+            self.download_dir,
+            compact_after=int(os.getenv("QUEUE_SNAPSHOT_ENTRIES", "1000"))
+        )
+        self.queue_journal.load()
+        self.queues_restored = False
+        self._checkpoints: Dict[int, tuple] = {}  # guild_id -> last journaled (position, paused, channel_id)
+        asyncio.create_task(self._checkpoint_playback())
+
+        # Pushes state changes to the SSE streams
+        self.broadcaster = Broadcaster()
+        # Publishes state to separate web processes, when they are used
+        self.state_bus = None
+
         # Initialize queue downloader
-        self.queue_downloader = QueueDownloader(self, youtube, self.get_queue_manager, self.guilds)
+        self.queue_downloader = QueueDownloader(self, build_youtube, self.get_queue_manager)
         
         # Initialize audio player
         self.audio_player = AudioPlayer(self)
         
-        # Start queue downloader in background
-        asyncio.create_task(self.queue_downloader.start())
+        # Start queue downloader in background, done once the cache index is warm
+        self.downloader_started = asyncio.create_task(self.queue_downloader.start())
+
+        asyncio.create_task(self._run_idle_release())
+
+    async def restore_queues(self):
+        """Bring back the queues, voice channels and playback of the previous run"""
+        if self.queues_restored:
+            return
+        self.queues_restored = True
+        saved = await self.queue_journal.load()
+        for guild_id, state in saved.items():
+            try:
+                await self._restore_guild(int(guild_id), state)
+            except Exception as e:
+                logger.error(f"Error restoring queue for guild {guild_id}: {e}", exc_info=True)
+
+    async def _restore_guild(self, guild_id: int, state: Dict) -> None:
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            logger.info(f"Not restoring queue for guild {guild_id}, the bot is no longer in it")
+            self.queue_journal.forget(guild_id)
+            return
 
-        # Initialize queues for each guild
-        asyncio.create_task(self.initialize_queues())
+        songs = [self._saved_song(song_data) for song_data in state["queue"]]
+        current = self._saved_song(state["current"]) if state["current"] else None
 
-    async def initialize_queues(self):
-        """Initialize queue managers for all guilds"""
+        voice_client = guild.voice_client
+        channel = guild.get_channel(state["channel_id"]) if state["channel_id"] else None
+        if channel and not voice_client:
+            try:
+                voice_client = await channel.connect()
+                logger.info(f"Reconnected to voice channel {channel.name} in guild {guild_id}")
+            except Exception as e:
+                logger.error(f"Failed to reconnect to voice channel in guild {guild_id}: {e}")
+
+        if current and not (voice_client and voice_client.is_connected()):
+            # Without a voice connection the song waits at the front of the queue
+            songs.insert(0, current)
+            current = None
+
+        queue_manager = self.get_queue_manager(guild_id)
+        if songs:
+            queue_manager.restore(songs)
+        if current:
+            logger.info(f"Resuming {current.title} at {state['position']:.0f}s in guild {guild_id}")
+            self.get_playback_controller(guild_id).restore(current, state["position"], state["paused"])
+        elif not queue_manager.queue and not voice_client:
+            self.queue_journal.forget(guild_id)
+
+    async def _restore_released(self, guild_id: int) -> None:
+        """Bring back the saved queue of a guild released while idle"""
         try:
-            for guild in self.guilds:
-                guild_id = int(guild["id"])
-                self.get_queue_manager(guild_id)
-                logger.info(f"Initialized queue manager for guild {guild_id}")
+            state = await self.queue_journal.get(guild_id)
+            if not state:
+                return
+            songs = [self._saved_song(song_data) for song_data in state["queue"]]
+            if state["current"]:
+                # Nothing is playing after the release, the song waits at the front of the queue
+                songs.insert(0, self._saved_song(state["current"]))
+                self.queue_journal.record(guild_id, {"op": "current", "song": None})
+            if songs:
+                self.get_queue_manager(guild_id).restore(songs)
         except Exception as e:
-            logger.error(f"Error initializing queues: {e}", exc_info=True)
+            logger.error(f"Error restoring released queue for guild {guild_id}: {e}", exc_info=True)
+
+    def _saved_song(self, song_data: Dict) -> Song:
+        """A song from the journal, downloaded only if its file is still cached"""
+        song = Song(**song_data)
+        if song.filepath and not os.path.exists(song.filepath):
+            song.is_downloaded = False
+            song.filepath = None
+        return song
+
+    async def _checkpoint_playback(self):
+        """Journal playback positions and voice channels at an interval"""
+        interval = float(os.getenv("QUEUE_CHECKPOINT_SECONDS", "10"))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                guild_ids = set(self._checkpoints) | {voice_client.guild.id for voice_client in self.bot.voice_clients}
+                for guild_id in guild_ids:
+                    guild = self.bot.get_guild(guild_id)
+                    voice_client = guild.voice_client if guild else None
+                    connected = bool(voice_client and voice_client.is_connected())
+                    position, _ = self.audio_player.get_progress(guild_id)
+                    checkpoint = (
+                        int(position),
+                        connected and voice_client.is_paused(),
+                        voice_client.channel.id if connected else None
+                    )
+                    if self._checkpoints.get(guild_id) == checkpoint:
+                        continue
+                    if connected:
+                        self._checkpoints[guild_id] = checkpoint
+                    else:
+                        self._checkpoints.pop(guild_id, None)
+                    self.queue_journal.record(guild_id, {
+                        "op": "position",
+                        "position": position,
+                        "paused": checkpoint[1],
+                        "channel_id": checkpoint[2]
+                    })
+            except Exception as e:
+                logger.error(f"Error checkpointing playback: {e}", exc_info=True)
 
     def get_queue_manager(self, guild_id: int) -> QueueManager:
         """Get or create a queue manager for the guild"""
@@ -53,14 +175,171 @@ class MusicBot:
             if guild_id not in self.queue_managers:
                 logger.info(f"Creating new queue manager for guild {guild_id}")
                 self.queue_managers[guild_id] = QueueManager(self, guild_id)
+                self.touch(guild_id)
+                if guild_id in self.released_guilds:
+                    self.released_guilds.discard(guild_id)
+                    asyncio.create_task(self._restore_released(guild_id))
             return self.queue_managers[guild_id]
         except Exception as e:
             logger.error(f"Error getting queue manager for guild {guild_id}: {e}", exc_info=True)
             raise
 
+    def get_playback_controller(self, guild_id: int) -> PlaybackController:
+        """Get or create the playback state machine for the guild"""
+        if guild_id not in self.playback_controllers:
+            self.playback_controllers[guild_id] = PlaybackController(self, guild_id)
+        return self.playback_controllers[guild_id]
+
+    def touch(self, guild_id: int) -> None:
+        """Record activity in a guild, postponing the release of its state"""
+        self.last_active[guild_id] = time.monotonic()
+
+    def is_idle(self, guild_id: int) -> bool:
+        """Whether nothing is playing, paused, queued or watched in the guild"""
+        controller = self.playback_controllers.get(guild_id)
+        if controller and not controller.is_idle():
+            return False
+        queue_manager = self.queue_managers.get(guild_id)
+        if queue_manager and (queue_manager.queue or queue_manager.current_song):
+            return False
+        if self.playlist_tasks.get(guild_id):
+            return False
+        guild = self.bot.get_guild(guild_id)
+        voice_client = guild.voice_client if guild else None
+        if voice_client and voice_client.is_playing():
+            return False
+        return not self.broadcaster.has_subscribers(guild_id)
+
+    async def _run_idle_release(self):
+        interval = min(60.0, self.idle_timeout / 2)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.release_idle_guilds()
+            except Exception as e:
+                logger.error(f"Error releasing idle guilds: {e}", exc_info=True)
+
+    async def release_idle_guilds(self):
+        """Release the state of guilds idle for longer than the idle timeout"""
+        guild_ids = (set(self.queue_managers) | set(self.playback_controllers)
+                     | set(self.audio_player.statuses) | set(self.audio_player.voice_clients)
+                     | {voice_client.guild.id for voice_client in self.bot.voice_clients})
+        now = time.monotonic()
+        for guild_id in guild_ids:
+            if not self.is_idle(guild_id):
+                self.touch(guild_id)
+            elif now - self.last_active.setdefault(guild_id, now) >= self.idle_timeout:
+                await self.release_guild(guild_id)
+
+    async def release_guild(self, guild_id: int) -> None:
+        """Disconnect from the guild's voice channel and drop its in-memory state.
+
+        The saved queue is kept and restored when the guild is used again.
+        """
+        guild = self.bot.get_guild(guild_id)
+        voice_client = guild.voice_client if guild else None
+        if voice_client:
+            try:
+                await voice_client.disconnect()
+            except Exception as e:
+                logger.error(f"Error disconnecting idle voice client in guild {guild_id}: {e}")
+
+        controller = self.playback_controllers.pop(guild_id, None)
+        if controller:
+            controller.close()
+        self.cancel_playlists(guild_id)
+        self.playlist_tasks.pop(guild_id, None)
+        self.queue_managers.pop(guild_id, None)
+        self.audio_player.release(guild_id)
+        await self.queue_downloader.cleanup_guild(guild_id)
+        self._checkpoints.pop(guild_id, None)
+        # The voice channel was left, a restart should not join it again
+        self.queue_journal.record(guild_id, {"op": "position", "position": 0, "paused": False, "channel_id": None})
+        self.released_guilds.add(guild_id)
+        self.last_active.pop(guild_id, None)
+        if self.state_bus:
+            self.state_bus.guild_released(guild_id)
+        self.guilds_released += 1
+        logger.info(f"Released idle guild {guild_id}")
+
+    def get_guild_stats(self) -> Dict:
+        """Get the per-guild resources currently held"""
+        now = time.monotonic()
+        guilds = {}
+        for guild_id, last_active in self.last_active.items():
+            controller = self.playback_controllers.get(guild_id)
+            queue_manager = self.queue_managers.get(guild_id)
+            guild = self.bot.get_guild(guild_id)
+            guilds[str(guild_id)] = {
+                "idle_seconds": round(now - last_active, 1),
+                "state": controller.state.value if controller else None,
+                "queue_length": len(queue_manager.queue) if queue_manager else 0,
+                "voice_connected": bool(guild and guild.voice_client)
+            }
+        audio_player = self.audio_player
+        return {
+            "idle_timeout": self.idle_timeout,
+            "released": self.guilds_released,
+            "resources": {
+                "queue_managers": len(self.queue_managers),
+                "playback_controllers": len(self.playback_controllers),
+                "playlist_tasks": sum(len(tasks) for tasks in self.playlist_tasks.values()),
+                "voice_clients": len(self.bot.voice_clients),
+                "player_statuses": len(audio_player.statuses),
+                "audio_sources": len(audio_player.audio_sources),
+                "prewarmed_decoders": len(audio_player.prewarmed),
+                "sse_channels": self.broadcaster.channel_count(),
+                "tasks": len(asyncio.all_tasks())
+            },
+            "guilds": guilds
+        }
+
+    def on_queue_changed(self, guild_id: int, event: str, operation: Optional[Dict] = None) -> None:
+        """Dispatch queue events to the services that react to them"""
+        try:
+            self.touch(guild_id)
+            if operation:
+                self.queue_journal.record(guild_id, operation)
+            elif event == "current":
+                current_song = self.get_queue_manager(guild_id).current_song
+                self.queue_journal.record(guild_id, {"op": "current", "song": current_song.to_dict() if current_song else None})
+            self.get_playback_controller(guild_id).on_queue_event(event)
+            if event != "update":
+                self.queue_downloader.on_queue_changed(guild_id)
+            if operation:
+                self.broadcaster.publish("queue", guild_id, operation, event="delta",
+                                         event_id=self.get_queue_manager(guild_id).event_id(operation["version"]))
+                if self.state_bus:
+                    self.state_bus.queue_changed(guild_id, operation)
+            if event == "current":
+                self.broadcaster.notify("currently_playing", guild_id)
+                if self.state_bus:
+                    self.state_bus.playback_changed(guild_id)
+        except Exception as e:
+            logger.error(f"Error dispatching queue event '{event}' for guild {guild_id}: {e}", exc_info=True)
+
+    def on_playback_changed(self, guild_id: int) -> None:
+        """Push a playback change in the guild to the SSE streams"""
+        self.touch(guild_id)
+        self.broadcaster.notify("currently_playing", guild_id)
+        if self.state_bus:
+            self.state_bus.playback_changed(guild_id)
+
+    def on_song_downloaded(self, video_id: str) -> None:
+        """Record the download state of a song in the queues that contain it"""
+        for queue_manager in self.queue_managers.values():
+            for song in queue_manager.queue:
+                if song.video_id == video_id:
+                    # The duration measured on the file replaces the reported one
+                    song.duration = self.metadata_store.get_duration(video_id, song.duration)
+                    queue_manager.song_updated(song)
+
     async def add_to_queue(self, ctx, query: str, guild_id: int) -> Optional[Dict]:
         """Add a song to the queue from URL or search query"""
         try:
+            if self.is_playlist_url(query):
+                return await self.add_playlist(query, guild_id)
+
             song_data = await self.process_url_or_search(query)
             if not song_data:
                 return None
@@ -68,9 +347,6 @@ class MusicBot:
             song = Song(**song_data)
             queue_manager = self.get_queue_manager(guild_id)
             await queue_manager.add(song)
-            
-            if guild_id not in self.queue_tasks:
-                self.queue_tasks[guild_id] = asyncio.create_task(self.process_queue(ctx, guild_id))
 
             return song.to_dict()
 
@@ -78,48 +354,57 @@ class MusicBot:
             logger.error(f"Error adding song to queue: {str(e)}", exc_info=True)
             return None
 
-    async def process_queue(self, ctx, guild_id: int):
-        """Main queue processing loop for a specific guild"""
+    @staticmethod
+    def is_playlist_url(query: str) -> bool:
+        """Whether a query is a YouTube playlist link"""
+        if not any(domain in query.lower() for domain in ['youtube.com', 'youtu.be']):
+            return False
+        params = urllib.parse.parse_qs(urllib.parse.urlparse(query).query)
+        playlist_id = params.get("list", [""])[0]
+        # Links to a video inside a generated mix are meant as the video alone
+        return bool(playlist_id) and not ("v" in params and playlist_id.startswith("RD"))
+
+    async def add_playlist(self, url: str, guild_id: int) -> Optional[Dict]:
+        """Queue a playlist's songs as they are listed, returning the first one once it is queued"""
+        first = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(self._queue_playlist(url, guild_id, first))
+        tasks = self.playlist_tasks.setdefault(guild_id, set())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return await asyncio.shield(first)
+
+    async def _queue_playlist(self, url: str, guild_id: int, first: asyncio.Future) -> None:
         queue_manager = self.get_queue_manager(guild_id)
-        while True:
-            try:
-                if not ctx.voice_client or not ctx.voice_client.is_connected():
-                    logger.debug("Voice client not connected, waiting...")
-                    await asyncio.sleep(1)
+        count = 0
+        try:
+            async for entry in self.queue_downloader.iter_playlist(url):
+                if not entry.get("id") or entry.get("title") in ("[Private video]", "[Deleted video]"):
                     continue
+                song = Song(
+                    id=entry["id"],
+                    title=entry.get("title") or entry["id"],
+                    duration=int(entry.get("duration") or 0),
+                    thumbnail=entry["thumbnails"][-1]["url"] if entry.get("thumbnails") else "",
+                    webpage_url=f"https://www.youtube.com/watch?v={entry['id']}"
+                )
+                await queue_manager.add(song)
+                count += 1
+                if not first.done():
+                    first.set_result({**song.to_dict(), "playlist": True})
+            logger.info(f"Queued {count} songs from playlist for guild {guild_id}: {url}")
+        except asyncio.CancelledError:
+            logger.info(f"Stopped queueing playlist for guild {guild_id} after {count} songs")
+            raise
+        except Exception as e:
+            logger.error(f"Error queueing playlist for guild {guild_id}: {e}", exc_info=True)
+        finally:
+            if not first.done():
+                first.set_result(None)
 
-                if not queue_manager.is_playing:
-                    next_song = await queue_manager.get_next()
-                    if (next_song):
-                        logger.debug(f"Got next song: {next_song.title}")
-                        
-                        # Start playing if already downloaded
-                        if next_song.is_downloaded:
-                            await queue_manager.set_current(next_song)
-                            success = await self.audio_player.play_next(ctx, next_song)
-                            
-                            if not success:
-                                logger.error(f"Failed to play: {next_song.title}")
-                                await queue_manager.clear_current()
-                        else:
-                            # If not downloaded, initiate download and wait
-                            logger.debug(f"Waiting for download: {next_song.title}")
-                            success = await self.queue_downloader.download_song(next_song)
-                            if success:
-                                await queue_manager.set_current(next_song)
-                                success = await self.audio_player.play_next(ctx, next_song)
-                                if not success:
-                                    logger.error(f"Failed to play: {next_song.title}")
-                                    await queue_manager.clear_current()
-                            else:
-                                logger.error(f"Failed to download: {next_song.title}")
-
-                await asyncio.sleep(1)
-
-            except Exception as e:
-                logger.error(f"Queue processing error: {str(e)}", exc_info=True)
-                await queue_manager.clear_current()
-                await asyncio.sleep(5)
+    def cancel_playlists(self, guild_id: int) -> None:
+        """Stop queueing any playlists still being listed for the guild"""
+        for task in list(self.playlist_tasks.get(guild_id, ())):
+            task.cancel()
 
     async def process_url_or_search(self, query: str) -> Optional[Dict]:
         """Process URL or search query to get song information"""
@@ -127,8 +412,55 @@ class MusicBot:
             return await self._process_url(query)
         return await self._process_search(query)
 
+    @staticmethod
+    def parse_video_id(url: str) -> Optional[str]:
+        """Video id of a YouTube video link"""
+        parsed = urllib.parse.urlparse(url)
+        if parsed.netloc.lower().endswith("youtu.be"):
+            return parsed.path.lstrip("/").split("/")[0] or None
+        params = urllib.parse.parse_qs(parsed.query)
+        if params.get("v"):
+            return params["v"][0]
+        parts = parsed.path.split("/")
+        if len(parts) >= 3 and parts[1] in ("shorts", "embed", "live"):
+            return parts[2]
+        return None
+
+    def _lookup_metadata(self, video_id: Optional[str], fetch) -> Optional[Dict]:
+        """Song data from the metadata store, refreshed in the background when stale"""
+        track = self.metadata_store.get(video_id) if video_id else None
+        if not track:
+            return None
+        if self.metadata_store.is_stale(track) and video_id not in self.metadata_refreshes:
+            self.metadata_refreshes.add(video_id)
+            asyncio.create_task(self._refresh_metadata(video_id, fetch))
+        return track.to_song_data()
+
+    async def _refresh_metadata(self, video_id: str, fetch) -> None:
+        try:
+            song_data = await fetch()
+            if song_data:
+                self.metadata_store.record_song(song_data)
+            else:
+                # Looked up again in full the next time it is requested
+                self.metadata_store.update(video_id, available=False)
+        except Exception as e:
+            logger.error(f"Error refreshing metadata for {video_id}: {e}", exc_info=True)
+        finally:
+            self.metadata_refreshes.discard(video_id)
+
     async def _process_url(self, url: str) -> Optional[Dict]:
         """Process YouTube URL"""
+        fetch = lambda: self._fetch_url(url)
+        song_data = self._lookup_metadata(self.parse_video_id(url), fetch)
+        if song_data:
+            return song_data
+        song_data = await fetch()
+        if song_data:
+            self.metadata_store.record_song(song_data)
+        return song_data
+
+    async def _fetch_url(self, url: str) -> Optional[Dict]:
         info = await self.queue_downloader.extract_info(url)
         if not info:
             return None
@@ -146,7 +478,17 @@ class MusicBot:
         video_id = await self.queue_downloader.search_video(query)
         if not video_id:
             return None
-            
+
+        fetch = lambda: self._fetch_video(video_id)
+        song_data = self._lookup_metadata(video_id, fetch)
+        if song_data:
+            return song_data
+        song_data = await fetch()
+        if song_data:
+            self.metadata_store.record_song(song_data)
+        return song_data
+
+    async def _fetch_video(self, video_id: str) -> Optional[Dict]:
         video_info = await self.queue_downloader.get_video_details(video_id)
         if not video_info:
             return None
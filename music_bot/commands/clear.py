@@ -34,6 +34,8 @@ class Clear(commands.Cog):
 
         try:
             queue_manager = music_bot.get_queue_manager(guild_id)
+            # A playlist still being listed would otherwise refill the queue
+            music_bot.cancel_playlists(guild_id)
             await queue_manager.clear()
             logger.info(f"Cleared queue for guild {guild_id}")
             
@@ -39,15 +39,15 @@ class NowPlaying(commands.Cog):
     async def progress(self, ctx):
         """Show current playback progress"""
         music_bot = self.bot.music_bot
+        guild_id = ctx.guild.id
         
-        if not music_bot.audio_player.status.is_playing:
+        current_song = music_bot.get_queue_manager(guild_id).get_currently_playing()
+        if not current_song:
             await ctx.send("Nothing is playing.", ephemeral=True)
             return
             
-        current_song = music_bot.get_current_song()
-        if current_song:
-            progress = music_bot.audio_player.get_progress_string()
-            await ctx.send(f"🎵 {current_song['title']}\n⏳ {progress}")
+        progress = music_bot.audio_player.get_progress_string(guild_id)
+        await ctx.send(f"🎵 {current_song.title}\n⏳ {progress}")
 
 async def setup(bot):
     logger.info("Loading nowplaying cog")
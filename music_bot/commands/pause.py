@@ -40,7 +40,7 @@ class Pause(commands.Cog):
                 await interaction.followup.send("No song is currently playing.", ephemeral=True)
                 return
 
-            music_bot.audio_player.pause(guild_id)
+            music_bot.get_playback_controller(guild_id).pause()
             logger.info(f"Paused playback of '{current_song.title}' in guild {guild_id}")
             
             await interaction.followup.send(f"Paused: {current_song.title}", ephemeral=True)
@@ -39,7 +39,13 @@ class Play(commands.Cog):
             logger.info(f"Adding to queue: {song} for guild: {guild_id}")
             song_info = await self.bot.music_bot.add_to_queue(ctx, song, guild_id)
 
-            if song_info:
+            if song_info and song_info.get("playlist"):
+                logger.info(f"Queueing playlist for guild {guild_id}, starting with: {song_info['title']}")
+                await interaction.followup.send(
+                    f"Adding playlist to queue, starting with: {song_info['title']}",
+                    ephemeral=True
+                )
+            elif song_info:
                 logger.info(f"Added song to queue for guild {guild_id}: {song_info}")
                 await interaction.followup.send(f"Added to queue: {song_info['title']}", ephemeral=True)
             else:
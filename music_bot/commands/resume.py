@@ -40,7 +40,7 @@ class Resume(commands.Cog):
                 await interaction.followup.send("No song is currently paused.", ephemeral=True)
                 return
 
-            music_bot.audio_player.resume(guild_id)
+            music_bot.get_playback_controller(guild_id).resume()
             logger.info(f"Resumed playback of '{current_song.title}' in guild {guild_id}")
             
             await interaction.followup.send(f"Resumed: {current_song.title}", ephemeral=True)
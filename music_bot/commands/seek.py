@@ -0,0 +1,91 @@
+from discord.ext import commands
+from discord import app_commands
+import discord
+import logging
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+def parse_position(value: str) -> Optional[float]:
+    """Parse a position given as seconds, m:ss or h:mm:ss"""
+    try:
+        seconds = 0.0
+        for part in value.strip().split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds if seconds >= 0 else None
+    except ValueError:
+        return None
+
+def format_position(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds//60}:{seconds%60:02d}"
+
+class Seek(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def _seek(self, interaction: discord.Interaction, command: str, target: Callable[[float], float]):
+        await interaction.response.defer()
+        ctx = await self.bot.get_context(interaction)
+        music_bot = self.bot.music_bot
+        guild_id = ctx.guild.id
+
+        logger.info(f"{command.capitalize()} command initiated for guild {guild_id}")
+
+        if not ctx.voice_client:
+            logger.warning(f"{command.capitalize()} command failed - bot not connected to voice channel in guild {guild_id}")
+            await interaction.followup.send("Not connected to a voice channel.", ephemeral=True)
+            return
+
+        if not ctx.author.voice or ctx.author.voice.channel != ctx.voice_client.channel:
+            logger.warning(f"{command.capitalize()} command failed - user not in bot's voice channel in guild {guild_id}")
+            await interaction.followup.send(
+                "You need to be in the same voice channel as the bot to seek.",
+                ephemeral=True
+            )
+            return
+
+        try:
+            current_song = music_bot.get_queue_manager(guild_id).get_currently_playing()
+            if not current_song:
+                logger.warning(f"{command.capitalize()} command failed - no song playing in guild {guild_id}")
+                await interaction.followup.send("No song is currently playing.", ephemeral=True)
+                return
+
+            position, _ = music_bot.audio_player.get_progress(guild_id)
+            reached = await music_bot.get_playback_controller(guild_id).seek(target(position))
+            if reached is None:
+                await interaction.followup.send("Could not seek in the current song.", ephemeral=True)
+                return
+
+            await interaction.followup.send(
+                f"Seeked to {format_position(reached)} in: {current_song.title}",
+                ephemeral=True
+            )
+            logger.info(f"{command.capitalize()} command completed successfully for guild {guild_id}")
+
+        except Exception as e:
+            logger.error(f"Error executing {command} command for guild {guild_id}: {str(e)}", exc_info=True)
+            await interaction.followup.send("An error occurred while trying to seek.", ephemeral=True)
+
+    @app_commands.command(name="seek", description="Jumps to a position in the current song")
+    @app_commands.describe(position="Position as seconds or m:ss")
+    async def seek(self, interaction: discord.Interaction, position: str):
+        target = parse_position(position)
+        if target is None:
+            await interaction.response.send_message("Invalid position, use seconds or m:ss.", ephemeral=True)
+            return
+        await self._seek(interaction, "seek", lambda current: target)
+
+    @app_commands.command(name="forward", description="Skips forward in the current song")
+    @app_commands.describe(seconds="Seconds to skip forward")
+    async def forward(self, interaction: discord.Interaction, seconds: int = 10):
+        await self._seek(interaction, "forward", lambda current: current + seconds)
+
+    @app_commands.command(name="rewind", description="Skips back in the current song")
+    @app_commands.describe(seconds="Seconds to skip back")
+    async def rewind(self, interaction: discord.Interaction, seconds: int = 10):
+        await self._seek(interaction, "rewind", lambda current: current - seconds)
+
+async def setup(bot):
+    await bot.add_cog(Seek(bot))
\ No newline at end of file
@@ -38,18 +38,9 @@ class Skip(commands.Cog):
             return
 
         try:
-            # Get current song before skipping
-            current_song = queue_manager.get_currently_playing()
+            current_song = await music_bot.get_playback_controller(guild_id).skip()
             if current_song:
-                logger.info(f"Skipping current song '{current_song.title}' in guild {guild_id}")
-            
-            # Stop current playback
-            music_bot.audio_player.stop(guild_id)
-            logger.info(f"Stopped audio playback for guild {guild_id}")
-            
-            # Clear current song in queue manager
-            await queue_manager.clear_current()
-            logger.info(f"Cleared current song state for guild {guild_id}")
+                logger.info(f"Skipped current song '{current_song.title}' in guild {guild_id}")
             
             response = "Skipped the current song."
             if current_song:
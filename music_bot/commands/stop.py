@@ -34,25 +34,11 @@ class Stop(commands.Cog):
             return
 
         try:
-            queue_manager = music_bot.get_queue_manager(guild_id)
-            
-            # Get current song before stopping
-            current_song = queue_manager.get_currently_playing()
+            # Stop playback, clear the queue and reset the current song state
+            current_song = await music_bot.get_playback_controller(guild_id).stop()
             if current_song:
-                logger.info(f"Currently playing '{current_song.title}' in guild {guild_id}")
-            
-            # Stop audio player first
-            if ctx.voice_client and ctx.voice_client.is_playing():
-                music_bot.audio_player.stop(guild_id)
-                logger.info(f"Stopped audio playback for guild {guild_id}")
-            
-            # Clear queue next
-            await queue_manager.clear()
-            logger.info(f"Cleared queue for guild {guild_id}")
-            
-            # Finally clear current song state
-            await queue_manager.clear_current()
-            logger.info(f"Cleared current song state for guild {guild_id}")
+                logger.info(f"Stopped playing '{current_song.title}' in guild {guild_id}")
+            logger.info(f"Stopped playback and cleared queue for guild {guild_id}")
             
             # Prepare response message
             response = "Playback stopped and queue cleared."
@@ -0,0 +1,18 @@
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+# CORS configuration (adjust origins as needed for your frontend)
+origins = [ 
+    "https://poggles-discord-bot-235556599709.us-east1.run.app",
+    "https://www.pogman.xyz",
+    "http://localhost:3000"
+]
+
+def add_cors(app: FastAPI) -> None:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
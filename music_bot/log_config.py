@@ -0,0 +1,65 @@
+import json
+import logging
+import sys
+from typing import Optional
+
+class GoogleCloudLogFormatter(logging.Formatter):
+    def format(self, record):
+        log_entry = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "component": record.name,
+            "time": self.formatTime(record),
+            "logging.googleapis.com/sourceLocation": {
+                "file": record.filename,
+                "line": record.lineno,
+                "function": record.funcName
+            }
+        }
+
+        # Include exception info if available
+        if record.exc_info:
+            log_entry["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(log_entry)
+
+def setup_logging(log_filename: Optional[str] = "discord.log"):
+    # Root logger configuration
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+
+    # Create console handler
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(GoogleCloudLogFormatter())
+    
+    handlers = [console_handler]
+
+    # Create file handler
+    if log_filename:
+        file_handler = logging.FileHandler(filename=log_filename, encoding='utf-8', mode='w')
+        file_handler.setFormatter(GoogleCloudLogFormatter())
+        handlers.append(file_handler)
+
+    # Configure root logger
+    for handler in handlers:
+        root_logger.addHandler(handler)
+
+    # Configure specific loggers
+    loggers = {
+        'discord': logging.INFO,
+        'ytdl': logging.INFO,
+        'bot': logging.INFO,
+        'commands': logging.INFO,
+        'services': logging.INFO,
+        'routes': logging.INFO
+    }
+
+    for logger_name, level in loggers.items():
+        logger = logging.getLogger(logger_name)
+        logger.setLevel(level)
+        # Prevent duplicate logs by not propagating to root logger
+        logger.propagate = False
+        for handler in handlers:
+            logger.addHandler(handler)
+
+    return logging.getLogger('discord')
@@ -5,85 +5,49 @@ from discord import app_commands
 import os
 import uvicorn
 from dotenv import load_dotenv
-import logging
 import asyncio
 from bot import MusicBot
-from googleapiclient.discovery import build
-import json
+from log_config import setup_logging
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-import sys
-import requests
+from fastapi.responses import JSONResponse
+from cors import add_cors
+from services.broadcaster import Broadcaster
+from services.http_client import DiscordHTTPClient
+from services.guild_registry import GuildRegistry
+from services.startup import StartupTracker
+from services.shard_coordinator import ShardCoordinator
+from services.state_bus import StateBusServer
 
 from routes import currently_playing
 from routes import queue
 from routes import current_guilds
 from routes import auth
+from routes import stats
+from routes import shard_proxy
 
 
+# Phase timings and subsystem readiness, from process start
+startup = StartupTracker()
+
 # --- Load environment variables ---
 load_dotenv()
 
-# --- Logging Setup ---
-class GoogleCloudLogFormatter(logging.Formatter):
-    def format(self, record):
-        log_entry = {
-            "severity": record.levelname,
-            "message": record.getMessage(),
-            "component": record.name,
-            "time": self.formatTime(record),
-            "logging.googleapis.com/sourceLocation": {
-                "file": record.filename,
-                "line": record.lineno,
-                "function": record.funcName
-            }
-        }
-
-        # Include exception info if available
-        if record.exc_info:
-            log_entry["exc_info"] = self.formatException(record.exc_info)
-
-        return json.dumps(log_entry)
-
-def setup_logging():
-    # Root logger configuration
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-
-    # Create console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(GoogleCloudLogFormatter())
-    
-    # Create file handler
-    file_handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
-    file_handler.setFormatter(GoogleCloudLogFormatter())
-
-    # Configure root logger
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
-
-    # Configure specific loggers
-    loggers = {
-        'discord': logging.INFO,
-        'ytdl': logging.INFO,
-        'bot': logging.INFO,
-        'commands': logging.INFO,
-        'services': logging.INFO,
-        'routes': logging.INFO
-    }
-
-    for logger_name, level in loggers.items():
-        logger = logging.getLogger(logger_name)
-        logger.setLevel(level)
-        # Prevent duplicate logs by not propagating to root logger
-        logger.propagate = False
-        logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
-
-    return logging.getLogger('discord')
+# --- Sharding ---
+# With SHARD_WORKERS above 1 this process only coordinates: it serves the API
+# and forwards per-guild calls to worker processes that each run a share of
+# the Discord shards. Workers are started with SHARD_WORKER_SOCKET set.
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "1"))
+SHARD_WORKER_INDEX = os.getenv("SHARD_WORKER_INDEX")
+SHARD_WORKER_SOCKET = os.getenv("SHARD_WORKER_SOCKET")
+COORDINATOR = SHARD_WORKERS > 1 and not SHARD_WORKER_SOCKET
+
+# --- State bus ---
+# With STATE_BUS_SOCKET set the bot publishes guild state on this Unix socket
+# for web processes (web.py) that serve the API apart from the voice process
+STATE_BUS_SOCKET = os.getenv("STATE_BUS_SOCKET")
 
 # Initialize logging
-logger = setup_logging()
+logger = setup_logging(f"discord-worker-{SHARD_WORKER_INDEX}.log" if SHARD_WORKER_INDEX else "discord.log")
 
 # --- Intents Setup ---
 intents = discord.Intents.default()
@@ -91,56 +55,124 @@ intents.message_content = True
 intents.voice_states = True
 
 # --- Bot Setup ---
-bot = commands.Bot(command_prefix=commands.when_mentioned_or("/"), intents=intents)
+if SHARD_WORKER_SOCKET:
+    bot = commands.AutoShardedBot(
+        command_prefix=commands.when_mentioned_or("/"),
+        intents=intents,
+        shard_ids=[int(shard_id) for shard_id in os.getenv("SHARD_IDS").split(",")],
+        shard_count=int(os.getenv("SHARD_COUNT"))
+    )
+else:
+    bot = commands.Bot(command_prefix=commands.when_mentioned_or("/"), intents=intents)
 
 # --- YouTube Data API Setup ---
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
-youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
+
+def build_youtube():
+    """Build the YouTube Data API client, called on its first use.
+
+    The discovery document bundled with the client library is used
+    instead of fetching it over the network.
+    """
+    from googleapiclient.discovery import build
+    return build("youtube", "v3", developerKey=YOUTUBE_API_KEY, static_discovery=True, cache_discovery=False)
 
 # --- FastAPI Setup for Health Check and API Endpoints ---
 app = FastAPI()
 
-# CORS configuration (adjust origins as needed for your frontend)
-origins = [ 
-    "https://poggles-discord-bot-235556599709.us-east1.run.app",
-    "https://www.pogman.xyz",
-    "http://localhost:3000"
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+add_cors(app)
 
 # Health check endpoint
 @app.get("/healthz")
 async def health_check():
     return {"status": "ok"}
 
-app.include_router(currently_playing.init_router(bot))
-app.include_router(queue.init_router(bot))
-app.include_router(current_guilds.init_router(bot, os.getenv("DISCORD_BOT_TOKEN")))
-app.include_router(auth.init_router(bot, os.getenv("DISCORD_BOT_TOKEN")))
+# Readiness endpoint, 503 until every subsystem is up
+@app.get("/readyz")
+async def readiness_check():
+    if COORDINATOR:
+        workers = await coordinator.gather("/readyz")
+        status = {"ready": all(worker.get("ready") for worker in workers.values()), "workers": workers}
+        return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
+    status = startup.get_status()
+    return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
+
+cogs_loaded = False
+
+def music_bot_ready(check):
+    music_bot = getattr(bot, "music_bot", None)
+    return music_bot is not None and check(music_bot)
+
+startup.add_check("gateway", lambda: bot.is_ready() and not bot.is_closed())
+startup.add_check("cogs", lambda: cogs_loaded)
+startup.add_check("cache_index", lambda: music_bot_ready(lambda music_bot: music_bot.queue_downloader.audio_cache.index_ready))
+startup.add_check("scheduler", lambda: music_bot_ready(lambda music_bot: music_bot.queue_downloader.scheduler.running))
+
+# Shared pooled client for every Discord REST call made outside discord.py
+http_client = DiscordHTTPClient()
+# The bot's guild list, kept current by gateway events
+guild_registry = GuildRegistry(http_client, os.getenv("DISCORD_BOT_TOKEN"))
+if SHARD_WORKER_SOCKET:
+    # The coordinator follows this worker's guild list over its socket
+    guild_registry.broadcaster = Broadcaster()
+    guild_registry.broadcaster.register("guilds", max_queued=1024)
+
+if COORDINATOR:
+    coordinator = ShardCoordinator(
+        SHARD_WORKERS,
+        http_client,
+        os.getenv("DISCORD_BOT_TOKEN"),
+        socket_dir=os.getenv("SHARD_SOCKET_DIR", "/tmp/music_bot"),
+        guild_registry=guild_registry
+    )
+    app.include_router(shard_proxy.init_router(coordinator))
+else:
+    app.include_router(currently_playing.init_router(bot))
+    app.include_router(queue.init_router(bot))
+    app.include_router(stats.init_router(bot))
+# The coordinator's registry is fed by the workers, and lists guilds over REST until they report
+app.include_router(current_guilds.init_router(bot, guild_registry))
+app.include_router(auth.init_router(bot, http_client, guild_registry))
 
 # --- Event: on_ready ---
 @bot.event
 async def on_ready():
     logger.info(f"Logged in as {bot.user} (ID: {bot.user.id})")
-
-    # Sync slash commands (register them with Discord)
-    try:
-        synced = await bot.tree.sync()
-        logger.info(f"Synced {len(synced)} command(s)")
-    except Exception as e:
-        logger.error(f"Failed to sync commands: {e}", exc_info=True)
+    startup.check("gateway")
+    guild_registry.load(bot.guilds)
+    # Voice reconnects run alongside the command sync
+    asyncio.create_task(bot.music_bot.restore_queues())
+
+    # Sync slash commands (register them with Discord). Commands are global,
+    # so with several workers only the one running shard 0 syncs them
+    if SHARD_WORKER_SOCKET and 0 not in bot.shard_ids:
+        logger.info("Leaving the command sync to the worker running shard 0")
+    else:
+        try:
+            synced = await bot.tree.sync()
+            logger.info(f"Synced {len(synced)} command(s)")
+        except Exception as e:
+            logger.error(f"Failed to sync commands: {e}", exc_info=True)
 
     print(f"Bot is ready. Logged in as {bot.user}")
     print("------")
     
 
+# --- Events: guild membership ---
+@bot.event
+async def on_guild_join(guild):
+    logger.info(f"Joined guild {guild.name} (ID: {guild.id})")
+    guild_registry.add(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    logger.info(f"Removed from guild {guild.name} (ID: {guild.id})")
+    guild_registry.remove(guild)
+
+@bot.event
+async def on_guild_update(before, after):
+    guild_registry.add(after)
+
 # --- Command: /ping ---
 @bot.tree.command(name="ping", description="Replies with Pong!")
 async def ping(interaction: discord.Interaction):
@@ -148,7 +180,19 @@ async def ping(interaction: discord.Interaction):
     await interaction.response.send_message("Pong!", ephemeral=True)
 
 # --- Load Cogs ---
+async def load_cog(cog_name: str) -> bool:
+    full_path = f"commands.{cog_name}"
+    try:
+        logger.info(f"Attempting to load cog: {full_path}")
+        await bot.load_extension(full_path)
+        logger.info(f"Successfully loaded cog: {cog_name}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to load cog {cog_name}: {str(e)}", exc_info=True)
+        return False
+
 async def load_cogs():
+    global cogs_loaded
     commands_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "commands")
     logger.info(f"Loading cogs from: {commands_dir}")
     
@@ -156,40 +200,54 @@ async def load_cogs():
         files = [f for f in os.listdir(commands_dir) 
                 if f.endswith('.py') and not f.startswith('__')]
         logger.info(f"Found cog files: {files}")
-        
-        for filename in files:
-            cog_name = filename[:-3]  # Remove .py extension
-            # Change the import path to be relative
-            full_path = f"commands.{cog_name}"
-            
-            try:
-                logger.info(f"Attempting to load cog: {full_path}")
-                await bot.load_extension(full_path)
-                logger.info(f"Successfully loaded cog: {cog_name}")
-            except Exception as e:
-                logger.error(f"Failed to load cog {cog_name}: {str(e)}", exc_info=True)
-                continue
-                
-        logger.info(f"Cog loading complete. Loaded {len(files)} cogs")
+
+        async with startup.phase("cogs"):
+            loaded = await asyncio.gather(*(load_cog(filename[:-3]) for filename in files))
+        failed = [filename[:-3] for filename, ok in zip(files, loaded) if not ok]
+        # Missing commands keep the readiness check failing
+        cogs_loaded = not failed
+        logger.info(f"Cog loading complete. Loaded {sum(loaded)} of {len(files)} cogs")
+        if failed:
+            logger.error(f"Cogs failed to load: {', '.join(failed)}")
     except Exception as e:
         logger.error(f"Failed to load cogs: {str(e)}", exc_info=True)
 
-async def get_all_guilds():
-    """Fetch guilds from Discord"""
-    headers = {"Authorization": f"Bot {os.getenv('DISCORD_BOT_TOKEN')}"}
-    response = requests.get("https://discord.com/api/users/@me/guilds", headers=headers)
-    response.raise_for_status()
-    return response.json()
+async def warm_cache_index():
+    async with startup.phase("cache_index"):
+        await bot.music_bot.downloader_started
+
+async def login():
+    async with startup.phase("login"):
+        await bot.login(os.getenv("DISCORD_BOT_TOKEN"))
 
 async def start_bot():
-    guilds = await get_all_guilds()
-    bot.music_bot = MusicBot(bot, youtube, guilds)
-    await load_cogs()
-    await bot.start(os.getenv("DISCORD_BOT_TOKEN"))
+    async with startup.phase("music_bot"):
+        bot.music_bot = MusicBot(bot, build_youtube)
+    if STATE_BUS_SOCKET and not SHARD_WORKER_SOCKET:
+        bot.music_bot.state_bus = StateBusServer(
+            bot.music_bot, STATE_BUS_SOCKET, currently_playing.get_currently_playing_data
+        )
+        await bot.music_bot.state_bus.start()
+    # Cog loading and cache warm-up overlap with the login
+    await asyncio.gather(load_cogs(), warm_cache_index(), login())
+    await bot.connect()
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(start_bot())
+    if COORDINATOR:
+        await coordinator.start()
+    else:
+        asyncio.create_task(start_bot())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if COORDINATOR:
+        await coordinator.stop()
+    await http_client.close()
+    if getattr(bot, "music_bot", None):
+        if bot.music_bot.state_bus:
+            await bot.music_bot.state_bus.stop()
+        await bot.music_bot.queue_journal.close()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
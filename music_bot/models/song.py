@@ -11,6 +11,7 @@ class Song:
     webpage_url: str
     is_downloaded: bool = False
     filepath: Optional[str] = None
+    stream_url: Optional[str] = None
 
     @property
     def video_id(self) -> str:
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Request, Response
 from fastapi.responses import JSONResponse, RedirectResponse
-import requests
 import logging
 import os
+import time
 from typing import Dict, List, Optional
 import urllib.parse
 from dotenv import load_dotenv
+from services.http_client import DiscordHTTPClient
+from services.guild_registry import GuildRegistry
+from services.session_store import Session, SessionStore
 
 load_dotenv()
 
@@ -13,16 +16,22 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 DISCORD_API_URL = "https://discord.com/api/v10"
+USER_GUILDS_TTL = float(os.getenv("USER_GUILDS_TTL_SECONDS", "60"))  # How long a user's guild list is reused
 BOT_TOKEN = None
 _bot = None
 
 class DiscordOAuth:
-    def __init__(self, client_id: str, client_secret: str, redirect_uri: str):
+    def __init__(self, client_id: str, client_secret: str, redirect_uri: str, http_client: DiscordHTTPClient):
+        self.http_client = http_client
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
         self.scope = "identify guilds"
-        self.sessions: Dict[str, Dict] = {}
+        self.sessions = SessionStore(
+            ttl=float(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600))),
+            max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "10000")),
+            db_path=os.getenv("SESSION_DB_PATH")
+        )
 
     def get_oauth_url(self) -> str:
         """Generate OAuth2 URL for Discord login"""
@@ -45,40 +54,33 @@ class DiscordOAuth:
         logger.debug(f"Exchanging code with data: {data}")
         
         try:
-            response = requests.post(f'{DISCORD_API_URL}/oauth2/token', data=data)
-            response.raise_for_status()
-            return response.json()
+            return await self.http_client.post('/oauth2/token', data=data)
         except Exception as e:
             logger.error(f"Token exchange failed: {e}", exc_info=True)
             return None
 
     async def get_user_data(self, access_token: str) -> Optional[Dict]:
         """Get user data from Discord"""
-        headers = {'Authorization': f'Bearer {access_token}'}
         try:
-            response = requests.get(f'{DISCORD_API_URL}/users/@me', headers=headers)
-            response.raise_for_status()
-            return response.json()
+            return await self.http_client.get('/users/@me', access_token=access_token)
         except Exception as e:
             logger.error(f"Failed to get user data: {e}", exc_info=True)
             return None
 
     async def get_user_guilds(self, access_token: str) -> List[Dict]:
         """Get user's guilds from Discord"""
-        headers = {'Authorization': f'Bearer {access_token}'}
         try:
-            response = requests.get(f'{DISCORD_API_URL}/users/@me/guilds', headers=headers)
-            response.raise_for_status()
-            return response.json()
+            return await self.http_client.get('/users/@me/guilds', access_token=access_token)
         except Exception as e:
             logger.error(f"Failed to get user guilds: {e}", exc_info=True)
             return []
 
-def init_router(bot, token):
+def init_router(bot, http_client: DiscordHTTPClient, guild_registry: GuildRegistry):
     oauth = DiscordOAuth(
         client_id=os.getenv("DISCORD_CLIENT_ID"),
         client_secret=os.getenv("DISCORD_CLIENT_SECRET"),
-        redirect_uri=os.getenv("DISCORD_REDIRECT_URI")
+        redirect_uri=os.getenv("DISCORD_REDIRECT_URI"),
+        http_client=http_client
     )
 
     @router.get("/auth/discord/login")
@@ -98,12 +100,9 @@ def init_router(bot, token):
             if not user_data:
                 return JSONResponse(content={"error": "Failed to get user data"}, status_code=400)
 
-            user_guilds = await oauth.get_user_guilds(token_data['access_token'])
-            bot_guilds = get_bot_guilds(token)
-            common_guilds = filter_common_guilds(user_guilds, bot_guilds)
-
-            session_id = create_session(oauth, user_data, token_data)
-            response.set_cookie(key="session_id", value=session_id, httponly=True, secure=True)
+            session = create_session(oauth, user_data, token_data)
+            common_guilds = await get_common_guilds(oauth, guild_registry, session)
+            response.set_cookie(key="session_id", value=session.session_id, httponly=True, secure=True)
 
             return JSONResponse(content={
                 "user": user_data,
@@ -117,26 +116,19 @@ def init_router(bot, token):
     @router.get("/api/me/guilds")
     async def get_user_guilds_endpoint(request: Request):
         """Get guilds where both user and bot are present"""
-        session_id = request.cookies.get("session_id")
-        if not session_id or session_id not in oauth.sessions:
+        session = await oauth.sessions.fetch(request.cookies.get("session_id"))
+        if not session:
             return JSONResponse(content={"error": "Unauthorized"}, status_code=401)
 
-        session = oauth.sessions[session_id]
-        user_guilds = await oauth.get_user_guilds(session['access_token'])
-        bot_guilds = get_bot_guilds(token)
-        common_guilds = filter_common_guilds(user_guilds, bot_guilds)
-
+        common_guilds = await get_common_guilds(oauth, guild_registry, session)
         return JSONResponse(content=common_guilds)
 
     return router
 
-def get_bot_guilds(token: str) -> List[Dict]:
-    """Get bot's guilds using bot token"""
-    headers = {"Authorization": f"Bot {token}"}
+async def get_bot_guilds(guild_registry: GuildRegistry) -> List[Dict]:
+    """Get bot's guilds from the registry"""
     try:
-        response = requests.get(f"{DISCORD_API_URL}/users/@me/guilds", headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return await guild_registry.get_guilds()
     except Exception as e:
         logger.error(f"Failed to get bot guilds: {e}", exc_info=True)
         return []
@@ -150,12 +142,24 @@ def filter_common_guilds(user_guilds: List[Dict], bot_guilds: List[Dict]) -> Lis
         if guild["id"] in bot_guild_ids
     ]
 
-def create_session(oauth: DiscordOAuth, user_data: Dict, token_data: Dict) -> str:
+async def get_common_guilds(oauth: DiscordOAuth, guild_registry: GuildRegistry, session: Session) -> List[Dict]:
+    """Get the guilds shared by the user and the bot, reusing the session's cached lists"""
+    now = time.monotonic()
+    if session.user_guilds is None or now - session.user_guilds_at > USER_GUILDS_TTL:
+        user_guilds = await oauth.get_user_guilds(session.access_token)
+        if not user_guilds:
+            # Failed fetches are not cached
+            return filter_common_guilds(user_guilds, await get_bot_guilds(guild_registry))
+        session.user_guilds, session.user_guilds_at = user_guilds, now
+        session.common_guilds = None
+
+    # The intersection is recomputed when the bot joins or leaves a guild
+    if session.common_guilds is None or session.common_guilds_version != guild_registry.version:
+        bot_guilds = await get_bot_guilds(guild_registry)
+        session.common_guilds = filter_common_guilds(session.user_guilds, bot_guilds)
+        session.common_guilds_version = guild_registry.version
+    return session.common_guilds
+
+def create_session(oauth: DiscordOAuth, user_data: Dict, token_data: Dict) -> Session:
     """Create a new session for the user"""
-    import uuid
-    session_id = str(uuid.uuid4())
-    oauth.sessions[session_id] = {
-        "user": user_data,
-        "access_token": token_data["access_token"]
-    }
-    return session_id
\ No newline at end of file
+    return oauth.sessions.create(user_data, token_data["access_token"], lifetime=token_data.get("expires_in"))
\ No newline at end of file
@@ -1,38 +1,47 @@
+import asyncio
 import logging
-import requests
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse, StreamingResponse
-import logging
+from services.http_client import DiscordHTTPError
+from services.guild_registry import GuildRegistry
+import aiohttp
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 _bot = None
-_token = None
+_guild_registry = None
 
-def get_all_guilds():
-    """Fetch guilds from Discord"""
-    headers = {"Authorization": f"Bot {_token}"}
-    response = requests.get("https://discord.com/api/users/@me/guilds", headers=headers)
-    response.raise_for_status()
-    return response.json()
+async def get_all_guilds():
+    """Get the bot's guilds from the registry"""
+    return await _guild_registry.get_guilds()
 
-def init_router(bot, token):
-    global _bot, _token
+def init_router(bot, guild_registry: GuildRegistry):
+    global _bot, _guild_registry
     _bot = bot
-    _token = token
+    _guild_registry = guild_registry
     
     @router.get("/api/guilds")
     async def get_guilds():
         try:
-            guilds = get_all_guilds()
+            guilds = await get_all_guilds()
             
             # Extract only id and name fields
             filtered_guilds = [{"id": guild["id"], "name": guild["name"]} for guild in guilds]
             
             return JSONResponse(content=filtered_guilds)
-        except requests.RequestException as e:
+        except (DiscordHTTPError, aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"Failed to fetch bot guilds: {e}", exc_info=True)
             return JSONResponse(content={"error": "Failed to fetch bot guilds"}, status_code=500)
+
+    if guild_registry.broadcaster:
+        @router.get("/internal/guilds/stream")
+        async def guild_stream():
+            """SSE stream of this worker's guild list, followed by the shard coordinator"""
+            broadcaster = guild_registry.broadcaster
+            subscription = await broadcaster.subscribe("guilds", 0, initial=guild_registry.snapshot_frames())
+            if subscription is None:
+                return JSONResponse(content={"error": "Too many subscribers"}, status_code=503)
+            return StreamingResponse(subscription.frames(broadcaster.heartbeat_interval), media_type="text/event-stream")
     
     return router
\ No newline at end of file
@@ -1,9 +1,7 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter
 from fastapi.responses import JSONResponse, StreamingResponse
 import logging
-import json
-import asyncio
-from typing import Dict, Optional
+from typing import Dict
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -47,26 +45,15 @@ async def get_currently_playing_data(guild_id: int) -> Dict:
         logger.error(f"Error getting currently playing data for guild {guild_id}: {e}", exc_info=True)
         raise
 
-async def event_stream(request: Request, guild_id: int):
-    """Generate SSE events for currently playing updates"""
-    last_state: Optional[Dict] = None
-    
-    while True:
-        if await request.is_disconnected():
-            logger.info(f"Client disconnected from SSE stream for guild {guild_id}")
-            break
-            
-        try:
-            current_state = await get_currently_playing_data(guild_id)
-            if current_state != last_state:
-                yield f"data: {json.dumps(current_state)}\n\n"
-                last_state = current_state
-        except Exception as e:
-            logger.error(f"Error in SSE stream for guild {guild_id}: {e}", exc_info=True)
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-            break
-            
-        await asyncio.sleep(1)
+async def event_stream(guild_id: int):
+    """Subscribe to the guild's currently playing updates, None if it has too many subscribers"""
+    broadcaster = _bot.music_bot.broadcaster
+    # Position changes continuously, the snapshot is rebuilt every second while anyone listens
+    broadcaster.register("currently_playing", get_currently_playing_data, tick_interval=1)
+    subscription = await broadcaster.subscribe("currently_playing", guild_id)
+    if subscription is None:
+        return None
+    return subscription.frames(broadcaster.heartbeat_interval)
 
 def init_router(bot):
     global _bot
@@ -83,12 +70,26 @@ def init_router(bot):
             logger.error(f"Error getting currently playing data for guild {guild_id}: {e}", exc_info=True)
             return JSONResponse(content={"error": str(e)}, status_code=500)
     
+    @router.post("/api/playback/{guild_id}/seek")
+    async def seek(guild_id: int, position: float):
+        """Seek the currently playing song of a specific guild to a position in seconds"""
+        try:
+            logger.info(f"Seeking to {position}s for guild {guild_id}")
+            reached = await _bot.music_bot.get_playback_controller(guild_id).seek(position)
+            if reached is None:
+                return JSONResponse(content={"error": "Nothing to seek"}, status_code=409)
+            data = await get_currently_playing_data(guild_id)
+            return JSONResponse(content=data)
+        except Exception as e:
+            logger.error(f"Error seeking for guild {guild_id}: {e}", exc_info=True)
+            return JSONResponse(content={"error": str(e)}, status_code=500)
+
     @router.get("/sse/currently_playing/{guild_id}")
-    async def sse_endpoint(request: Request, guild_id: int):
+    async def sse_endpoint(guild_id: int):
         """Provides the SSE endpoint for currently playing updates for a specific guild."""
-        return StreamingResponse(
-            event_stream(request, guild_id),
-            media_type="text/event-stream"
-        )
+        stream = await event_stream(guild_id)
+        if stream is None:
+            return JSONResponse(content={"error": "Too many subscribers"}, status_code=503)
+        return StreamingResponse(stream, media_type="text/event-stream")
         
     return router
\ No newline at end of file
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, Header
+from fastapi.responses import JSONResponse, StreamingResponse
+from services.broadcaster import encode_event
+from services.state_bus import StateBusClient
+from services.state_mirror import StateMirror
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+_mirror: Optional[StateMirror] = None
+_bus: Optional[StateBusClient] = None
+
+QUEUE_STREAM_BUFFER = 128  # Deltas held per client before it is dropped
+
+def get_initial_frames(guild_id: int, last_event_id: Optional[str]) -> List[bytes]:
+    """Frames that bring a new queue subscriber up to date, as in the bot's own API"""
+    queue = _mirror.get_queue(guild_id)
+    version = queue.parse_event_id(last_event_id)
+    operations = queue.get_operations_since(version) if version is not None else None
+    if operations is not None and len(operations) <= QUEUE_STREAM_BUFFER:
+        return [
+            encode_event(operation, event="delta", event_id=queue.event_id(operation["version"]))
+            for operation in operations
+        ]
+    return [encode_event(_mirror.get_queue_data(guild_id), event="snapshot", event_id=queue.event_id(queue.version))]
+
+def init_router(mirror: StateMirror, bus: StateBusClient):
+    global _mirror, _bus
+    _mirror = mirror
+    _bus = bus
+    broadcaster = mirror.broadcaster
+    broadcaster.register("queue", max_queued=QUEUE_STREAM_BUFFER)
+    broadcaster.register("currently_playing", mirror.get_currently_playing_data, tick_interval=1)
+
+    @router.get("/api/queue/{guild_id}")
+    async def get_queue(guild_id: int):
+        """Get the queue of a specific guild from the published state"""
+        data = _mirror.get_queue_data(guild_id)
+        return JSONResponse(content={"version": data["version"], "queue": data["queue"]})
+
+    @router.get("/sse/queue/{guild_id}")
+    async def queue_stream(guild_id: int, last_event_id: Optional[str] = Header(None)):
+        """SSE stream of a guild's queue: a snapshot or missed deltas, then deltas"""
+        subscription = await broadcaster.subscribe("queue", guild_id, initial=get_initial_frames(guild_id, last_event_id))
+        if subscription is None:
+            return JSONResponse(content={"error": "Too many subscribers"}, status_code=503)
+        return StreamingResponse(subscription.frames(broadcaster.heartbeat_interval), media_type="text/event-stream")
+
+    @router.get("/api/currently_playing/{guild_id}")
+    async def get_currently_playing(guild_id: int):
+        """Get the currently playing song of a specific guild from the published state"""
+        return JSONResponse(content=await _mirror.get_currently_playing_data(guild_id))
+
+    @router.post("/api/playback/{guild_id}/seek")
+    async def seek(guild_id: int, position: float):
+        """Ask the bot process to seek the currently playing song of a specific guild"""
+        try:
+            reply = await _bus.command("seek", guild_id, position=position)
+            return JSONResponse(content=reply["data"], status_code=reply["status"])
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            logger.error(f"Failed to send seek for guild {guild_id} to the bot process: {e}")
+            return JSONResponse(content={"error": "Bot process unavailable"}, status_code=503)
+
+    @router.get("/sse/currently_playing/{guild_id}")
+    async def currently_playing_stream(guild_id: int):
+        """SSE stream of a guild's currently playing song"""
+        subscription = await broadcaster.subscribe("currently_playing", guild_id)
+        if subscription is None:
+            return JSONResponse(content={"error": "Too many subscribers"}, status_code=503)
+        return StreamingResponse(subscription.frames(broadcaster.heartbeat_interval), media_type="text/event-stream")
+
+    @router.get("/api/stats/mirror")
+    async def get_mirror_stats():
+        """Get the state mirror and SSE fan-out of this web process"""
+        return JSONResponse(content={
+            "connected": _bus.connected,
+            **_mirror.get_stats(),
+            "sse": broadcaster.get_stats()
+        })
+
+    return router
@@ -1,16 +1,16 @@
-import asyncio
 import logging
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Header
 from fastapi.responses import JSONResponse, StreamingResponse
-import time
-from typing import AsyncGenerator
-import json
+from typing import AsyncGenerator, List, Optional
+from services.broadcaster import encode_event
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 _bot = None
 
+QUEUE_STREAM_BUFFER = 128  # Deltas held per client before it is dropped
+
 async def get_queue_data(guild_id: int):
     """Fetches queue data directly from bot instance for a specific guild"""
     if not _bot:
@@ -21,31 +21,45 @@ async def get_queue_data(guild_id: int):
         queue_manager = _bot.music_bot.get_queue_manager(guild_id)
         queue_info = queue_manager.get_queue_info()
         return {
+            "version": queue_manager.version,
             "queue": queue_info
         }
     except Exception as e:
         logger.error(f"Error getting queue data for guild {guild_id}: {e}")
         return None
 
-async def event_stream(request: Request, guild_id: int) -> AsyncGenerator[str, None]:
-    """Generates the SSE stream for queue updates for a specific guild."""
-    last_state = None
-    while True:
-        if await request.is_disconnected():
-            logger.info(f"Client disconnected from queue stream for guild {guild_id}")
-            break
-            
-        queue_data = await get_queue_data(guild_id)
-        if queue_data:
-            current_state = {
-                "queue": queue_data["queue"],
-                "error": None,
-                "timestamp": int(time.time() * 1000)
-            }
-            if current_state != last_state:
-                yield f"data: {json.dumps(current_state)}\n\n"
-                last_state = current_state
-        await asyncio.sleep(1)
+def get_initial_frames(guild_id: int, last_event_id: Optional[str]) -> List[bytes]:
+    """Frames that bring a new subscriber up to date.
+
+    A client resuming from a version still in the operation log gets the
+    deltas it missed, every other client gets a snapshot.
+    """
+    queue_manager = _bot.music_bot.get_queue_manager(guild_id)
+    version = queue_manager.parse_event_id(last_event_id)
+    operations = queue_manager.get_operations_since(version) if version is not None else None
+    if operations is not None and len(operations) <= QUEUE_STREAM_BUFFER:
+        return [
+            encode_event(operation, event="delta", event_id=queue_manager.event_id(operation["version"]))
+            for operation in operations
+        ]
+
+    snapshot = {
+        "version": queue_manager.version,
+        "queue": queue_manager.get_queue_info(),
+        "error": None
+    }
+    return [encode_event(snapshot, event="snapshot", event_id=queue_manager.event_id(queue_manager.version))]
+
+async def event_stream(guild_id: int, last_event_id: Optional[str]) -> Optional[AsyncGenerator[bytes, None]]:
+    """Subscribe to queue updates for a specific guild, None if it has too many subscribers"""
+    broadcaster = _bot.music_bot.broadcaster
+    # Deltas cannot be coalesced, a client that falls this far behind is
+    # disconnected and resumes with Last-Event-ID
+    broadcaster.register("queue", max_queued=QUEUE_STREAM_BUFFER)
+    subscription = await broadcaster.subscribe("queue", guild_id, initial=get_initial_frames(guild_id, last_event_id))
+    if subscription is None:
+        return None
+    return subscription.frames(broadcaster.heartbeat_interval)
 
 def init_router(bot):
     global _bot
@@ -60,9 +74,15 @@ def init_router(bot):
         return JSONResponse(content={"error": "Failed to get queue data"}, status_code=500)
     
     @router.get("/sse/queue/{guild_id}")
-    async def sse_endpoint(request: Request, guild_id: int):
-        """Provides the SSE endpoint for queue updates for a specific guild."""
-        generator = event_stream(request, guild_id)
+    async def sse_endpoint(guild_id: int, last_event_id: Optional[str] = Header(None)):
+        """Provides the SSE endpoint for queue updates for a specific guild.
+
+        The stream starts with a snapshot event, followed by delta events
+        carrying one queue operation each. Event ids are queue versions.
+        """
+        generator = await event_stream(guild_id, last_event_id)
+        if generator is None:
+            return JSONResponse(content={"error": "Too many subscribers"}, status_code=503)
         return StreamingResponse(generator, media_type="text/event-stream")
         
     return router
\ No newline at end of file
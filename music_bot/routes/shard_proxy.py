@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+import aiohttp
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from services.shard_coordinator import ShardCoordinator
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+_coordinator: Optional[ShardCoordinator] = None
+
+# Request headers passed on to the workers
+FORWARDED_HEADERS = ("last-event-id", "content-type")
+
+def forwarded_headers(request: Request) -> Dict[str, str]:
+    return {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+
+async def forward(guild_id: int, request: Request) -> Response:
+    """Send a per-guild API request to the worker that owns the guild"""
+    worker = _coordinator.worker_for_guild(guild_id)
+    try:
+        status, body, content_type = await _coordinator.request(
+            worker, request.method, request.url.path, params=dict(request.query_params),
+            headers=forwarded_headers(request), body=await request.body()
+        )
+        return Response(content=body, status_code=status, media_type=content_type)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Failed to forward {request.url.path} to worker {worker}: {e}")
+        return JSONResponse(content={"error": "Guild worker unavailable"}, status_code=502)
+
+async def forward_stream(guild_id: int, request: Request) -> Response:
+    """Relay an SSE stream from the worker that owns the guild"""
+    worker = _coordinator.worker_for_guild(guild_id)
+    try:
+        response = await _coordinator.stream(worker, request.url.path, headers=forwarded_headers(request))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Failed to open stream {request.url.path} on worker {worker}: {e}")
+        return JSONResponse(content={"error": "Guild worker unavailable"}, status_code=502)
+
+    if response.status != 200:
+        body = await response.read()
+        response.release()
+        return Response(content=body, status_code=response.status, media_type=response.content_type)
+
+    async def relay():
+        try:
+            async for chunk in response.content.iter_any():
+                yield chunk
+        except aiohttp.ClientError as e:
+            logger.info(f"Stream {request.url.path} from worker {worker} ended: {e}")
+        finally:
+            response.release()
+
+    return StreamingResponse(relay(), media_type="text/event-stream")
+
+def init_router(coordinator: ShardCoordinator):
+    global _coordinator
+    _coordinator = coordinator
+
+    @router.get("/api/queue/{guild_id}")
+    async def get_queue(guild_id: int, request: Request):
+        return await forward(guild_id, request)
+
+    @router.get("/sse/queue/{guild_id}")
+    async def queue_stream(guild_id: int, request: Request):
+        return await forward_stream(guild_id, request)
+
+    @router.get("/api/currently_playing/{guild_id}")
+    async def get_currently_playing(guild_id: int, request: Request):
+        return await forward(guild_id, request)
+
+    @router.post("/api/playback/{guild_id}/seek")
+    async def seek(guild_id: int, request: Request):
+        return await forward(guild_id, request)
+
+    @router.get("/sse/currently_playing/{guild_id}")
+    async def currently_playing_stream(guild_id: int, request: Request):
+        return await forward_stream(guild_id, request)
+
+    @router.get("/api/stats/shards")
+    async def get_shard_stats():
+        """Get the worker processes and the shards each one runs"""
+        return JSONResponse(content=_coordinator.get_stats())
+
+    @router.get("/api/stats/{name}")
+    async def get_worker_stats(name: str, request: Request):
+        """Get a stats endpoint from every worker"""
+        return JSONResponse(content={"workers": await _coordinator.gather(request.url.path)})
+
+    return router
@@ -0,0 +1,76 @@
+import logging
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+_bot = None
+
+def init_router(bot):
+    global _bot
+    _bot = bot
+
+    @router.get("/api/stats/downloads")
+    async def get_download_stats():
+        """Get download scheduler queue depth and wait times"""
+        try:
+            return JSONResponse(content=_bot.music_bot.queue_downloader.get_stats())
+        except Exception as e:
+            logger.error(f"Error getting download stats: {e}", exc_info=True)
+            return JSONResponse(content={"error": "Failed to get download stats"}, status_code=500)
+
+    @router.get("/api/stats/cache")
+    async def get_cache_stats():
+        """Get audio cache usage, hit rate and eviction counters"""
+        try:
+            return JSONResponse(content=_bot.music_bot.queue_downloader.get_cache_stats())
+        except Exception as e:
+            logger.error(f"Error getting cache stats: {e}", exc_info=True)
+            return JSONResponse(content={"error": "Failed to get cache stats"}, status_code=500)
+
+    @router.get("/api/stats/search")
+    async def get_search_stats():
+        """Get search cache hit rate and lookup latency"""
+        try:
+            return JSONResponse(content=_bot.music_bot.queue_downloader.get_search_stats())
+        except Exception as e:
+            logger.error(f"Error getting search stats: {e}", exc_info=True)
+            return JSONResponse(content={"error": "Failed to get search stats"}, status_code=500)
+
+    @router.get("/api/stats/metadata")
+    async def get_metadata_stats():
+        """Get track metadata store size and hit rate"""
+        try:
+            return JSONResponse(content=_bot.music_bot.metadata_store.get_stats())
+        except Exception as e:
+            logger.error(f"Error getting metadata stats: {e}", exc_info=True)
+            return JSONResponse(content={"error": "Failed to get metadata stats"}, status_code=500)
+
+    @router.get("/api/stats/guilds")
+    async def get_guild_stats():
+        """Get the per-guild state held and how long each guild has been idle"""
+        try:
+            return JSONResponse(content=_bot.music_bot.get_guild_stats())
+        except Exception as e:
+            logger.error(f"Error getting guild stats: {e}", exc_info=True)
+            return JSONResponse(content={"error": "Failed to get guild stats"}, status_code=500)
+
+    @router.get("/api/stats/state_bus")
+    async def get_state_bus_stats():
+        """Get the web processes reading state from the bot and messages sent to them"""
+        state_bus = _bot.music_bot.state_bus
+        if state_bus is None:
+            return JSONResponse(content={"enabled": False})
+        return JSONResponse(content={"enabled": True, **state_bus.get_stats()})
+
+    @router.get("/api/stats/sse")
+    async def get_sse_stats():
+        """Get SSE subscriber counts and fan-out counters"""
+        try:
+            return JSONResponse(content=_bot.music_bot.broadcaster.get_stats())
+        except Exception as e:
+            logger.error(f"Error getting SSE stats: {e}", exc_info=True)
+            return JSONResponse(content={"error": "Failed to get SSE stats"}, status_code=500)
+
+    return router
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Hashable, Optional, Set
+from services.seek_index import seek_index_path
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".opus", ".mp3")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_ENTRIES = 1000
+
+@dataclass
+class CacheEntry:
+    """Metadata for one cached audio file"""
+    video_id: str
+    filename: str
+    size: int
+    last_access: float
+    hits: int = 0
+    duration: float = 0
+    loudness: Optional[float] = None  # Integrated loudness in LUFS, None if not measured
+    gain_db: float = 0.0  # Gain to apply when the file is decoded for playback
+
+class AudioCache:
+    """Size-bounded cache of downloaded audio files with an on-disk index"""
+
+    INDEX_FILENAME = "index.json"
+    SAVE_DELAY = 5  # Seconds to batch index writes
+
+    def __init__(self, directory: str, max_bytes: int, max_entries: int,
+                 policy: str = "lru", executor=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.policy = policy
+        self.executor = executor
+        self.index_path = os.path.join(directory, self.INDEX_FILENAME)
+
+        self.entries: Dict[str, CacheEntry] = {}
+        self._pins: Dict[Hashable, Set[str]] = {}  # owner -> pinned video_ids
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        self.index_ready = False
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.size for entry in self.entries.values())
+
+    async def load(self) -> None:
+        """Rebuild the index from disk, reconciling it with the files present"""
+        try:
+            started = time.monotonic()
+            entries = await asyncio.get_running_loop().run_in_executor(self.executor, self._scan)
+            # Entries added while the scan was running are newer than what it found
+            entries.update(self.entries)
+            self.entries = entries
+            self.index_ready = True
+            self._evict()
+            self._schedule_save()
+            logger.info(
+                f"Audio cache index ready: {len(self.entries)} files, {self.total_bytes} bytes "
+                f"({time.monotonic() - started:.2f}s)"
+            )
+        except Exception as e:
+            logger.error(f"Error rebuilding audio cache index: {e}", exc_info=True)
+
+    def _scan(self) -> Dict[str, CacheEntry]:
+        indexed = {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for data in json.load(f).get("entries", []):
+                    entry = CacheEntry(**data)
+                    indexed[entry.video_id] = entry
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable audio cache index {self.index_path}: {e}")
+
+        entries = {}
+        for filename in os.listdir(self.directory):
+            video_id, ext = os.path.splitext(filename)
+            if ext not in AUDIO_EXTENSIONS:
+                continue
+            stat = os.stat(os.path.join(self.directory, filename))
+            if not stat.st_size:
+                continue
+            entry = indexed.get(video_id)
+            if entry and entry.filename == filename:
+                entry.size = stat.st_size
+            else:
+                entry = CacheEntry(video_id=video_id, filename=filename,
+                                   size=stat.st_size, last_access=stat.st_mtime)
+            entries[video_id] = entry
+        return entries
+
+    def lookup(self, video_id: str) -> Optional[CacheEntry]:
+        """Find a cached file and record the access"""
+        entry = self.entries.get(video_id)
+        if entry is None and not self.index_ready:
+            entry = self._adopt(video_id)
+        if entry and not os.path.exists(self.path(entry)):
+            del self.entries[video_id]
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry.hits += 1
+        entry.last_access = time.time()
+        self._schedule_save()
+        return entry
+
+    def _adopt(self, video_id: str) -> Optional[CacheEntry]:
+        """Pick up a file that the background index rebuild has not reached yet"""
+        for ext in AUDIO_EXTENSIONS:
+            filename = f"{video_id}{ext}"
+            filepath = os.path.join(self.directory, filename)
+            if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+                entry = CacheEntry(video_id=video_id, filename=filename,
+                                   size=os.path.getsize(filepath), last_access=time.time())
+                self.entries[video_id] = entry
+                return entry
+        return None
+
+    def add(self, video_id: str, filepath: str, duration: float = 0, **metadata) -> CacheEntry:
+        """Register a newly downloaded file and enforce the budgets"""
+        entry = CacheEntry(
+            video_id=video_id,
+            filename=os.path.basename(filepath),
+            size=os.path.getsize(filepath),
+            last_access=time.time(),
+            duration=duration,
+            **metadata
+        )
+        self.entries[video_id] = entry
+        self._evict(protect={video_id})
+        self._schedule_save()
+        return entry
+
+    def set_loudness(self, video_id: str, loudness: float, gain_db: float) -> None:
+        """Store the loudness measured on a cached file"""
+        entry = self.entries.get(video_id)
+        if entry:
+            entry.loudness = loudness
+            entry.gain_db = gain_db
+            self._schedule_save()
+
+    def path(self, entry: CacheEntry) -> str:
+        return os.path.join(self.directory, entry.filename)
+
+    def pin(self, owner: Hashable, video_ids: Set[str]) -> None:
+        """Protect files from eviction on behalf of an owner, replacing its previous pins"""
+        if video_ids:
+            self._pins[owner] = set(video_ids)
+        else:
+            self._pins.pop(owner, None)
+
+    def unpin(self, owner: Hashable) -> None:
+        self._pins.pop(owner, None)
+
+    def _pinned(self) -> Set[str]:
+        pinned = set()
+        for video_ids in self._pins.values():
+            pinned |= video_ids
+        return pinned
+
+    def _evict(self, protect: Set[str] = frozenset()) -> None:
+        """Evict unpinned files until the byte and entry budgets are met"""
+        total = self.total_bytes
+        if total <= self.max_bytes and len(self.entries) <= self.max_entries:
+            return
+
+        pinned = self._pinned() | protect
+        if self.policy == "lfu":
+            key = lambda entry: (entry.hits, entry.last_access)
+        else:
+            key = lambda entry: entry.last_access
+        candidates = sorted(
+            (entry for entry in self.entries.values() if entry.video_id not in pinned),
+            key=key
+        )
+
+        for entry in candidates:
+            if total <= self.max_bytes and len(self.entries) <= self.max_entries:
+                break
+            try:
+                os.remove(self.path(entry))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Failed to evict {entry.filename}: {e}")
+                continue
+            try:
+                os.remove(seek_index_path(self.path(entry)))
+            except OSError:
+                pass
+            del self.entries[entry.video_id]
+            total -= entry.size
+            self.evictions += 1
+            logger.info(f"Evicted {entry.filename} from audio cache ({entry.size} bytes)")
+
+        if total > self.max_bytes or len(self.entries) > self.max_entries:
+            logger.warning(f"Audio cache over budget, remaining files are pinned ({total} bytes)")
+
+    def _schedule_save(self) -> None:
+        if self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._save_handle = loop.call_later(self.SAVE_DELAY, self._save)
+
+    def _save(self) -> None:
+        self._save_handle = None
+        data = {"entries": [asdict(entry) for entry in self.entries.values()]}
+        asyncio.get_running_loop().run_in_executor(self.executor, self._write_index, data)
+
+    def _write_index(self, data: Dict) -> None:
+        try:
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logger.error(f"Error writing audio cache index: {e}", exc_info=True)
+
+    def get_stats(self) -> Dict:
+        """Get cache usage and hit-rate counters"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "pinned": len(self._pinned()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "evictions": self.evictions,
+            "index_ready": self.index_ready
+        }
@@ -1,10 +1,14 @@
 import asyncio
 import discord
 import logging
+import math
+import os
 from dataclasses import dataclass
-from typing import Optional, Callable
-import time
+from typing import Any, Optional, Callable
 import logging
+from services.mixing_source import MixingSource
+from services.audio_sources import FRAME_SECONDS, PrewarmedSource, SkipFramesSource, TrackedSource
+from services.seek_index import OffsetFileReader, find_seek_point
 
 logger = logging.getLogger(__name__)
 
@@ -13,10 +17,17 @@ class PlaybackStatus:
     """Represents current playback status"""
     guild_id: int = 0
     is_playing: bool = False
-    started_at: float = 0
-    current_position: float = 0
+    start_offset: float = 0  # Track position the source started from
     duration: int = 0
     volume: float = 0.5
+    clock: Optional[Any] = None  # Source counting the frames delivered to the voice connection
+
+    @property
+    def current_position(self) -> float:
+        """Position derived from the frames actually delivered"""
+        if self.clock is None:
+            return 0
+        return self.start_offset + self.clock.frames * FRAME_SECONDS
 
 class AudioPlayer:
     def __init__(self, music_bot):
@@ -24,49 +35,85 @@ class AudioPlayer:
         self.voice_clients = {}  # guild_id -> voice_client
         self.statuses = {}  # guild_id -> PlaybackStatus
         self.audio_sources = {}  # guild_id -> audio_source
-        self.progress_tasks = {}  # guild_id -> progress_task
+        self.prewarmed = {}  # guild_id -> (source, PrewarmedSource) opened for the next track
         self.loop = asyncio.get_event_loop()
         
-        self.ffmpeg_options = {
-            'options': '-vn -b:a 192k',
-        }
+        self.ffmpeg_options = '-vn'
+        # Streams are read over HTTP while they play, recover from dropped connections
+        self.stream_before_options = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+
+        # "off" gives every track its own source. "gapless" and "crossfade" keep one
+        # mixing source per guild and decode to PCM so the next track can be joined on
+        self.mixing = os.getenv("PLAYBACK_MIXING", "off")
+        self.crossfade_frames = 0
+        if self.mixing == "crossfade":
+            self.crossfade_frames = int(float(os.getenv("CROSSFADE_SECONDS", "3")) * 50)
+
+        # The next track's decoder is started this long before the current one ends
+        self.prewarm_seconds = float(os.getenv("PREWARM_SECONDS", "5")) + self.crossfade_frames / 50
+        self.prewarm_frames = 25  # Frames decoded ahead of the handoff
+        # Opus files are passed through when their loudness gain would change the
+        # level by less than this, and decoded with the gain applied otherwise
+        self.passthrough_tolerance_db = float(os.getenv("LOUDNESS_PASSTHROUGH_TOLERANCE_DB", "1"))
+
+    @property
+    def mixing_enabled(self) -> bool:
+        return self.mixing != "off"
 
-    async def play(self, voice_client: discord.VoiceClient, filepath: str, duration: int, 
-                  volume: float = 0.5, after_callback: Callable = None) -> bool:
+    async def play(self, voice_client: discord.VoiceClient, source: str, duration: int, 
+                  volume: float = 0.5, after_callback: Callable = None,
+                  codec: Optional[str] = None, gain_db: Optional[float] = None,
+                  on_transition: Optional[Callable[[Any], None]] = None,
+                  start: float = 0, seek_index: Optional[dict] = None) -> bool:
+        """Play a cached file or a remote stream URL.
+
+        codec is the stream's audio codec, if known. gain_db is the track's
+        precomputed loudness gain, applied on top of volume.
+        start plays the track from a position, as seek does.
+        When tracks are mixed, on_transition is called on the event loop with
+        the token of each queued track as it takes over.
+        """
         guild_id = voice_client.guild.id
         try:
             if voice_client.is_playing():
                 voice_client.stop()
 
             self.voice_clients[guild_id] = voice_client
-            self.statuses[guild_id] = PlaybackStatus(
+            status = PlaybackStatus(
                 guild_id=guild_id,
                 is_playing=True,
-                started_at=time.time(),
+                start_offset=start,
                 duration=duration,
                 volume=volume
             )
+            self.statuses[guild_id] = status
 
-            audio_source = discord.PCMVolumeTransformer(
-                discord.FFmpegPCMAudio(
-                    filepath,
-                    **self.ffmpeg_options
-                ),
-                volume=volume
-            )
+            audio_source = self.take_prewarmed(guild_id, source) if not start else None
+            if audio_source is None:
+                audio_source = self._create_source(source, volume, codec, gain_db, pcm=self.mixing_enabled,
+                                                   start=start, seek_index=seek_index)
+            else:
+                logger.debug(f"Using prewarmed decoder for guild {guild_id}")
+            if self.mixing_enabled:
+                audio_source = MixingSource(
+                    audio_source,
+                    duration - start,
+                    crossfade_frames=self.crossfade_frames,
+                    on_transition=lambda token: self._track_transition(guild_id, token, on_transition)
+                )
+            else:
+                audio_source = TrackedSource(audio_source)
+            # The mixing source counts frames per track itself
+            status.clock = audio_source
             self.audio_sources[guild_id] = audio_source
 
-            # Start progress tracking
-            if guild_id in self.progress_tasks:
-                self.progress_tasks[guild_id].cancel()
-            self.progress_tasks[guild_id] = asyncio.create_task(self._track_progress(guild_id))
-
             voice_client.play(
                 audio_source,
                 after=lambda e: self._playback_finished(guild_id, e, after_callback)
             )
             
             logger.info(f"Started playback for guild {guild_id}")
+            self.music_bot.on_playback_changed(guild_id)
             return True
 
         except Exception as e:
@@ -75,65 +122,181 @@ class AudioPlayer:
                 self.statuses[guild_id].is_playing = False
             return False
 
-    async def play_next(self, ctx, song):
-        """Play next song in queue"""
+    def _create_source(self, source: str, volume: float, codec: Optional[str] = None,
+                       gain_db: Optional[float] = None, pcm: bool = False,
+                       start: float = 0, seek_index: Optional[dict] = None) -> discord.AudioSource:
+        """Create the audio source for a file or stream URL.
+
+        With start set, a cached file that has a seek index is read from the
+        indexed offset before start and the remaining frames are skipped.
+        Other sources are seeked by ffmpeg.
+        """
+        is_stream = source.startswith(("http://", "https://"))
+        before_options = self.stream_before_options if is_stream else None
+        passthrough = codec == "opus" if is_stream else source.endswith(".opus")
+
+        pipe, skip_frames = False, 0
+        if start > 0:
+            if seek_index and not is_stream:
+                point_time, offset = find_seek_point(seek_index, start)
+                source = OffsetFileReader(source, seek_index["header_bytes"], offset)
+                pipe, skip_frames = True, max(int((start - point_time) / FRAME_SECONDS), 0)
+            else:
+                before_options = f"{before_options or ''} -ss {start:.3f}".strip()
+
+        volume = self._playback_volume(volume, gain_db)
+        if passthrough and gain_db is not None:
+            # Passthrough plays the file at its stored level
+            passthrough = volume > 0 and abs(20 * math.log10(volume)) <= self.passthrough_tolerance_db
+        if not pcm and passthrough and self.music_bot.queue_downloader.audio_pipeline == "opus":
+            # Opus packets go straight to the voice connection without decoding or re-encoding
+            audio_source = discord.FFmpegOpusAudio(source, codec="copy", pipe=pipe, before_options=before_options)
+        else:
+            # Volume is applied by ffmpeg while decoding rather than per frame in Python
+            audio_source = discord.FFmpegPCMAudio(
+                source,
+                pipe=pipe,
+                before_options=before_options,
+                options=f"{self.ffmpeg_options} -af volume={volume:.4f}"
+            )
+        if pipe:
+            return SkipFramesSource(audio_source, skip_frames, reader=source)
+        return audio_source
+
+    @staticmethod
+    def _playback_volume(volume: float, gain_db: Optional[float]) -> float:
+        """Linear volume with the loudness gain applied, capped at unity so boosted tracks cannot clip"""
+        if gain_db is not None:
+            volume *= 10 ** (gain_db / 20)
+        return min(volume, 1.0)
+
+    async def seek(self, guild_id: int, source: str, position: float,
+                   gain_db: Optional[float] = None, seek_index: Optional[dict] = None) -> bool:
+        """Continue the current track from a position without ending it"""
+        voice_client = self.voice_clients.get(guild_id)
+        status = self.statuses.get(guild_id)
+        if not voice_client or not status or status.clock is None:
+            return False
+
         try:
-            logger.info(f"Attempting to play: {song.title}")
-            
-            if not song.is_downloaded:
-                logger.error(f"Song not downloaded: {song.title}")
-                return False
-
-            def after_callback(error):
-                # Use loop.create_task instead of asyncio.create_task
-                self.loop.create_task(self._handle_song_finished(ctx, error))
-
-            success = await self.play(
-                ctx.voice_client,
-                song.filepath,
-                song.duration,
-                after_callback=after_callback
+            # Spawning ffmpeg happens off the event loop
+            audio_source = await self.loop.run_in_executor(
+                None,
+                lambda: self._create_source(source, status.volume, gain_db=gain_db, pcm=self.mixing_enabled,
+                                            start=position, seek_index=seek_index)
             )
+        except Exception as e:
+            logger.error(f"Error opening seek source for guild {guild_id}: {e}")
+            return False
+
+        current = self.audio_sources.get(guild_id)
+        if current is None or status.clock is not current:
+            # The track ended or changed while the source was opened
+            audio_source.cleanup()
+            return False
 
-            if success:
-                logger.info(f"Now playing: {song.title}")
+        previous_offset = status.start_offset
+        try:
+            status.start_offset = position
+            if isinstance(current, MixingSource):
+                current.replace_current(audio_source, status.duration - position)
             else:
-                logger.error(f"Failed to play: {song.title}")
-            
-            return success
+                # Swapping the source keeps the player running, so the
+                # finished callback does not fire for the replaced source
+                tracked = TrackedSource(audio_source)
+                paused = voice_client.is_paused()
+                voice_client.source = tracked
+                if paused:
+                    voice_client.pause()
+                status.clock = tracked
+                self.audio_sources[guild_id] = tracked
+                current.cleanup()
+        except Exception as e:
+            logger.error(f"Error seeking for guild {guild_id}: {e}")
+            status.start_offset = previous_offset
+            audio_source.cleanup()
+            return False
+
+        logger.info(f"Seeked to {position:.1f}s for guild {guild_id}")
+        self.music_bot.on_playback_changed(guild_id)
+        return True
+
+    async def prewarm(self, guild_id: int, source: str, volume: float = 0.5,
+                      gain_db: Optional[float] = None) -> bool:
+        """Start the decoder for the guild's next track and buffer its first frames"""
+        self.discard_prewarmed(guild_id)
 
+        def _open():
+            audio_source = self._create_source(source, volume, gain_db=gain_db, pcm=self.mixing_enabled)
+            return PrewarmedSource(audio_source, self.prewarm_frames)
+
+        # Spawning ffmpeg happens off the event loop
+        future = self.loop.run_in_executor(None, _open)
+        try:
+            audio_source = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(lambda f: f.exception() is None and f.result().cleanup())
+            raise
         except Exception as e:
-            logger.error(f"Error in play_next: {e}")
+            logger.error(f"Error prewarming next track for guild {guild_id}: {e}")
             return False
 
-    async def _handle_song_finished(self, ctx, error):
-        """Handle song finish and play next song"""
-        if error:
-            logger.error(f"Playback error: {error}")
-        
+        self.discard_prewarmed(guild_id)
+        self.prewarmed[guild_id] = (source, audio_source)
+        logger.debug(f"Prewarmed next track for guild {guild_id}: {source}")
+        return True
+
+    def take_prewarmed(self, guild_id: int, source: str) -> Optional[discord.AudioSource]:
+        """Take the prewarmed decoder if it was opened for this source"""
+        prewarmed = self.prewarmed.pop(guild_id, None)
+        if prewarmed is None:
+            return None
+        prewarmed_source, audio_source = prewarmed
+        if prewarmed_source != source:
+            audio_source.cleanup()
+            return None
+        return audio_source
+
+    def discard_prewarmed(self, guild_id: int) -> None:
+        """Stop a prewarmed decoder that is no longer needed"""
+        prewarmed = self.prewarmed.pop(guild_id, None)
+        if prewarmed:
+            prewarmed[1].cleanup()
+
+    def queue_next(self, guild_id: int, source: str, duration: int, token: Any,
+                   volume: float = 0.5, gain_db: Optional[float] = None) -> bool:
+        """Hand the next track to the guild's mixing source"""
+        audio_source = self.audio_sources.get(guild_id)
+        if not isinstance(audio_source, MixingSource):
+            return False
         try:
-            # Get the queue manager for the guild
-            guild_id = ctx.guild.id
-            queue_manager = self.music_bot.get_queue_manager(guild_id)
-            
-            # Clear current song and mark as not playing
-            await queue_manager.clear_current()
-                
-            # Try to play next song if there is one
-            next_song = await queue_manager.get_next()
-            if next_song:
-                await queue_manager.set_current(next_song)
-                
-                if not next_song.is_downloaded:
-                    success = await self.music_bot.queue_downloader.download_song(next_song)
-                    if not success:
-                        logger.error(f"Failed to download next song: {next_song.title}")
-                        await queue_manager.clear_current()
-                        return
-                        
-                await self.play_next(ctx, next_song)
+            next_source = self.take_prewarmed(guild_id, source)
+            if next_source is None:
+                next_source = self._create_source(source, volume, gain_db=gain_db, pcm=True)
+            audio_source.set_next(next_source, duration, token)
+            return True
         except Exception as e:
-            logger.error(f"Error handling song finish: {str(e)}", exc_info=True)
+            logger.error(f"Error opening next track for guild {guild_id}: {e}")
+            return False
+
+    def clear_next(self, guild_id: int) -> None:
+        """Drop the track opened with queue_next"""
+        audio_source = self.audio_sources.get(guild_id)
+        if isinstance(audio_source, MixingSource):
+            audio_source.clear_next()
+
+    def _track_transition(self, guild_id: int, token: Any, callback: Optional[Callable[[Any], None]]):
+        """Called on the voice thread when the mixing source moves to the next track"""
+        if callback:
+            self.loop.call_soon_threadsafe(callback, token)
+
+    def track_changed(self, guild_id: int, duration: int) -> None:
+        """Reset the playback status after the mixing source moved to the next track"""
+        if guild_id in self.statuses:
+            status = self.statuses[guild_id]
+            status.start_offset = 0
+            status.duration = duration
+        self.music_bot.on_playback_changed(guild_id)
 
     def _playback_finished(self, guild_id: int, error, callback: Optional[Callable] = None):
         """Handle playback finish/cleanup for specific guild"""
@@ -142,10 +305,8 @@ class AudioPlayer:
 
         if guild_id in self.statuses:
             self.statuses[guild_id].is_playing = False
-            self.statuses[guild_id].current_position = 0
-
-        if guild_id in self.progress_tasks:
-            self.progress_tasks[guild_id].cancel()
+            self.statuses[guild_id].clock = None
+        self.loop.call_soon_threadsafe(self.music_bot.on_playback_changed, guild_id)
 
         if callback and callable(callback):
             asyncio.run_coroutine_threadsafe(
@@ -165,18 +326,6 @@ class AudioPlayer:
         except Exception as e:
             logger.error(f"Callback error: {str(e)}", exc_info=True)
 
-    async def _track_progress(self, guild_id: int):
-        """Track playback progress for specific guild"""
-        try:
-            while guild_id in self.statuses and self.statuses[guild_id].is_playing:
-                status = self.statuses[guild_id]
-                status.current_position = time.time() - status.started_at
-                await asyncio.sleep(0.1)
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            logger.error(f"Error tracking progress for guild {guild_id}: {e}")
-
     def pause(self, guild_id: int):
         """Pause playback for specific guild"""
         if guild_id in self.voice_clients and self.voice_clients[guild_id].is_playing():
@@ -184,16 +333,16 @@ class AudioPlayer:
             if guild_id in self.statuses:
                 self.statuses[guild_id].is_playing = False
             logger.info(f"Paused playback for guild {guild_id}")
+            self.music_bot.on_playback_changed(guild_id)
 
     def resume(self, guild_id: int):
         """Resume playback for specific guild"""
         if guild_id in self.voice_clients and self.voice_clients[guild_id].is_paused():
             self.voice_clients[guild_id].resume()
             if guild_id in self.statuses:
-                status = self.statuses[guild_id]
-                status.is_playing = True
-                status.started_at = time.time() - status.current_position
+                self.statuses[guild_id].is_playing = True
             logger.info(f"Resumed playback for guild {guild_id}")
+            self.music_bot.on_playback_changed(guild_id)
 
     def stop(self, guild_id: int):
         """Stop playback for specific guild"""
@@ -207,19 +356,23 @@ class AudioPlayer:
 
         if guild_id in self.statuses:
             self.statuses[guild_id].is_playing = False
-            self.statuses[guild_id].current_position = 0
+            self.statuses[guild_id].clock = None
 
-        if guild_id in self.progress_tasks:
-            self.progress_tasks[guild_id].cancel()
+        self.discard_prewarmed(guild_id)
+        self.music_bot.on_playback_changed(guild_id)
             
         # Cleanup
         self.voice_clients.pop(guild_id, None)
         self.audio_sources.pop(guild_id, None)
-        self.progress_tasks.pop(guild_id, None)
+
+    def release(self, guild_id: int) -> None:
+        """Drop everything held for a guild that is no longer in use"""
+        self.stop(guild_id)
+        self.statuses.pop(guild_id, None)
 
     def get_progress(self, guild_id: int) -> tuple[float, int]:
         """Get current playback position and duration for specific guild"""
-        if guild_id not in self.statuses or not self.statuses[guild_id].is_playing:
+        if guild_id not in self.statuses or self.statuses[guild_id].clock is None:
             return 0, 0
         status = self.statuses[guild_id]
         return status.current_position, status.duration
@@ -0,0 +1,110 @@
+import logging
+import threading
+from collections import deque
+import discord
+
+logger = logging.getLogger(__name__)
+
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+class TrackedSource(discord.AudioSource):
+    """Counts the frames handed to the voice connection.
+
+    The playback position is derived from this count when it is read, so
+    it stops with pause and stalls, and nothing runs in the background.
+    """
+
+    def __init__(self, source: discord.AudioSource):
+        self.source = source
+        self.frames = 0
+
+    @property
+    def position(self) -> float:
+        return self.frames * FRAME_SECONDS
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def read(self) -> bytes:
+        data = self.source.read()
+        if data:
+            self.frames += 1
+        return data
+
+    def cleanup(self) -> None:
+        self.source.cleanup()
+
+class SkipFramesSource(discord.AudioSource):
+    """Drops the first frames of a source.
+
+    A seek starts decoding at the indexed offset before the target, the
+    frames up to the target are read and thrown away on the first read().
+    The reader piped into ffmpeg is closed with the source, since
+    discord.py leaves it open.
+    """
+
+    def __init__(self, source: discord.AudioSource, frames: int, reader=None):
+        self.source = source
+        self._skip = frames
+        self._reader = reader
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def read(self) -> bytes:
+        while self._skip > 0:
+            self._skip -= 1
+            if not self.source.read():
+                return b''
+        return self.source.read()
+
+    def cleanup(self) -> None:
+        self.source.cleanup()
+        if self._reader is not None:
+            self._reader.close()
+
+class PrewarmedSource(discord.AudioSource):
+    """Wraps a source and decodes its first frames on a background thread.
+
+    Spawning ffmpeg and probing the input happens when the wrapper is
+    created, so the first read() after a track change only pops a buffered
+    frame.
+    """
+
+    def __init__(self, source: discord.AudioSource, frames: int = 25):
+        self.source = source
+        self._buffer = deque()
+        self._ready = threading.Event()
+        self._closed = False
+        threading.Thread(target=self._prefill, args=(frames,), daemon=True).start()
+
+    def _prefill(self, frames: int) -> None:
+        try:
+            for _ in range(frames):
+                if self._closed:
+                    break
+                data = self.source.read()
+                if not data:
+                    break
+                self._buffer.append(data)
+        except Exception as e:
+            logger.error(f"Error prewarming audio source: {e}")
+        finally:
+            self._ready.set()
+
+    @property
+    def buffered_frames(self) -> int:
+        return len(self._buffer)
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def read(self) -> bytes:
+        self._ready.wait()
+        if self._buffer:
+            return self._buffer.popleft()
+        return self.source.read()
+
+    def cleanup(self) -> None:
+        self._closed = True
+        self.source.cleanup()
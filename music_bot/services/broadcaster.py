@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_FRAME = b": keepalive\n\n"
+
+def encode_event(data: Dict, event: Optional[str] = None, event_id: Optional[str] = None) -> bytes:
+    """Serialize an SSE event"""
+    frame = f"data: {json.dumps(data)}\n\n"
+    if event_id is not None:
+        frame = f"id: {event_id}\n{frame}"
+    if event:
+        frame = f"event: {event}\n{frame}"
+    return frame.encode()
+
+class Subscription:
+    """One SSE client of a guild topic.
+
+    Frames are queued by the broadcaster and written out by the client's
+    response. When the queue is full a snapshot topic replaces everything
+    still queued with the newest frame, other topics drop the client.
+    """
+
+    def __init__(self, broadcaster: "Broadcaster", channel: "_Channel", max_queued: int):
+        self.broadcaster = broadcaster
+        self.channel = channel
+        self.max_queued = max_queued
+        self.closed = False
+        self._frames = deque()
+        self._wakeup = asyncio.Event()
+
+    def push(self, frame: bytes) -> bool:
+        """Queue a frame, False if the client has fallen too far behind"""
+        if self.closed:
+            return False
+        if len(self._frames) >= self.max_queued:
+            if not self.channel.coalesce:
+                return False
+            self._frames.clear()
+            self.broadcaster.coalesced += 1
+        self._frames.append(frame)
+        self._wakeup.set()
+        return True
+
+    def extend(self, frames: List[bytes]) -> None:
+        """Queue the first frames of a new subscriber, regardless of the queue limit"""
+        self._frames.extend(frames)
+        self._wakeup.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._wakeup.set()
+
+    async def frames(self, heartbeat: float):
+        """Yield queued frames, with a heartbeat comment when idle"""
+        try:
+            while not self.closed:
+                if not self._frames:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), heartbeat)
+                    except asyncio.TimeoutError:
+                        yield HEARTBEAT_FRAME
+                        continue
+                while self._frames:
+                    self.broadcaster.frames_sent += 1
+                    yield self._frames.popleft()
+        finally:
+            self.broadcaster.unsubscribe(self)
+
+class _Channel:
+    """Subscribers of one topic in one guild"""
+
+    def __init__(self, topic: str, guild_id: int, coalesce: bool, max_queued: int):
+        self.topic = topic
+        self.guild_id = guild_id
+        self.coalesce = coalesce
+        self.max_queued = max_queued
+        self.subscribers: Set[Subscription] = set()
+        self.last_frame: Optional[bytes] = None
+        self.flush_pending = False
+        self.ticker: Optional[asyncio.Task] = None
+
+class Broadcaster:
+    """Per-guild pub/sub for the SSE streams.
+
+    Snapshot topics have a builder. State changes call notify(), which
+    schedules one rebuild of the topic's snapshot. Topics without a builder
+    carry events passed to publish(), e.g. deltas, which clients must not
+    miss. Either way each frame is serialized once and the same bytes are
+    queued for every subscriber. Topics without subscribers cost a
+    dictionary lookup.
+    """
+
+    def __init__(self):
+        self.max_subscribers = int(os.getenv("SSE_MAX_SUBSCRIBERS_PER_GUILD", "100"))
+        self.client_queue_size = int(os.getenv("SSE_CLIENT_QUEUE_SIZE", "8"))
+        self.heartbeat_interval = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+        self._topics: Dict[str, Tuple[Optional[Callable[[int], Awaitable[Optional[Dict]]]], Optional[float], int]] = {}
+        self._channels: Dict[Tuple[str, int], _Channel] = {}
+        self.frames_sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def register(self, topic: str, builder: Optional[Callable[[int], Awaitable[Optional[Dict]]]] = None,
+                 tick_interval: Optional[float] = None, max_queued: Optional[int] = None) -> None:
+        """Set up a topic, a snapshot topic if it has a builder.
+
+        With tick_interval the snapshot is also rebuilt periodically while
+        the guild has subscribers, for state that changes continuously.
+        """
+        self._topics[topic] = (builder, tick_interval, max_queued or self.client_queue_size)
+
+    async def subscribe(self, topic: str, guild_id: int,
+                        initial: Optional[List[bytes]] = None) -> Optional[Subscription]:
+        """Subscribe to a guild topic, None if the guild is at its subscriber cap.
+
+        initial replaces the latest snapshot as the first frames sent. It
+        must be built without awaiting in between, so no published event
+        is missed.
+        """
+        builder, tick_interval, max_queued = self._topics[topic]
+        key = (topic, guild_id)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = _Channel(topic, guild_id, builder is not None, max_queued)
+        if len(channel.subscribers) >= self.max_subscribers:
+            self.rejected += 1
+            logger.warning(f"Rejected {topic} subscriber for guild {guild_id}, limit of {self.max_subscribers} reached")
+            return None
+
+        subscription = Subscription(self, channel, channel.max_queued)
+        channel.subscribers.add(subscription)
+        if initial is not None:
+            subscription.extend(initial)
+        elif channel.last_frame is not None:
+            subscription.push(channel.last_frame)
+        elif builder is not None:
+            # Publishes the first snapshot to the new subscriber as well
+            await self._flush(channel)
+        if tick_interval and channel.ticker is None:
+            channel.ticker = asyncio.create_task(self._tick(channel, tick_interval))
+        logger.debug(f"New {topic} subscriber for guild {guild_id} ({len(channel.subscribers)} total)")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.closed = True
+        channel = subscription.channel
+        channel.subscribers.discard(subscription)
+        if not channel.subscribers and self._channels.get((channel.topic, channel.guild_id)) is channel:
+            del self._channels[(channel.topic, channel.guild_id)]
+            if channel.ticker:
+                channel.ticker.cancel()
+
+    def notify(self, topic: str, guild_id: int) -> None:
+        """Schedule a rebuild of a guild topic, coalescing repeated calls"""
+        channel = self._channels.get((topic, guild_id))
+        if channel is None or channel.flush_pending:
+            return
+        channel.flush_pending = True
+        asyncio.create_task(self._flush(channel))
+
+    def publish(self, topic: str, guild_id: int, data: Dict,
+                event: Optional[str] = None, event_id: Optional[str] = None) -> None:
+        """Send an event to a guild topic's subscribers"""
+        channel = self._channels.get((topic, guild_id))
+        if channel is None:
+            return
+        self._publish(channel, encode_event(data, event, event_id))
+
+    async def _flush(self, channel: _Channel) -> None:
+        channel.flush_pending = False
+        builder = self._topics[channel.topic][0]
+        try:
+            data = await builder(channel.guild_id)
+        except Exception as e:
+            logger.error(f"Error building {channel.topic} snapshot for guild {channel.guild_id}: {e}", exc_info=True)
+            return
+        if data is None:
+            return
+        frame = encode_event(data)
+        if frame == channel.last_frame:
+            return
+        channel.last_frame = frame
+        self._publish(channel, frame)
+
+    def _publish(self, channel: _Channel, frame: bytes) -> None:
+        for subscription in list(channel.subscribers):
+            if not subscription.push(frame):
+                self.dropped += 1
+                logger.info(f"Dropping slow {channel.topic} subscriber for guild {channel.guild_id}")
+                subscription.close()
+                self.unsubscribe(subscription)
+
+    async def _tick(self, channel: _Channel, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.notify(channel.topic, channel.guild_id)
+
+    def has_subscribers(self, guild_id: int) -> bool:
+        return any(key[1] == guild_id for key in self._channels)
+
+    def channel_count(self) -> int:
+        return len(self._channels)
+
+    def get_stats(self) -> Dict:
+        """Get subscriber counts and fan-out counters"""
+        subscribers = {}
+        for (topic, guild_id), channel in self._channels.items():
+            subscribers.setdefault(topic, {})[str(guild_id)] = len(channel.subscribers)
+        return {
+            "subscribers": subscribers,
+            "frames_sent": self.frames_sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "rejected": self.rejected
+        }
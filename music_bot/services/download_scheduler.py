@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+from models.song import Song
+
+logger = logging.getLogger(__name__)
+
+class DownloadPriority(IntEnum):
+    """Download priorities, lower values are served first"""
+    NOW = 0  # Needed for playback right now
+    NEXT = 1  # Next song in the queue
+    PREFETCH = 2  # Deeper prefetch
+
+@dataclass
+class DownloadJob:
+    """A pending or running download shared by every guild that wants the song"""
+    song: Song
+    priority: DownloadPriority
+    owner_guild_id: int
+    future: asyncio.Future
+    guild_ids: Set[int] = field(default_factory=set)
+    songs: List[Song] = field(default_factory=list)
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+
+class DownloadScheduler:
+    """Global download scheduler.
+
+    Jobs are ranked by priority and served round-robin across guilds within a
+    priority level. Workers sleep until a job is submitted; there is no polling.
+    """
+
+    def __init__(self, download_fn: Callable[[Song], Awaitable[bool]],
+                 max_concurrent: int = 3, max_per_guild: int = 2):
+        self.download_fn = download_fn
+        self.max_concurrent = max_concurrent
+        self.max_per_guild = max_per_guild
+
+        # priority -> guild_id -> pending jobs, guilds rotate for fairness
+        self._pending: Dict[DownloadPriority, "OrderedDict[int, Deque[DownloadJob]]"] = {
+            priority: OrderedDict() for priority in DownloadPriority
+        }
+        self._jobs: Dict[str, DownloadJob] = {}  # video_id -> pending or running job
+        self._active_per_guild: Dict[int, int] = {}
+        self._active = 0
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+
+        self._wait_times: Deque[float] = deque(maxlen=256)
+        self._completed = 0
+        self._failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        """Start the worker tasks"""
+        if self._workers:
+            return
+        for index in range(self.max_concurrent):
+            self._workers.append(asyncio.create_task(self._worker(index)))
+        logger.info(f"Started download scheduler with {self.max_concurrent} workers")
+
+    async def stop(self) -> None:
+        """Stop the workers and fail every pending job"""
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers.clear()
+        for job in list(self._jobs.values()):
+            if not job.future.done():
+                job.future.cancel()
+        self._jobs.clear()
+        for level in self._pending.values():
+            level.clear()
+        logger.info("Stopped download scheduler")
+
+    def submit(self, song: Song, guild_id: int, priority: DownloadPriority) -> asyncio.Future:
+        """Queue a song for download, joining an existing job for the same video"""
+        job = self._jobs.get(song.video_id)
+        if job:
+            job.guild_ids.add(guild_id)
+            if song is not job.song and song not in job.songs:
+                job.songs.append(song)
+            if job.started_at is None and priority < job.priority:
+                self._remove_pending(job)
+                job.priority = priority
+                job.owner_guild_id = guild_id
+                self._add_pending(job)
+            return job.future
+
+        job = DownloadJob(
+            song=song,
+            priority=priority,
+            owner_guild_id=guild_id,
+            future=asyncio.get_running_loop().create_future(),
+            guild_ids={guild_id}
+        )
+        self._jobs[song.video_id] = job
+        self._add_pending(job)
+        logger.debug(f"Queued {priority.name} download for guild {guild_id}: {song.title}")
+        return job.future
+
+    def retain(self, guild_id: int, video_ids: Set[str]) -> None:
+        """Drop the guild's pending prefetch jobs for songs it no longer needs"""
+        for job in list(self._jobs.values()):
+            if (job.started_at is not None or guild_id not in job.guild_ids
+                    or job.priority == DownloadPriority.NOW or job.song.video_id in video_ids):
+                continue
+            job.guild_ids.discard(guild_id)
+            if not job.guild_ids:
+                self._remove_pending(job)
+                del self._jobs[job.song.video_id]
+                job.future.cancel()
+
+    def get_stats(self) -> Dict:
+        """Get queue depth, concurrency and wait time statistics"""
+        waits = list(self._wait_times)
+        return {
+            "queue_depth": sum(len(jobs) for level in self._pending.values() for jobs in level.values()),
+            "queue_depth_by_priority": {
+                priority.name.lower(): sum(len(jobs) for jobs in level.values())
+                for priority, level in self._pending.items()
+            },
+            "active": self._active,
+            "max_concurrent": self.max_concurrent,
+            "completed": self._completed,
+            "failed": self._failed,
+            "avg_wait": sum(waits) / len(waits) if waits else 0,
+            "max_wait": max(waits) if waits else 0
+        }
+
+    def _add_pending(self, job: DownloadJob) -> None:
+        level = self._pending[job.priority]
+        level.setdefault(job.owner_guild_id, deque()).append(job)
+        self._wakeup.set()
+
+    def _remove_pending(self, job: DownloadJob) -> None:
+        level = self._pending[job.priority]
+        jobs = level.get(job.owner_guild_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del level[job.owner_guild_id]
+
+    def _pop_next(self) -> Optional[DownloadJob]:
+        """Take the highest priority job, rotating between guilds"""
+        for priority, level in self._pending.items():
+            for guild_id in list(level.keys()):
+                if (priority != DownloadPriority.NOW
+                        and self._active_per_guild.get(guild_id, 0) >= self.max_per_guild):
+                    continue
+                jobs = level[guild_id]
+                job = jobs.popleft()
+                if jobs:
+                    level.move_to_end(guild_id)
+                else:
+                    del level[guild_id]
+                return job
+        return None
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = self._pop_next()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._run(job)
+
+    async def _run(self, job: DownloadJob) -> None:
+        guild_id = job.owner_guild_id
+        job.started_at = time.monotonic()
+        self._wait_times.append(job.started_at - job.submitted_at)
+        self._active += 1
+        self._active_per_guild[guild_id] = self._active_per_guild.get(guild_id, 0) + 1
+        try:
+            success = await self.download_fn(job.song)
+            if success:
+                for song in job.songs:
+                    song.set_downloaded(job.song.filepath)
+                self._completed += 1
+            else:
+                self._failed += 1
+            if not job.future.done():
+                job.future.set_result(success)
+        except asyncio.CancelledError:
+            if not job.future.done():
+                job.future.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Download job failed for {job.song.title}: {e}", exc_info=True)
+            self._failed += 1
+            if not job.future.done():
+                job.future.set_result(False)
+        finally:
+            self._active -= 1
+            self._active_per_guild[guild_id] -= 1
+            if not self._active_per_guild[guild_id]:
+                del self._active_per_guild[guild_id]
+            self._jobs.pop(job.song.video_id, None)
+            # A per-guild slot was freed, let idle workers look again
+            self._wakeup.set()
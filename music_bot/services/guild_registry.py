@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set
+from services.broadcaster import Broadcaster, encode_event
+from services.http_client import DiscordHTTPClient
+
+logger = logging.getLogger(__name__)
+
+class GuildRegistry:
+    """The guilds the bot is in, kept current by gateway events.
+
+    Until the gateway is ready the list is fetched over REST and held for
+    a short time. version is bumped on every membership change so caches
+    derived from the list can tell when they are stale.
+
+    A shard coordinator has no gateway connection of its own. Its registry
+    is fed the guilds of each worker process, and is ready once every
+    worker has reported. Workers publish their changes on the "guilds"
+    topic of a broadcaster for the coordinator to follow.
+    """
+
+    REST_TTL = 30  # Seconds a REST result is reused before the gateway is ready
+
+    def __init__(self, http_client: DiscordHTTPClient, token: str):
+        self.http_client = http_client
+        self.token = token
+        self.guilds: Dict[str, Dict] = {}  # guild id -> {"id", "name", "icon"}
+        self.version = 0
+        self.ready = False
+        self._rest_fetched_at = 0.0
+        self._rest_fetch: Optional[asyncio.Future] = None
+        self._sources: Dict[int, Set[str]] = {}  # worker -> guild ids it reported
+        self.broadcaster: Optional[Broadcaster] = None
+
+    @staticmethod
+    def _entry(guild) -> Dict:
+        return {
+            "id": str(guild.id),
+            "name": guild.name,
+            "icon": guild.icon.key if guild.icon else None
+        }
+
+    def load(self, guilds) -> None:
+        """Replace the list with the guilds the gateway reported"""
+        self.guilds = {str(guild.id): self._entry(guild) for guild in guilds}
+        self.ready = True
+        self.version += 1
+        logger.info(f"Guild registry loaded {len(self.guilds)} guilds from the gateway")
+        self._publish("snapshot", list(self.guilds.values()))
+
+    def add(self, guild) -> None:
+        """Record a guild the bot joined or one whose details changed"""
+        entry = self.guilds[str(guild.id)] = self._entry(guild)
+        self.version += 1
+        self._publish("add", entry)
+
+    def remove(self, guild) -> None:
+        """Forget a guild the bot left"""
+        if self.guilds.pop(str(guild.id), None):
+            self.version += 1
+            self._publish("remove", {"id": str(guild.id)})
+
+    def _publish(self, event: str, data) -> None:
+        if self.broadcaster:
+            self.broadcaster.publish("guilds", 0, data, event=event)
+
+    def snapshot_frames(self) -> List[bytes]:
+        """First frames for a new follower, the list if the gateway has reported it"""
+        return [encode_event(list(self.guilds.values()), event="snapshot")] if self.ready else []
+
+    def load_source(self, source: int, entries: List[Dict], sources: int) -> None:
+        """Replace the guilds one of sources worker processes reported"""
+        for guild_id in self._sources.pop(source, set()):
+            self.guilds.pop(guild_id, None)
+        self._sources[source] = {entry["id"] for entry in entries}
+        self.guilds.update({entry["id"]: entry for entry in entries})
+        self.ready = self.ready or len(self._sources) >= sources
+        self.version += 1
+        logger.info(f"Guild registry loaded {len(entries)} guilds from worker {source}")
+
+    def add_entry(self, source: int, entry: Dict) -> None:
+        """Record a guild a worker process joined or updated"""
+        self.guilds[entry["id"]] = entry
+        self._sources.setdefault(source, set()).add(entry["id"])
+        self.version += 1
+
+    def remove_entry(self, source: int, guild_id: str) -> None:
+        """Forget a guild a worker process left"""
+        self._sources.get(source, set()).discard(guild_id)
+        if self.guilds.pop(guild_id, None):
+            self.version += 1
+
+    async def get_guilds(self) -> List[Dict]:
+        """Get the bot's guilds"""
+        if not self.ready and time.monotonic() - self._rest_fetched_at > self.REST_TTL:
+            await self._fetch()
+        return list(self.guilds.values())
+
+    async def _fetch(self) -> None:
+        # Concurrent callers share one request
+        if self._rest_fetch is None or self._rest_fetch.done():
+            self._rest_fetch = asyncio.ensure_future(
+                self.http_client.get("/users/@me/guilds", bot_token=self.token)
+            )
+        guilds = await asyncio.shield(self._rest_fetch)
+        if self.ready:
+            return
+        self.guilds = {
+            guild["id"]: {"id": guild["id"], "name": guild["name"], "icon": guild.get("icon")}
+            for guild in guilds
+        }
+        self._rest_fetched_at = time.monotonic()
+        self.version += 1
+        logger.info(f"Guild registry fetched {len(self.guilds)} guilds over REST")
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DISCORD_API_URL = "https://discord.com/api/v10"
+
+class DiscordHTTPError(Exception):
+    """A Discord REST call failed"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Discord API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+class _Bucket:
+    """Rate limit state reported by Discord for one bucket"""
+
+    def __init__(self):
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait for a free request in the bucket and reserve it"""
+        async with self.lock:
+            if self.remaining is not None and time.monotonic() >= self.reset_at:
+                self.remaining = None
+            if self.remaining == 0:
+                delay = self.reset_at - time.monotonic()
+                if delay > 0:
+                    logger.info(f"Rate limit bucket exhausted, waiting {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                self.remaining = None
+            if self.remaining is not None:
+                self.remaining -= 1
+
+    def update(self, headers) -> None:
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if remaining is not None:
+            # Responses to concurrent requests can arrive out of order, the
+            # lowest count within a window is the current one
+            remaining = int(remaining)
+            self.remaining = remaining if self.remaining is None else min(self.remaining, remaining)
+        if reset_after is not None:
+            self.reset_at = time.monotonic() + float(reset_after)
+
+class DiscordHTTPClient:
+    """Shared async client for Discord REST calls.
+
+    One pooled keep-alive session serves every caller. Requests wait for
+    the rate limit buckets Discord reports and are retried after a 429.
+    """
+
+    def __init__(self, base_url: str = DISCORD_API_URL):
+        self.base_url = base_url
+        self.timeout = aiohttp.ClientTimeout(total=float(os.getenv("HTTP_TIMEOUT_SECONDS", "10")))
+        self.pool_size = int(os.getenv("HTTP_POOL_SIZE", "20"))
+        self.max_retries = 3
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._route_buckets: Dict[str, str] = {}  # route key -> bucket id reported by Discord
+        self._buckets: Dict[str, _Bucket] = {}
+        self._global_reset_at = 0.0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created on first use so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30),
+                timeout=self.timeout
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def _get_bucket(self, route_key: str) -> _Bucket:
+        bucket_id = self._route_buckets.get(route_key, route_key)
+        if bucket_id not in self._buckets:
+            self._buckets[bucket_id] = _Bucket()
+        return self._buckets[bucket_id]
+
+    async def request(self, method: str, path: str, *, bot_token: Optional[str] = None,
+                      access_token: Optional[str] = None, **kwargs) -> Any:
+        """Send a request to the Discord API and return the decoded JSON body"""
+        headers = kwargs.pop("headers", {})
+        if bot_token:
+            headers["Authorization"] = f"Bot {bot_token}"
+        elif access_token:
+            headers["Authorization"] = f"Bearer {access_token}"
+        # Buckets are per route and per token
+        identity = hashlib.sha1(headers.get("Authorization", "").encode()).hexdigest()[:12]
+        route_key = f"{method} {path} {identity}"
+
+        for attempt in range(self.max_retries + 1):
+            global_delay = self._global_reset_at - time.monotonic()
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+            # The bucket lock is only held to reserve a request, not for the round trip
+            bucket = self._get_bucket(route_key)
+            await bucket.acquire()
+
+            async with self.session.request(method, f"{self.base_url}{path}", headers=headers, **kwargs) as response:
+                bucket_id = response.headers.get("X-RateLimit-Bucket")
+                if bucket_id and self._route_buckets.get(route_key) != bucket_id:
+                    # Routes that share a bucket share its state from now on
+                    self._route_buckets[route_key] = bucket_id
+                    bucket = self._buckets.setdefault(bucket_id, bucket)
+                bucket.update(response.headers)
+
+                if response.status == 429:
+                    body = await response.json(content_type=None)
+                    retry_after = float(body.get("retry_after", response.headers.get("Retry-After", 1)))
+                    if body.get("global"):
+                        self._global_reset_at = time.monotonic() + retry_after
+                    logger.warning(f"Rate limited on {method} {path}, retrying in {retry_after:.2f}s")
+                    if attempt == self.max_retries:
+                        raise DiscordHTTPError(429, "rate limited")
+                    bucket.remaining, bucket.reset_at = 0, time.monotonic() + retry_after
+                    continue
+
+                if response.status >= 400:
+                    raise DiscordHTTPError(response.status, await response.text())
+                if response.status == 204:
+                    return None
+                return await response.json(content_type=None)
+
+    async def get(self, path: str, **kwargs) -> Any:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> Any:
+        return await self.request("POST", path, **kwargs)
@@ -0,0 +1,32 @@
+import logging
+import re
+import subprocess
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_INTEGRATED_LOUDNESS = re.compile(r"I:\s+(-?\d+(?:\.\d+)?) LUFS")
+
+def measure_loudness(filepath: str) -> Optional[float]:
+    """Measure the integrated EBU R128 loudness of a file in LUFS"""
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-nostats", "-i", filepath,
+             "-vn", "-af", "ebur128=framelog=quiet", "-f", "null", "-"],
+            capture_output=True,
+            text=True,
+            timeout=600
+        )
+        # The last match is the summary printed when the filter closes
+        matches = _INTEGRATED_LOUDNESS.findall(result.stderr)
+        if not matches:
+            logger.warning(f"No loudness measurement for {filepath}")
+            return None
+        return float(matches[-1])
+    except Exception as e:
+        logger.error(f"Error measuring loudness of {filepath}: {e}")
+        return None
+
+def compute_gain(loudness: float, target: float, min_gain: float = -20.0, max_gain: float = 10.0) -> float:
+    """Gain in dB that brings a track to the target loudness"""
+    return max(min_gain, min(max_gain, target - loudness))
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class TrackMetadata:
+    """What is known about a video, whoever looked it up"""
+    video_id: str
+    title: str = ""
+    duration: int = 0  # Seconds, from the cached file when it has been probed
+    thumbnail: str = ""
+    webpage_url: str = ""
+    available: bool = True
+    codec: Optional[str] = None  # Probed from the cached file
+    bitrate: Optional[int] = None  # Bits per second of the cached file
+    duration_probed: bool = False  # Whether duration was measured on the file
+    refreshed_at: float = 0.0  # When title/duration were last fetched from YouTube
+
+    def to_song_data(self) -> Dict:
+        return {
+            'id': self.video_id,
+            'title': self.title,
+            'duration': self.duration,
+            'thumbnail': self.thumbnail,
+            'webpage_url': self.webpage_url or f"https://www.youtube.com/watch?v={self.video_id}"
+        }
+
+COLUMNS = [field.name for field in fields(TrackMetadata)]
+
+class MetadataStore:
+    """Track metadata keyed by video id, persisted in SQLite.
+
+    Rows are read into memory at startup so lookups never touch the
+    database. Writes go to SQLite on a single background thread.
+    """
+
+    def __init__(self, db_path: str, refresh_after: float):
+        self.db_path = db_path
+        self.refresh_after = refresh_after
+        self.tracks: Dict[str, TrackMetadata] = {}
+        self.ready = False
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metadata-db")
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self) -> None:
+        """Open the database and read all rows in the background"""
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(self._writer, self._open)
+            for row in rows:
+                track = TrackMetadata(*row)
+                track.available = bool(track.available)
+                track.duration_probed = bool(track.duration_probed)
+                # Rows written while loading are newer
+                self.tracks.setdefault(track.video_id, track)
+            logger.info(f"Loaded metadata for {len(rows)} tracks from {self.db_path}")
+        except Exception as e:
+            logger.error(f"Failed to load track metadata from {self.db_path}: {e}", exc_info=True)
+        finally:
+            self.ready = True
+
+    def _open(self):
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "video_id TEXT PRIMARY KEY, title TEXT, duration INTEGER, thumbnail TEXT, webpage_url TEXT, "
+            "available INTEGER, codec TEXT, bitrate INTEGER, duration_probed INTEGER, refreshed_at REAL)"
+        )
+        self._db.commit()
+        return self._db.execute(f"SELECT {', '.join(COLUMNS)} FROM tracks").fetchall()
+
+    def get(self, video_id: str) -> Optional[TrackMetadata]:
+        """Get the metadata of an available video"""
+        track = self.tracks.get(video_id)
+        if track is None or not track.available or not track.title:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return track
+
+    def is_stale(self, track: TrackMetadata) -> bool:
+        return time.time() - track.refreshed_at > self.refresh_after
+
+    def get_duration(self, video_id: str, default: int = 0) -> int:
+        """The best known duration of a video"""
+        track = self.tracks.get(video_id)
+        return track.duration if track and track.duration else default
+
+    def update(self, video_id: str, **values) -> TrackMetadata:
+        """Merge new values into a video's metadata"""
+        track = self.tracks.get(video_id)
+        if track is None:
+            track = self.tracks[video_id] = TrackMetadata(video_id)
+        if track.duration_probed and "duration" in values and not values.get("duration_probed"):
+            # A duration measured on the file beats the one YouTube reports
+            values.pop("duration")
+        for key, value in values.items():
+            if value is not None:
+                setattr(track, key, value)
+        self._writer.submit(self._write, asdict(track))
+        return track
+
+    def record_song(self, song_data: Dict) -> TrackMetadata:
+        """Store the details fetched from YouTube for a song"""
+        return self.update(
+            song_data['id'],
+            title=song_data['title'],
+            duration=int(song_data.get('duration') or 0) or None,
+            thumbnail=song_data.get('thumbnail'),
+            webpage_url=song_data.get('webpage_url'),
+            available=True,
+            refreshed_at=time.time()
+        )
+
+    def _write(self, row: Dict) -> None:
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO tracks ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [row[column] for column in COLUMNS]
+            )
+            self._db.commit()
+        except Exception as e:
+            logger.error(f"Failed to write metadata for {row['video_id']}: {e}")
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "tracks": len(self.tracks),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
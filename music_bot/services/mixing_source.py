@@ -0,0 +1,148 @@
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Optional, Tuple
+import discord
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FRAME_BYTES = discord.opus.Encoder.FRAME_SIZE  # 20 ms of 48 kHz stereo int16
+FRAME_SAMPLES = discord.opus.Encoder.SAMPLES_PER_FRAME  # Samples per channel in one frame
+
+@lru_cache(maxsize=8)
+def crossfade_ramps(frames: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Equal-power fade-out and fade-in gains, one row of per-sample gains per frame"""
+    t = np.linspace(0.0, 1.0, frames * FRAME_SAMPLES, dtype=np.float32).reshape(frames, FRAME_SAMPLES, 1)
+    fade_out = np.cos(t * (np.pi / 2)).astype(np.float32)
+    fade_in = np.sin(t * (np.pi / 2)).astype(np.float32)
+    fade_out.flags.writeable = False
+    fade_in.flags.writeable = False
+    return fade_out, fade_in
+
+def mix_frames(outgoing: bytes, incoming: bytes, fade_out: np.ndarray, fade_in: np.ndarray) -> bytes:
+    """Mix two 20 ms int16 stereo frames with the given per-sample gains"""
+    a = np.frombuffer(outgoing, dtype=np.int16).reshape(-1, 2)
+    b = np.frombuffer(incoming, dtype=np.int16).reshape(-1, 2)
+    mixed = a * fade_out + b * fade_in
+    np.clip(mixed, -32768, 32767, out=mixed)
+    return mixed.astype(np.int16).tobytes()
+
+class MixingSource(discord.AudioSource):
+    """PCM source that plays tracks back to back.
+
+    The next track is opened ahead of time with set_next. With a crossfade
+    the last frames of the current track are mixed with the first frames of
+    the next one, otherwise the next track starts on the frame after the
+    current one ends. read() runs on the voice thread, on_transition is
+    called there with the token passed to set_next. frames counts the
+    frames of the current track that have been delivered.
+    """
+
+    def __init__(self, source: discord.AudioSource, duration: float, crossfade_frames: int = 0,
+                 on_transition: Optional[Callable[[Any], None]] = None):
+        self.crossfade_frames = crossfade_frames
+        self.on_transition = on_transition
+        self._lock = threading.Lock()
+        self._current = source
+        self._frames_left = self._frames_for(duration)
+        self._next: Optional[discord.AudioSource] = None
+        self._next_frames: Optional[int] = None
+        self._next_token: Any = None
+        self._fade_index = 0
+        self.frames = 0
+        if crossfade_frames:
+            self._fade_out, self._fade_in = crossfade_ramps(crossfade_frames)
+
+    @staticmethod
+    def _frames_for(duration: float) -> Optional[int]:
+        """Frame count of a track, None when its length is unknown and it cannot be crossfaded"""
+        return int(duration * 1000 / discord.opus.Encoder.FRAME_LENGTH) if duration else None
+
+    def is_opus(self) -> bool:
+        return False
+
+    def set_next(self, source: discord.AudioSource, duration: float, token: Any) -> None:
+        """Open the track that follows the current one"""
+        with self._lock:
+            previous = self._next
+            self._next, self._next_frames, self._next_token = source, self._frames_for(duration), token
+            self._fade_index = 0
+        if previous:
+            previous.cleanup()
+
+    def clear_next(self) -> None:
+        """Drop the prepared next track"""
+        with self._lock:
+            previous, self._next, self._next_token = self._next, None, None
+            self._fade_index = 0
+        if previous:
+            previous.cleanup()
+
+    def replace_current(self, source: discord.AudioSource, remaining: float) -> None:
+        """Continue the current track from another source, e.g. after a seek"""
+        with self._lock:
+            previous = self._current
+            self._current, self._frames_left = source, self._frames_for(remaining)
+            self._fade_index = 0
+            self.frames = 0
+        previous.cleanup()
+
+    @property
+    def next_token(self) -> Any:
+        return self._next_token
+
+    def read(self) -> bytes:
+        with self._lock:
+            data = self._read()
+            if data:
+                self.frames += 1
+            return data
+
+    def _read(self) -> bytes:
+        data = self._current.read()
+        if len(data) != FRAME_BYTES:
+            if self._next is None:
+                return b''
+            # Gapless: the next track fills the very next frame
+            self._promote(self._fade_index)
+            return self._current.read()
+
+        if self._frames_left is None:
+            return data
+        self._frames_left -= 1
+        if (self._next is not None and self.crossfade_frames
+                and self._frames_left < self.crossfade_frames):
+            incoming = self._next.read()
+            if len(incoming) == FRAME_BYTES:
+                data = mix_frames(data, incoming, self._fade_out[self._fade_index], self._fade_in[self._fade_index])
+                self._fade_index += 1
+                if self._next_frames is not None:
+                    self._next_frames -= 1
+            if self._fade_index >= self.crossfade_frames:
+                # The outgoing track is silent now, stop decoding it. The
+                # frame being returned is counted for the new track by read()
+                self._promote(self._fade_index - 1)
+        return data
+
+    def _promote(self, frames_played: int) -> None:
+        """Make the next track current. Called with the lock held"""
+        previous = self._current
+        token = self._next_token
+        self._current, self._frames_left = self._next, self._next_frames
+        self._next, self._next_token = None, None
+        self._fade_index = 0
+        self.frames = frames_played
+        previous.cleanup()
+        if self.on_transition:
+            try:
+                self.on_transition(token)
+            except Exception as e:
+                logger.error(f"Error in track transition callback: {e}", exc_info=True)
+
+    def cleanup(self) -> None:
+        with self._lock:
+            self._current.cleanup()
+            if self._next:
+                self._next.cleanup()
+                self._next = None
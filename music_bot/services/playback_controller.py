@@ -0,0 +1,351 @@
+import asyncio
+import logging
+from enum import Enum
+from typing import Optional, Tuple
+from models.song import Song
+from services.download_scheduler import DownloadPriority
+
+logger = logging.getLogger(__name__)
+
+class PlaybackState(Enum):
+    """Lifecycle states of a guild's playback"""
+    IDLE = "idle"
+    RESOLVING = "resolving"
+    DOWNLOADING = "downloading"
+    PLAYING = "playing"
+    PAUSED = "paused"
+
+class PlaybackController:
+    """Event-driven playback state machine for a single guild.
+
+    Transitions are triggered by queue events, the playback-finished
+    callback, skip and stop. Only the controller advances the queue.
+    """
+
+    def __init__(self, music_bot, guild_id: int):
+        self.music_bot = music_bot
+        self.guild_id = guild_id
+        self.state = PlaybackState.IDLE
+        self._advance_task: Optional[asyncio.Task] = None
+        # Bumped whenever a track starts or is interrupted so that stale
+        # finish callbacks from stopped sources are ignored.
+        self._generation = 0
+        self._prepared_song: Optional[Song] = None  # Next song whose decoder has been opened
+        self._prepare_task: Optional[asyncio.Task] = None
+        # The next song is only opened once the current one is close to its end
+        self._prewarm_handle: Optional[asyncio.TimerHandle] = None
+        self._next_window_open = False
+        # Song, position and paused state to pick up from a previous run
+        self._resume: Optional[Tuple[Song, float, bool]] = None
+
+    @property
+    def queue_manager(self):
+        return self.music_bot.get_queue_manager(self.guild_id)
+
+    def _set_state(self, state: PlaybackState) -> None:
+        if state != self.state:
+            logger.debug(f"Playback state for guild {self.guild_id}: {self.state.value} -> {state.value}")
+            self.state = state
+
+    def _get_voice_client(self) -> Optional[object]:
+        guild = self.music_bot.bot.get_guild(self.guild_id)
+        return guild.voice_client if guild else None
+
+    def on_queue_event(self, event: str) -> None:
+        """React to a queue change"""
+        if event in ("add", "restore") and self.state == PlaybackState.IDLE:
+            self._schedule_advance()
+        elif self.state in (PlaybackState.PLAYING, PlaybackState.PAUSED):
+            self._prepare_next()
+
+    def on_playback_finished(self, generation: int, error) -> None:
+        """Handle the end of a track started by this controller"""
+        if generation != self._generation:
+            logger.debug(f"Ignoring stale playback finish for guild {self.guild_id}")
+            return
+        if error:
+            logger.error(f"Playback error for guild {self.guild_id}: {error}")
+        if self.state not in (PlaybackState.PLAYING, PlaybackState.PAUSED):
+            return
+        self._cancel_prewarm_timer()
+        if self._prepare_task and not self._prepare_task.done():
+            self._release_prepared()
+        else:
+            # A fully prepared decoder is kept for the next play() to pick up
+            self._prepared_song = None
+            self._prepare_task = None
+        self._set_state(PlaybackState.IDLE)
+        self._schedule_advance()
+
+    def is_idle(self) -> bool:
+        """Whether nothing is playing, paused or about to play"""
+        if self._resume or (self._advance_task and not self._advance_task.done()):
+            return False
+        return self.state == PlaybackState.IDLE
+
+    def close(self) -> None:
+        """Cancel the controller's timers and tasks before it is dropped"""
+        if self._advance_task and not self._advance_task.done():
+            self._advance_task.cancel()
+        self._cancel_prewarm_timer()
+        self._release_prepared()
+
+    def restore(self, song: Song, position: float, paused: bool) -> None:
+        """Continue a song that was playing before a restart"""
+        self._resume = (song, position, paused)
+        self._schedule_advance()
+
+    async def skip(self) -> Optional[Song]:
+        """Skip the current song and advance to the next one"""
+        current_song = self.queue_manager.get_currently_playing()
+        self._resume = None
+        self._interrupt()
+        self._schedule_advance()
+        return current_song
+
+    async def stop(self) -> Optional[Song]:
+        """Stop playback and clear the queue"""
+        current_song = self.queue_manager.get_currently_playing()
+        self.music_bot.cancel_playlists(self.guild_id)
+        self._resume = None
+        self._interrupt()
+        await self.queue_manager.clear()
+        await self.queue_manager.clear_current()
+        return current_song
+
+    def pause(self) -> bool:
+        """Pause the current song"""
+        if self.state != PlaybackState.PLAYING:
+            return False
+        self.music_bot.audio_player.pause(self.guild_id)
+        self._set_state(PlaybackState.PAUSED)
+        self._cancel_prewarm_timer()
+        return True
+
+    def resume(self) -> bool:
+        """Resume the current song"""
+        if self.state != PlaybackState.PAUSED:
+            return False
+        self.music_bot.audio_player.resume(self.guild_id)
+        self._set_state(PlaybackState.PLAYING)
+        position, duration = self.music_bot.audio_player.get_progress(self.guild_id)
+        self._schedule_prewarm(duration - position)
+        return True
+
+    async def seek(self, position: float) -> Optional[float]:
+        """Move the current song to a position, returning the position reached"""
+        song = self.queue_manager.get_currently_playing()
+        if self.state not in (PlaybackState.PLAYING, PlaybackState.PAUSED) or not song:
+            return None
+        if song.duration:
+            position = min(position, song.duration - 1)
+        position = max(position, 0)
+
+        downloader = self.music_bot.queue_downloader
+        seek_index = None
+        if song.is_downloaded:
+            source = song.filepath
+            seek_index = await downloader.get_seek_index(song.video_id)
+        elif song.stream_url:
+            source = song.stream_url
+        else:
+            return None
+
+        audio_player = self.music_bot.audio_player
+        if self.queue_manager.get_currently_playing() is not song:
+            return None
+        if not await audio_player.seek(self.guild_id, source, position,
+                                       gain_db=downloader.get_playback_gain(song.video_id),
+                                       seek_index=seek_index):
+            return None
+
+        # The next song is opened again relative to the new position
+        self._release_prepared()
+        if self.state == PlaybackState.PLAYING:
+            self._schedule_prewarm(song.duration - position)
+        else:
+            self._cancel_prewarm_timer()
+            self._next_window_open = False
+        return position
+
+    def _interrupt(self) -> None:
+        """Cancel pending work and stop the current track"""
+        if self._advance_task and not self._advance_task.done():
+            self._advance_task.cancel()
+        self._advance_task = None
+        self._generation += 1
+        self._cancel_prewarm_timer()
+        self._release_prepared()
+        self.music_bot.audio_player.stop(self.guild_id)
+        self._set_state(PlaybackState.IDLE)
+
+    def _schedule_prewarm(self, remaining: float) -> None:
+        """Open the next song's decoder shortly before the current one ends"""
+        self._cancel_prewarm_timer()
+        self._next_window_open = False
+        delay = remaining - self.music_bot.audio_player.prewarm_seconds
+        if remaining <= 0 or delay <= 0:
+            # Unknown or short duration
+            self._open_next_window()
+            return
+        self._prewarm_handle = asyncio.get_running_loop().call_later(delay, self._open_next_window)
+
+    def _cancel_prewarm_timer(self) -> None:
+        if self._prewarm_handle:
+            self._prewarm_handle.cancel()
+            self._prewarm_handle = None
+
+    def _open_next_window(self) -> None:
+        self._prewarm_handle = None
+        self._next_window_open = True
+        self._prepare_next()
+
+    def _prepare_next(self) -> None:
+        """Open the next queued song's decoder if the current song is near its end"""
+        if not self._next_window_open or self.state not in (PlaybackState.PLAYING, PlaybackState.PAUSED):
+            return
+
+        queue = self.queue_manager.queue
+        next_song = queue[0] if queue else None
+        if next_song is self._prepared_song:
+            return
+        self._release_prepared()
+        if next_song is None:
+            return
+
+        if not next_song.is_downloaded:
+            downloader = self.music_bot.queue_downloader
+            download = asyncio.ensure_future(downloader.request(next_song, self.guild_id, DownloadPriority.NEXT))
+            download.add_done_callback(self._on_next_downloaded)
+            return
+
+        self._prepared_song = next_song
+        self._prepare_task = asyncio.create_task(self._open_next(next_song))
+
+    async def _open_next(self, song: Song) -> None:
+        audio_player = self.music_bot.audio_player
+        gain_db = self.music_bot.queue_downloader.get_playback_gain(song.video_id)
+        song.duration = self.music_bot.metadata_store.get_duration(song.video_id, song.duration)
+        try:
+            if not await audio_player.prewarm(self.guild_id, song.filepath, gain_db=gain_db):
+                self._prepared_song = None
+                return
+            if audio_player.mixing_enabled:
+                audio_player.queue_next(self.guild_id, song.filepath, song.duration, token=song, gain_db=gain_db)
+            logger.debug(f"Prepared next song for guild {self.guild_id}: {song.title}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error preparing next song for guild {self.guild_id}: {e}", exc_info=True)
+            self._prepared_song = None
+
+    def _release_prepared(self) -> None:
+        """Close the decoder opened for a next song that will not play"""
+        if self._prepare_task and not self._prepare_task.done():
+            self._prepare_task.cancel()
+        self._prepare_task = None
+        if self._prepared_song:
+            self._prepared_song = None
+            self.music_bot.audio_player.clear_next(self.guild_id)
+            self.music_bot.audio_player.discard_prewarmed(self.guild_id)
+
+    def _on_next_downloaded(self, download: asyncio.Future) -> None:
+        if not download.cancelled() and download.exception() is None and download.result():
+            self._prepare_next()
+
+    def _on_track_transition(self, song: Song) -> None:
+        """The mixing source moved on to the prepared song"""
+        asyncio.create_task(self._complete_transition(song))
+
+    async def _complete_transition(self, song: Song) -> None:
+        try:
+            self._prepared_song = None
+            queue_manager = self.queue_manager
+            if queue_manager.queue and queue_manager.queue[0] is song:
+                await queue_manager.get_next()
+            await queue_manager.set_current(song)
+            self.music_bot.audio_player.track_changed(self.guild_id, song.duration)
+            logger.info(f"Now playing in guild {self.guild_id}: {song.title}")
+            self._schedule_prewarm(song.duration)
+        except Exception as e:
+            logger.error(f"Error completing track transition for guild {self.guild_id}: {e}", exc_info=True)
+
+    def _schedule_advance(self) -> None:
+        if self._advance_task and not self._advance_task.done():
+            return
+        self._advance_task = asyncio.create_task(self._advance())
+
+    async def _advance(self) -> None:
+        """Take songs from the queue until one starts playing or the queue is empty"""
+        queue_manager = self.queue_manager
+        try:
+            await queue_manager.clear_current()
+            while True:
+                self._set_state(PlaybackState.RESOLVING)
+                voice_client = self._get_voice_client()
+                if not voice_client or not voice_client.is_connected():
+                    logger.info(f"Voice client not connected for guild {self.guild_id}, staying idle")
+                    self._set_state(PlaybackState.IDLE)
+                    return
+
+                start, paused = 0, False
+                if self._resume:
+                    song, start, paused = self._resume
+                    self._resume = None
+                else:
+                    song = await queue_manager.get_next()
+                if not song:
+                    self._set_state(PlaybackState.IDLE)
+                    return
+
+                source, codec, seek_index = song.filepath, None, None
+                if song.is_downloaded and start:
+                    seek_index = await self.music_bot.queue_downloader.get_seek_index(song.video_id)
+                if not song.is_downloaded:
+                    self._set_state(PlaybackState.DOWNLOADING)
+                    downloader = self.music_bot.queue_downloader
+                    download = asyncio.ensure_future(downloader.request(song, self.guild_id))
+                    # Progressive mode plays the stream while the cache file fills in the background
+                    stream = await downloader.resolve_stream(song) if downloader.progressive else None
+                    if stream:
+                        source, codec = stream["url"], stream["acodec"]
+                    elif await asyncio.shield(download):
+                        source = song.filepath
+                    else:
+                        logger.error(f"Failed to download: {song.title}")
+                        continue
+
+                # The metadata store has the most accurate duration
+                song.duration = self.music_bot.metadata_store.get_duration(song.video_id, song.duration)
+                await queue_manager.set_current(song)
+                self._generation += 1
+                generation = self._generation
+                success = await self.music_bot.audio_player.play(
+                    voice_client,
+                    source,
+                    song.duration,
+                    after_callback=lambda error: self.on_playback_finished(generation, error),
+                    codec=codec,
+                    gain_db=self.music_bot.queue_downloader.get_playback_gain(song.video_id),
+                    on_transition=self._on_track_transition,
+                    start=start,
+                    seek_index=seek_index
+                )
+                if success:
+                    self._set_state(PlaybackState.PLAYING)
+                    logger.info(f"Now playing in guild {self.guild_id}: {song.title}")
+                    if paused:
+                        self.pause()
+                    else:
+                        self._schedule_prewarm(song.duration - start)
+                    return
+
+                logger.error(f"Failed to play: {song.title}")
+                await queue_manager.clear_current()
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error advancing playback for guild {self.guild_id}: {str(e)}", exc_info=True)
+            await queue_manager.clear_current()
+            self._set_state(PlaybackState.IDLE)
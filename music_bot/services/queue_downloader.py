@@ -1,51 +1,81 @@
 import asyncio
 import os
+import threading
 import yt_dlp
 from concurrent.futures import ThreadPoolExecutor
 import logging
-from typing import Optional, List, Dict
-from dataclasses import dataclass
+from typing import AsyncIterator, Optional, Dict, Set
 from services.queue_manager import QueueManager
-from difflib import SequenceMatcher
+from services.download_scheduler import DownloadScheduler, DownloadPriority
+from services.audio_cache import AudioCache, DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES
+from services.search_cache import SearchCache
+from services.youtube_api import YouTubeAPI
+from services.loudness import measure_loudness, compute_gain
+from services.seek_index import build_seek_index, read_seek_index, write_seek_index
 
 logger = logging.getLogger(__name__)
 
-@dataclass
-class DownloadStatus:
-    """Tracks download status for queue items"""
-    guild_id: int
-    is_downloading: bool = False
-    current_downloads: List[str] = None  # List of video_ids currently downloading
-    max_concurrent: int = 2  # Number of songs to preload
-    
-    def __post_init__(self):
-        self.current_downloads = []
-
 class QueueDownloader:
-    def __init__(self, music_bot, youtube, get_queue_manager, guilds):
+    def __init__(self, music_bot, build_youtube, get_queue_manager):
         self.music_bot = music_bot
-        self.youtube = youtube
+        self.youtube_api = YouTubeAPI(build_youtube)
         self.get_queue_manager = get_queue_manager
-        self.guilds = guilds
         
         cwd = os.getcwd()
-        self.download_dir = os.path.abspath(os.path.join(cwd, "music"))
+        self.download_dir = os.path.abspath(os.path.join(cwd, os.getenv("MUSIC_DATA_DIR", "music")))
         os.makedirs(self.download_dir, exist_ok=True)
 
-        self.thread_pool = ThreadPoolExecutor(max_workers=3)
-        self.statuses = {}  # guild_id -> DownloadStatus
-        self._download_tasks = {}  # guild_id -> Task
-        self.cache = {"queries": {}, "videos": {}}  # Initialize cache
+        self.max_downloads = int(os.getenv("DOWNLOAD_CONCURRENCY", "3"))
+        # Extra workers keep metadata extraction responsive while downloads run
+        self.thread_pool = ThreadPoolExecutor(max_workers=self.max_downloads + 2)
+        # Loudness is measured once when a file enters the cache
+        self.normalize_loudness = os.getenv("LOUDNESS_NORMALIZATION", "1") == "1"
+        self.loudness_target = float(os.getenv("LOUDNESS_TARGET_LUFS", "-16"))
+        self._loudness_tasks: Set[asyncio.Task] = set()
+        self.seek_index_stride = float(os.getenv("SEEK_INDEX_STRIDE", "1"))  # Seconds between seek points
+        # Start playback from the stream URL while the cache file is still downloading
+        self.progressive = os.getenv("PROGRESSIVE_PLAYBACK", "1") == "1"
+        self.prefetch_depth = int(os.getenv("DOWNLOAD_PREFETCH_DEPTH", "2"))  # Number of songs to preload
+        self.max_playlist_size = int(os.getenv("MAX_PLAYLIST_SIZE", "100"))
+        self.scheduler = DownloadScheduler(
+            self.download_song,
+            max_concurrent=self.max_downloads,
+            max_per_guild=int(os.getenv("DOWNLOAD_CONCURRENCY_PER_GUILD", "2"))
+        )
+        self.search_cache = SearchCache(
+            max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000")),
+            ttl=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            path=os.getenv("SEARCH_CACHE_PATH"),
+            executor=self.thread_pool
+        )
+        self.audio_cache = AudioCache(
+            self.download_dir,
+            max_bytes=int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES))),
+            max_entries=int(os.getenv("AUDIO_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))),
+            policy=os.getenv("AUDIO_CACHE_POLICY", "lru"),
+            executor=self.thread_pool
+        )
         self.max_retries = 3  # Define max_retries attribute
-        self.download_lock = asyncio.Lock()  # Define download_lock attribute
+        self._download_slots = asyncio.Semaphore(self.max_downloads)
+        self._in_flight: Dict[str, asyncio.Future] = {}  # video_id -> running download
+
+        # "opus" keeps YouTube's native Opus stream so playback can pass packets
+        # straight to the voice connection, "pcm" transcodes to MP3 as before
+        self.audio_pipeline = os.getenv("AUDIO_PIPELINE", "opus")
+        if self.audio_pipeline == "opus":
+            audio_format = 'bestaudio[acodec=opus]/bestaudio/best'
+            self.audio_codec = 'opus'  # Extracted with a stream copy when the source is Opus
+        else:
+            audio_format = 'bestaudio/best'
+            self.audio_codec = 'mp3'
 
         # Define ytdl_opts attribute
         self.ytdl_opts = {
-            'format': 'bestaudio/best',
+            'format': audio_format,
             'outtmpl': os.path.join(self.download_dir, '%(id)s'),  # Change extension here
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
+                'preferredcodec': self.audio_codec,
                 'preferredquality': '192',
             }],
             'logger': logging.getLogger('ytdl'),
@@ -55,208 +85,238 @@ class QueueDownloader:
         }
 
     async def start(self):
-        for guild in self.guilds:
-            guild_id = int(guild["id"])
-            self.statuses[guild_id] = DownloadStatus(guild_id=guild_id)
-            self._download_tasks[guild_id] = asyncio.create_task(self._monitor_queue(guild_id))
-            logger.info(f"Started download monitor for guild {guild_id}")
+        """Start the download scheduler and rebuild the cache index"""
+        self.scheduler.start()
+        await self.audio_cache.load()
 
     async def stop(self):
-        """Stop all download monitoring processes"""
-        for guild_id, task in self._download_tasks.items():
-            if task:
-                task.cancel()
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    pass
-                logger.info(f"Stopped download monitor for guild {guild_id}")
-        self._download_tasks.clear()
-        self.statuses.clear()
+        """Stop the download scheduler and pending loudness measurements"""
+        await self.scheduler.stop()
+        for task in self._loudness_tasks:
+            task.cancel()
 
     async def cleanup_guild(self, guild_id: int):
         """Cleanup resources for specific guild"""
-        if guild_id in self._download_tasks:
-            self._download_tasks[guild_id].cancel()
-            try:
-                await self._download_tasks[guild_id]
-            except asyncio.CancelledError:
-                pass
-            del self._download_tasks[guild_id]
-            del self.statuses[guild_id]
-            logger.info(f"Cleaned up download monitor for guild {guild_id}")
-
-    async def _monitor_queue(self, guild_id: int):
-        queue_manager = self.get_queue_manager(guild_id)
-        while True:
-            try:
-                # Use get_queue_info and handle it as a list
-                queue_info = queue_manager.get_queue_info()
-                for info in queue_info:
-                    # Check if 'is_downloading' key exists
-                    if not info.get('is_downloading', False):
-                        # Correct usage of queue_info attributes
-                        logger.debug(f"Queue info for guild {guild_id}: {info}")
-                await self._process_downloads(queue_manager)  # Ensure downloads are processed
-                await asyncio.sleep(1)
-            except Exception as e:
-                logger.error(f"Error in queue download monitor: {str(e)}", exc_info=True)
-                await asyncio.sleep(5)
-
-    async def _process_downloads(self, queue_manager):
-        """Process downloads for upcoming songs in queue"""
-        guild_id = queue_manager.guild_id
-        if guild_id not in self.statuses:
-            logger.warning(f"No download status found for guild {guild_id}")
-            return
-            
-        status = self.statuses[guild_id]
-        if status.is_downloading:
-            return
+        self.scheduler.retain(guild_id, set())
+        self.audio_cache.unpin(guild_id)
+        logger.info(f"Cleaned up pending downloads for guild {guild_id}")
 
-        # Get next few songs that need downloading
-        upcoming_songs = await self._get_upcoming_songs(queue_manager)
-        if not upcoming_songs:
-            return
+    def on_queue_changed(self, guild_id: int) -> None:
+        """Reschedule prefetch downloads after the guild's queue changed"""
+        queue_manager = self.get_queue_manager(guild_id)
 
-        status.is_downloading = True
-        try:
-            download_tasks = []
-            for song in upcoming_songs:
-                # Check if song needs downloading and isn't already being downloaded
-                if (not song.is_downloaded and 
-                    song.video_id not in status.current_downloads):
-                    status.current_downloads.append(song.video_id)
-                    download_tasks.append(self._download_song(song))
-            await asyncio.gather(*download_tasks)
-        finally:
-            status.is_downloading = False
+        # Keep every queued and playing song in the cache
+        pinned = {song.video_id for song in queue_manager.queue}
+        if queue_manager.current_song:
+            pinned.add(queue_manager.current_song.video_id)
+        self.audio_cache.pin(guild_id, pinned)
 
-    async def _get_upcoming_songs(self, queue_manager) -> List:
-        """Get the next few songs from queue that need downloading"""
-        guild_id = queue_manager.guild_id
-        if guild_id not in self.statuses:
-            return []
-            
-        queue_state = queue_manager.get_state()
-        upcoming = []
-        
-        # Get songs from queue up to max_concurrent
-        status = self.statuses[guild_id]
-        for song in list(queue_state.queue)[:status.max_concurrent]:
+        upcoming = queue_manager.queue[:self.prefetch_depth]
+        self.scheduler.retain(guild_id, {song.video_id for song in upcoming})
+        for index, song in enumerate(upcoming):
             if not song.is_downloaded:
-                upcoming.append(song)
-                
-        return upcoming
+                priority = DownloadPriority.NEXT if index == 0 else DownloadPriority.PREFETCH
+                self.scheduler.submit(song, guild_id, priority)
 
-    async def _download_song(self, song) -> bool:
-        """Download a single song"""
+    async def request(self, song, guild_id: int, priority: DownloadPriority = DownloadPriority.NOW) -> bool:
+        """Download a song through the scheduler and wait for the result"""
+        if song.is_downloaded:
+            return True
+        future = self.scheduler.submit(song, guild_id, priority)
         try:
-            logger.debug(f"Starting download for upcoming song: {song.title}")
-            success = await self.download_song(song)
-            
-            if success:
-                logger.info(f"Successfully pre-downloaded: {song.title}")
-            else:
-                logger.error(f"Failed to pre-download: {song.title}")
-                
-            return success
-            
-        except Exception as e:
-            logger.error(f"Error downloading song {song.title}: {e}")
-            return False
-        finally:
-            # Remove from all guild download statuses
-            for status in self.statuses.values():
-                if song.video_id in status.current_downloads:
-                    status.current_downloads.remove(song.video_id)
+            # Shield the shared job so a cancelled waiter does not cancel it for everyone
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                return False
+            raise
+
+    def get_stats(self) -> Dict:
+        """Get download statistics"""
+        return self.scheduler.get_stats()
+
+    def get_search_stats(self) -> Dict:
+        """Get search cache hit rate, lookup latency and YouTube API quota use"""
+        return {
+            **self.search_cache.get_stats(),
+            "youtube_api": self.youtube_api.get_stats()
+        }
+
+    def get_cache_stats(self) -> Dict:
+        """Get audio cache statistics"""
+        return self.audio_cache.get_stats()
 
     async def download_song(self, song) -> bool:
-        """Download a song to the music directory"""
-        filepath = os.path.join(self.download_dir, f"{song.video_id}.mp3")
-        
+        """Download a song to the music directory.
+
+        Concurrent calls for the same video attach to the one in-flight download.
+        """
+        in_flight = self._in_flight.get(song.video_id)
+        if in_flight is None:
+            in_flight = asyncio.ensure_future(self._download(song))
+            self._in_flight[song.video_id] = in_flight
+            in_flight.add_done_callback(lambda _: self._in_flight.pop(song.video_id, None))
+        else:
+            logger.info(f"Joining in-flight download for: {song.title}")
+
+        filepath = await asyncio.shield(in_flight)
+        if not filepath:
+            return False
+        song.set_downloaded(filepath)
+        self.music_bot.on_song_downloaded(song.video_id)
+        return True
+
+    async def _download(self, song) -> Optional[str]:
+        """Run the yt-dlp download for a song with retries, returning the cached file path"""
         # Check if already downloaded first
-        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+        entry = self.audio_cache.lookup(song.video_id)
+        if entry:
+            filepath = self.audio_cache.path(entry)
             logger.info(f"Using cached file: {filepath}")
-            song.set_downloaded(filepath)
-            return True
+            return filepath
+
+        filepath = os.path.join(self.download_dir, f"{song.video_id}.{self.audio_codec}")
+
+        def _run_ytdl():
+            with yt_dlp.YoutubeDL(self.ytdl_opts) as ytdl:
+                return ytdl.extract_info(song.webpage_url, download=True)
 
         for attempt in range(self.max_retries):
             try:
                 logger.info(f"Starting download attempt {attempt + 1} for: {song.title}")
                 logger.info(f"Download path: {filepath}")
                 
-                async with self.download_lock:
-                    with yt_dlp.YoutubeDL(self.ytdl_opts) as ytdl:
-                        try:
-                            def _download():
-                                return ytdl.download([song.webpage_url])
-                            
-                            result = await asyncio.get_event_loop().run_in_executor(
-                                self.thread_pool, _download
-                            )
-                            
-                            # Wait a bit for file system
-                            await asyncio.sleep(0.5)
-                            
-                            # Verify download succeeded
-                            if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-                                song.set_downloaded(filepath)
-                                logger.info(f"Successfully downloaded to: {filepath}")
-                                return True
-                            
-                            logger.error(f"Download failed with result: {result}")
-                        except Exception as e:
-                            logger.error(f"Download failed: {e}")
-                            raise
-                            
+                async with self._download_slots:
+                    info = await asyncio.get_event_loop().run_in_executor(
+                        self.thread_pool, _run_ytdl
+                    )
+                # Playlist entries are queued with partial details, the download has them all
+                self.apply_details(song, info)
+                
+                # Verify download succeeded
+                if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+                    seek_index = await asyncio.get_event_loop().run_in_executor(
+                        self.thread_pool, self._index_file, filepath
+                    )
+                    self._record_probe(song, filepath, seek_index)
+                    self.audio_cache.add(song.video_id, filepath, song.duration)
+                    if self.normalize_loudness:
+                        # Measured after the file is registered so playback does not wait for it
+                        task = asyncio.ensure_future(self._measure_loudness(song.video_id, filepath))
+                        self._loudness_tasks.add(task)
+                        task.add_done_callback(self._loudness_tasks.discard)
+                    logger.info(f"Successfully downloaded to: {filepath}")
+                    return filepath
+                
                 logger.error(f"File not found or empty after download: {filepath}")
                                 
             except Exception as e:
                 logger.error(f"Download attempt {attempt + 1} failed for {song.title}: {e}")
                 if attempt == self.max_retries - 1:
-                    return False
+                    return None
                 await asyncio.sleep(1)
                     
-        return False
+        return None
+
+    async def _measure_loudness(self, video_id: str, filepath: str) -> None:
+        """Measure a cached file's loudness and store the gain to play it with"""
+        loudness = await asyncio.get_event_loop().run_in_executor(self.thread_pool, measure_loudness, filepath)
+        if loudness is None:
+            return
+        gain = compute_gain(loudness, self.loudness_target)
+        logger.info(f"Measured {loudness:.1f} LUFS for {filepath}, gain {gain:+.1f} dB")
+        self.audio_cache.set_loudness(video_id, loudness, gain)
+
+    def _index_file(self, filepath: str) -> Optional[Dict]:
+        """Build and store the seek index of a cached file"""
+        index = build_seek_index(filepath, self.seek_index_stride)
+        if index:
+            try:
+                write_seek_index(filepath, index)
+            except OSError as e:
+                logger.error(f"Failed to write seek index for {filepath}: {e}")
+        return index
+
+    def _record_probe(self, song, filepath: str, seek_index: Optional[Dict]) -> None:
+        """Store the duration and bitrate measured on a downloaded file"""
+        if not seek_index or not seek_index.get("duration"):
+            return
+        duration = seek_index["duration"]
+        self.music_bot.metadata_store.update(
+            song.video_id,
+            duration=int(round(duration)),
+            duration_probed=True,
+            codec=self.audio_codec,
+            bitrate=int(os.path.getsize(filepath) * 8 / duration)
+        )
+        song.duration = int(round(duration))
+
+    async def get_seek_index(self, video_id: str) -> Optional[Dict]:
+        """Get the seek index of a cached file, building it for files cached before indexing"""
+        entry = self.audio_cache.entries.get(video_id)
+        if not entry:
+            return None
+        filepath = self.audio_cache.path(entry)
+        if not os.path.exists(filepath):
+            return None
+        loop = asyncio.get_event_loop()
+        index = await loop.run_in_executor(self.thread_pool, read_seek_index, filepath)
+        if index is None:
+            logger.info(f"Building missing seek index for {filepath}")
+            index = await loop.run_in_executor(self.thread_pool, self._index_file, filepath)
+        return index
+
+    def get_playback_gain(self, video_id: str) -> Optional[float]:
+        """Get the gain to apply when playing a cached file, None if it was never measured"""
+        entry = self.audio_cache.entries.get(video_id)
+        if not entry or entry.loudness is None:
+            return None
+        return entry.gain_db
+
+    async def resolve_stream(self, song) -> Optional[Dict]:
+        """Resolve the direct audio stream URL of a song for progressive playback"""
+        try:
+            def _resolve():
+                with yt_dlp.YoutubeDL({**self.ytdl_opts, 'postprocessors': []}) as ytdl:
+                    return ytdl.extract_info(song.webpage_url, download=False)
+
+            info = await asyncio.get_event_loop().run_in_executor(self.thread_pool, _resolve)
+            if not info or not info.get('url'):
+                return None
+            self.apply_details(song, info)
+
+            song.stream_url = info['url']
+            return {
+                'url': info['url'],
+                'acodec': info.get('acodec')
+            }
+
+        except Exception as e:
+            logger.error(f"Error resolving stream for {song.title}: {e}")
+            return None
 
     async def search_video(self, query: str) -> Optional[str]:
         """Search for a video on YouTube"""
         # Check cache first
-        for cached_query, data in self.cache["queries"].items():
-            if SequenceMatcher(None, query, cached_query).ratio() > 0.8:
-                return data["video_id"]
+        video_id = self.search_cache.get(query)
+        if video_id:
+            return video_id
 
         # Perform search using YouTube API
-        search_response = self.youtube.search().list(
-            q=query,
-            part="id,snippet",
-            maxResults=1
-        ).execute()
-
-        if not search_response["items"]:
+        video_id = await self.youtube_api.search(query)
+        if not video_id:
             return None
 
-        video_id = search_response["items"][0]["id"]["videoId"]
-        self.cache["queries"][query] = {"video_id": video_id}
+        self.search_cache.put(query, video_id)
         return video_id
 
     async def get_video_details(self, video_id: str) -> Optional[Dict]:
         """Get detailed video information"""
         try:
-            video_request = self.youtube.videos().list(
-                part="snippet,contentDetails",
-                id=video_id
-            )
-            
-            video_response = await asyncio.get_event_loop().run_in_executor(
-                None, video_request.execute
-            )
-
-            if not video_response.get('items'):
+            video_info = await self.youtube_api.get_video(video_id)
+            if not video_info:
                 return None
 
-            video_info = video_response['items'][0]
             duration = self._parse_duration(video_info['contentDetails']['duration'])
 
             return {
@@ -297,10 +357,71 @@ class QueueDownloader:
             logger.error(f"Error parsing duration: {e}")
             return 0
 
+    def apply_details(self, song, info: Optional[Dict]) -> bool:
+        """Fill in details a song was queued without from extracted video info"""
+        if not info:
+            return False
+        changed = False
+        if not song.duration and info.get('duration'):
+            song.duration = int(info['duration'])
+            changed = True
+        if not song.thumbnail and info.get('thumbnail'):
+            song.thumbnail = info['thumbnail']
+            changed = True
+        return changed
+
+    async def iter_playlist(self, url: str) -> AsyncIterator[Dict]:
+        """Yield the entries of a playlist while yt-dlp is still listing it.
+
+        Flat extraction only reads the playlist pages, the videos
+        themselves are resolved when they are downloaded. At most
+        max_playlist_size entries are listed.
+        """
+        loop = asyncio.get_running_loop()
+        entries: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def _list():
+            opts = {
+                'quiet': True,
+                'no_warnings': True,
+                'extract_flat': 'in_playlist',
+                'lazy_playlist': True,
+                'playlistend': self.max_playlist_size,
+                'logger': logging.getLogger('ytdl')
+            }
+            try:
+                with yt_dlp.YoutubeDL(opts) as ytdl:
+                    info = ytdl.extract_info(url, download=False, process=False)
+                    if info and info.get('_type') == 'url':
+                        # Watch URLs with a list parameter point at the playlist
+                        info = ytdl.extract_info(info['url'], download=False, process=False)
+                    for count, entry in enumerate((info or {}).get('entries') or []):
+                        if stop.is_set() or count >= self.max_playlist_size:
+                            break
+                        loop.call_soon_threadsafe(entries.put_nowait, entry)
+            except Exception as e:
+                logger.error(f"Error listing playlist {url}: {e}")
+            finally:
+                loop.call_soon_threadsafe(entries.put_nowait, done)
+
+        loop.run_in_executor(self.thread_pool, _list)
+        try:
+            while True:
+                entry = await entries.get()
+                if entry is done:
+                    return
+                yield entry
+        finally:
+            # Stops the listing thread when the consumer is cancelled
+            stop.set()
+
     async def extract_info(self, url: str) -> Optional[Dict]:
         """Extract video information using yt-dlp"""
         try:
-            with yt_dlp.YoutubeDL(self.ytdl_opts) as ytdl:
+            # Playlists are listed by iter_playlist, only the video itself is wanted here
+            with yt_dlp.YoutubeDL({**self.ytdl_opts, 'noplaylist': True}) as ytdl:
                 def _get_info():
                     info = ytdl.extract_info(url, download=False)
                     logger.debug(f"Raw video info: {info}")
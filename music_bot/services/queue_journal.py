@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from services.queue_manager import apply_operation
+
+logger = logging.getLogger(__name__)
+
+class QueueJournal:
+    """Queue state of every guild, persisted to survive restarts.
+
+    Queue operations are appended to a JSON lines journal. Every
+    compact_after entries the state they add up to is written as a
+    snapshot and the journal starts over. Entries carry a sequence number
+    so ones already in the snapshot are skipped if the process stopped
+    before the journal was truncated. All file access happens on a single
+    writer thread, which also keeps the replayed state.
+    """
+
+    def __init__(self, directory: str, compact_after: int = 1000):
+        self.journal_path = os.path.join(directory, "queues.journal")
+        self.snapshot_path = os.path.join(directory, "queues.snapshot.json")
+        self.compact_after = compact_after
+        self.state: Dict[str, Dict] = {}  # guild id -> {"queue", "current", "position", "paused", "channel_id"}
+        self._seq = 0
+        self._since_snapshot = 0
+        self._file = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="queue-journal")
+        self._loaded: Optional[asyncio.Future] = None
+        self.entries_written = 0
+        self.snapshots_written = 0
+
+    def load(self) -> "asyncio.Future[Dict[str, Dict]]":
+        """Read the saved state in the background, once"""
+        if self._loaded is None:
+            self._loaded = asyncio.get_running_loop().run_in_executor(self._writer, self._open)
+        return self._loaded
+
+    def _open(self) -> Dict[str, Dict]:
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.state = snapshot["guilds"]
+            self._seq = snapshot["seq"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to read queue snapshot {self.snapshot_path}: {e}", exc_info=True)
+
+        replayed = 0
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash ends the journal
+                        break
+                    if entry["seq"] <= self._seq:
+                        continue
+                    self._apply(entry)
+                    self._seq = entry["seq"]
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to replay queue journal {self.journal_path}: {e}", exc_info=True)
+
+        logger.info(f"Restored queue state for {len(self.state)} guilds ({replayed} journal entries replayed)")
+        # Start from a compact snapshot so the journal only holds this run's changes
+        self._compact()
+        return json.loads(json.dumps(self.state))
+
+    async def get(self, guild_id: int) -> Optional[Dict]:
+        """Get a copy of the saved state of a guild"""
+        def _get():
+            state = self.state.get(str(guild_id))
+            return json.loads(json.dumps(state)) if state else None
+
+        await self.load()
+        return await asyncio.get_running_loop().run_in_executor(self._writer, _get)
+
+    def record(self, guild_id: int, entry: Dict) -> None:
+        """Append a queue operation for a guild"""
+        self._writer.submit(self._append, {"guild": str(guild_id), **entry})
+
+    def forget(self, guild_id: int) -> None:
+        """Drop the saved state of a guild"""
+        self.record(guild_id, {"op": "forget"})
+
+    def _append(self, entry: Dict) -> None:
+        try:
+            self._seq += 1
+            entry["seq"] = self._seq
+            self._apply(entry)
+            if self._file is None:
+                self._file = open(self.journal_path, "a", encoding="utf-8")
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            self.entries_written += 1
+            self._since_snapshot += 1
+            if self._since_snapshot >= self.compact_after:
+                self._compact()
+        except Exception as e:
+            logger.error(f"Failed to write queue journal entry: {e}", exc_info=True)
+
+    def _apply(self, entry: Dict) -> None:
+        """Apply a journal entry to the state"""
+        guild = self.state.setdefault(entry["guild"], {
+            "queue": [], "current": None, "position": 0, "paused": False, "channel_id": None
+        })
+        op = entry["op"]
+        if op == "current":
+            guild["current"] = entry["song"]
+            guild["position"] = 0
+            guild["paused"] = False
+        elif op == "position":
+            guild["position"] = entry["position"]
+            guild["paused"] = entry["paused"]
+            guild["channel_id"] = entry["channel_id"]
+        else:
+            apply_operation(guild["queue"], entry)
+
+        if op == "forget" or not guild["queue"] and not guild["current"] and not guild["channel_id"]:
+            del self.state[entry["guild"]]
+
+    def _compact(self) -> None:
+        """Write the state as a snapshot and truncate the journal"""
+        try:
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"seq": self._seq, "saved_at": time.time(), "guilds": self.state}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.journal_path, "w", encoding="utf-8")
+            self._since_snapshot = 0
+            self.snapshots_written += 1
+        except Exception as e:
+            logger.error(f"Failed to write queue snapshot {self.snapshot_path}: {e}", exc_info=True)
+
+    async def close(self) -> None:
+        """Write a final snapshot and stop the writer"""
+        await asyncio.get_running_loop().run_in_executor(self._writer, self._compact)
+        self._writer.shutdown(wait=True)
+
+    def get_stats(self) -> Dict:
+        return {
+            "guilds": len(self.state),
+            "entries_written": self.entries_written,
+            "entries_since_snapshot": self._since_snapshot,
+            "snapshots_written": self.snapshots_written
+        }
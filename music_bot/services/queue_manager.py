@@ -1,5 +1,7 @@
 from collections import deque
 import asyncio
+import os
+import time
 from typing import Optional, List, Dict
 import logging
 from dataclasses import dataclass, field
@@ -8,6 +10,25 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+def apply_operation(queue: List, operation: Dict) -> None:
+    """Apply a queue operation, as recorded in the operation log, to a list of song dicts"""
+    op = operation["op"]
+    index = operation.get("index", 0)
+    if op == "add":
+        queue.insert(index, operation["song"])
+    elif op == "remove" and 0 <= index < len(queue):
+        queue.pop(index)
+    elif op == "move" and 0 <= index < len(queue):
+        queue.insert(operation["to"], queue.pop(index))
+    elif op == "update" and 0 <= index < len(queue):
+        queue[index] = operation["song"]
+    elif op == "advance" and queue:
+        queue.pop(0)
+    elif op == "clear":
+        queue.clear()
+    elif op == "restore":
+        queue[:] = operation["songs"]
+
 @dataclass
 class QueueState:
     """Represents the current state of the music queue for a guild"""
@@ -23,6 +44,12 @@ class QueueManager:
         self.queue = []
         self.current_song = None
         self.is_playing = False
+        # Every change to the queue list bumps the version and is kept in the
+        # operation log, so clients can catch up from the version they last saw.
+        # The epoch tells versions of a previous process apart
+        self.epoch = f"{int(time.time() * 1000):x}"
+        self.version = 0
+        self.oplog = deque(maxlen=int(os.getenv("QUEUE_OPLOG_SIZE", "256")))
         logger.info(f"Initialized queue manager for guild {guild_id}")
 
     async def add(self, song: Song) -> bool:
@@ -30,6 +57,7 @@ class QueueManager:
         try:
             self.queue.append(song)
             logger.info(f"Added song to queue for guild {self.guild_id}: {song.title} (Queue size: {len(self.queue)})")
+            self._notify("add", index=len(self.queue) - 1, song=song.to_dict())
             return True
         except Exception as e:
             logger.error(f"Error adding song to queue for guild {self.guild_id}: {e}")
@@ -41,12 +69,39 @@ class QueueManager:
             if 0 <= index < len(self.queue):
                 removed = self.queue.pop(index)
                 logger.info(f"Removed song from queue for guild {self.guild_id}: {removed.title}")
+                self._notify("remove", index=index)
                 return removed
             return None
         except Exception as e:
             logger.error(f"Error removing song from queue for guild {self.guild_id}: {e}")
             return None
 
+    async def move(self, from_index: int, to_index: int) -> Optional[Song]:
+        """Move a song to another position in the queue"""
+        try:
+            if 0 <= from_index < len(self.queue) and 0 <= to_index < len(self.queue):
+                song = self.queue.pop(from_index)
+                self.queue.insert(to_index, song)
+                logger.info(f"Moved song in queue for guild {self.guild_id}: {song.title} ({from_index} -> {to_index})")
+                self._notify("move", index=from_index, to=to_index)
+                return song
+            return None
+        except Exception as e:
+            logger.error(f"Error moving song in queue for guild {self.guild_id}: {e}")
+            return None
+
+    def restore(self, songs: List[Song]) -> None:
+        """Put back songs that were queued before a restart, ahead of any queued since"""
+        self.queue[:0] = songs
+        logger.info(f"Restored {len(songs)} songs to the queue for guild {self.guild_id}")
+        self._notify("restore", songs=self.get_queue_info())
+
+    def song_updated(self, song: Song) -> None:
+        """Record a change to a queued song's state, such as its download finishing"""
+        for index, queued in enumerate(self.queue):
+            if queued is song:
+                self._notify("update", index=index, song=song.to_dict())
+
     async def get_next(self) -> Optional[Song]:
         """Get next song from queue"""
         try:
@@ -55,6 +110,7 @@ class QueueManager:
                 return None
             next_song = self.queue.pop(0)
             logger.info(f"Getting next song for guild {self.guild_id}: {next_song.title} (Remaining: {len(self.queue)})")
+            self._notify("advance")
             return next_song
         except Exception as e:
             logger.error(f"Error getting next song for guild {self.guild_id}: {e}")
@@ -67,6 +123,7 @@ class QueueManager:
             self.current_song = song
             self.is_playing = True
             logger.info(f"Now playing in guild {self.guild_id}: {song.title} (Previous: {old_song.title if old_song else 'None'})")
+            self._notify("current")
         except Exception as e:
             logger.error(f"Error setting current song for guild {self.guild_id}: {e}")
             self.is_playing = False
@@ -79,6 +136,7 @@ class QueueManager:
             self.current_song = None
             self.is_playing = False
             logger.info(f"Cleared current song for guild {self.guild_id}: {old_song.title if old_song else 'None'}")
+            self._notify("current")
         except Exception as e:
             logger.error(f"Error clearing current song for guild {self.guild_id}: {e}")
 
@@ -86,6 +144,38 @@ class QueueManager:
         """Clear entire queue"""
         self.queue.clear()
         logger.info(f"Queue cleared for guild {self.guild_id}")
+        self._notify("clear")
+
+    def _notify(self, event: str, **details) -> None:
+        """Record a queue change and let the bot react to it"""
+        operation = None
+        if event != "current":
+            self.version += 1
+            operation = {"version": self.version, "op": event, **details}
+            self.oplog.append(operation)
+        if self.music_bot:
+            self.music_bot.on_queue_changed(self.guild_id, event, operation)
+
+    def event_id(self, version: int) -> str:
+        """SSE event id of a queue version"""
+        return f"{self.epoch}:{version}"
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        """Queue version of an SSE event id, None if it is not from this queue"""
+        if not event_id:
+            return None
+        epoch, _, version = event_id.partition(":")
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        return int(version)
+
+    def get_operations_since(self, version: int) -> Optional[List[Dict]]:
+        """Get the queue changes after a version, None if they are no longer in the log"""
+        if version == self.version:
+            return []
+        if version > self.version or not self.oplog or self.oplog[0]["version"] > version + 1:
+            return None
+        return [operation for operation in self.oplog if operation["version"] > version]
 
     def get_queue_info(self) -> List[Dict]:
         """Get queue information for display"""
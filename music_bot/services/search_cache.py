@@ -0,0 +1,173 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query: str) -> str:
+    """Case, accent-width and punctuation insensitive form of a search query"""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    query = re.sub(r"[^\w\s]", " ", query)
+    return " ".join(query.split())
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchCache:
+    """Search query -> video id cache with fuzzy lookup.
+
+    Queries are normalized first, so most repeats are exact hits. Other
+    lookups pick the few cached queries sharing the most trigrams with the
+    query and only compare those with SequenceMatcher. Entries expire
+    after ttl and the least recently used are evicted past max_entries.
+    """
+
+    SAVE_DELAY = 30  # Seconds to batch writes of the persisted cache
+
+    def __init__(self, max_entries: int, ttl: float, path: Optional[str] = None,
+                 similarity: float = 0.8, candidates: int = 5, executor=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.similarity = similarity
+        self.candidates = candidates
+        self.executor = executor
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()  # normalized query -> {"video_id", "created_at"}
+        self._index: Dict[str, Set[str]] = {}  # trigram -> normalized queries containing it
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self._lookup_time = 0.0
+        self._max_lookup_time = 0.0
+        if path:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.error(f"Failed to load search cache from {self.path}: {e}")
+            return
+        now = time.time()
+        for key, entry in data.items():
+            if now - entry["created_at"] < self.ttl:
+                self._insert(key, entry)
+        logger.info(f"Loaded {len(self.entries)} cached searches from {self.path}")
+
+    def get(self, query: str) -> Optional[str]:
+        """Get the cached video id for a query or a similar one"""
+        start = time.perf_counter()
+        try:
+            key = normalize_query(query)
+            entry = self._live(key)
+            if entry:
+                self.exact_hits += 1
+                self.entries.move_to_end(key)
+                return entry["video_id"]
+
+            for candidate in self._candidates(key):
+                if SequenceMatcher(None, key, candidate).ratio() > self.similarity:
+                    entry = self._live(candidate)
+                    if entry:
+                        self.fuzzy_hits += 1
+                        self.entries.move_to_end(candidate)
+                        return entry["video_id"]
+
+            self.misses += 1
+            return None
+        finally:
+            elapsed = time.perf_counter() - start
+            self._lookup_time += elapsed
+            self._max_lookup_time = max(self._max_lookup_time, elapsed)
+
+    def put(self, query: str, video_id: str) -> None:
+        """Cache the video id a query resolved to"""
+        key = normalize_query(query)
+        if key in self.entries:
+            self._remove(key)
+        self._insert(key, {"video_id": video_id, "created_at": time.time()})
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+        self._schedule_save()
+
+    def _live(self, key: str) -> Optional[Dict]:
+        entry = self.entries.get(key)
+        if entry and time.time() - entry["created_at"] >= self.ttl:
+            self._remove(key)
+            return None
+        return entry
+
+    def _candidates(self, key: str) -> List[str]:
+        """Cached queries sharing the most trigrams with the key"""
+        postings = sorted((self._index[gram] for gram in trigrams(key) if gram in self._index), key=len)
+        # Trigrams found in a large share of the cache say little about
+        # similarity and cost the most to count, the rarest ones are used
+        limit = max(64, len(self.entries) // 50)
+        selective = [keys for keys in postings if len(keys) <= limit] or postings[:3]
+        shared = Counter()
+        for keys in selective:
+            shared.update(keys)
+        return heapq.nlargest(self.candidates, shared, key=shared.__getitem__)
+
+    def _insert(self, key: str, entry: Dict) -> None:
+        self.entries[key] = entry
+        for gram in trigrams(key):
+            self._index.setdefault(gram, set()).add(key)
+
+    def _remove(self, key: str) -> None:
+        self.entries.pop(key, None)
+        for gram in trigrams(key):
+            keys = self._index.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[gram]
+
+    def _schedule_save(self) -> None:
+        if not self.path or self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._save_handle = loop.call_later(self.SAVE_DELAY, self._save)
+
+    def _save(self) -> None:
+        self._save_handle = None
+        data = dict(self.entries)
+        asyncio.get_running_loop().run_in_executor(self.executor, self._write, data)
+
+    def _write(self, data: Dict) -> None:
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Failed to write search cache to {self.path}: {e}")
+
+    def get_stats(self) -> Dict:
+        """Get hit rate and lookup latency"""
+        lookups = self.exact_hits + self.fuzzy_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.fuzzy_hits) / lookups if lookups else 0.0,
+            "avg_lookup_ms": self._lookup_time / lookups * 1000 if lookups else 0.0,
+            "max_lookup_ms": self._max_lookup_time * 1000
+        }
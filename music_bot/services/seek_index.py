@@ -0,0 +1,113 @@
+import bisect
+import io
+import json
+import logging
+import os
+import subprocess
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEEK_INDEX_SUFFIX = ".seek.json"
+
+def seek_index_path(filepath: str) -> str:
+    return f"{filepath}{SEEK_INDEX_SUFFIX}"
+
+def build_seek_index(filepath: str, stride: float = 1.0) -> Optional[Dict]:
+    """Build a timestamp -> byte offset index of a cached audio file.
+
+    Offsets are taken where a new container page or frame starts, so
+    decoding can begin there. For Ogg the bytes before the first audio
+    page hold the stream headers and are recorded as header_bytes.
+    """
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "a:0",
+             "-show_entries", "packet=pts_time,pos", "-of", "csv=p=0", filepath],
+            capture_output=True,
+            text=True,
+            timeout=300
+        )
+        points = []
+        first_pos = None
+        last_pos = None
+        last_time = 0.0
+        next_time = 0.0
+        for line in result.stdout.splitlines():
+            parts = line.split(",")
+            if len(parts) < 2:
+                continue
+            try:
+                pts_time, pos = float(parts[0]), int(parts[1])
+            except ValueError:
+                continue
+            if first_pos is None:
+                first_pos = pos
+            last_time = max(last_time, pts_time)
+            if pos == last_pos:
+                continue
+            last_pos = pos
+            if pts_time >= next_time:
+                points.append([round(pts_time, 3), pos])
+                next_time = pts_time + stride
+
+        if not points:
+            logger.warning(f"No seek points found for {filepath}")
+            return None
+        return {
+            "header_bytes": first_pos if filepath.endswith(".opus") else 0,
+            "duration": round(last_time, 3),
+            "points": points
+        }
+    except Exception as e:
+        logger.error(f"Error building seek index for {filepath}: {e}")
+        return None
+
+def write_seek_index(filepath: str, index: Dict) -> None:
+    tmp_path = f"{seek_index_path(filepath)}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, seek_index_path(filepath))
+
+def read_seek_index(filepath: str) -> Optional[Dict]:
+    try:
+        with open(seek_index_path(filepath), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable seek index for {filepath}: {e}")
+        return None
+
+def find_seek_point(index: Dict, position: float) -> Tuple[float, int]:
+    """Latest indexed (timestamp, offset) at or before a position"""
+    points = index["points"]
+    i = bisect.bisect_right(points, position, key=lambda point: point[0]) - 1
+    return tuple(points[max(i, 0)])
+
+class OffsetFileReader(io.RawIOBase):
+    """Reads a file's header bytes followed by its contents from an offset"""
+
+    def __init__(self, filepath: str, header_bytes: int, offset: int):
+        self._file = open(filepath, "rb")
+        self._header = self._file.read(header_bytes) if header_bytes else b""
+        self._file.seek(max(offset, header_bytes))
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if self.closed:
+            # ffmpeg's pipe writer thread can read once more after cleanup
+            return b""
+        if self._header:
+            if size is None or size < 0:
+                data, self._header = self._header + self._file.read(), b""
+                return data
+            data, self._header = self._header[:size], self._header[size:]
+            return data
+        return self._file.read(size)
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Session:
+    """A logged in dashboard user"""
+    session_id: str
+    user: Dict
+    access_token: str
+    expires_at: float
+    # Cached per session, never persisted
+    user_guilds: Optional[List[Dict]] = None
+    user_guilds_at: float = 0.0
+    common_guilds: Optional[List[Dict]] = None
+    common_guilds_version: int = -1
+
+class SessionStore:
+    """Sessions with a lifetime and a size bound.
+
+    Sessions live in memory, least recently used first out. With a
+    database path they are also written to SQLite on a background thread
+    and loaded again at startup.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, db_path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        # A single writer thread keeps SQLite off the event loop and serialized
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-db") if db_path else None
+        if db_path:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, user TEXT, access_token TEXT, expires_at REAL)"
+            )
+            self._db.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT id, user, access_token, expires_at FROM sessions ORDER BY expires_at DESC LIMIT ?",
+                (self.max_entries,)
+            ).fetchall()
+            for session_id, user, access_token, expires_at in reversed(rows):
+                self.sessions[session_id] = Session(session_id, json.loads(user), access_token, expires_at)
+            logger.info(f"Loaded {len(self.sessions)} sessions from {self.db_path}")
+        except Exception as e:
+            logger.error(f"Failed to load sessions from {self.db_path}: {e}", exc_info=True)
+            self._db = None
+
+    def _write(self, sql: str, params: tuple) -> None:
+        if self._db is None:
+            return
+
+        def _run():
+            try:
+                self._db.execute(sql, params)
+                self._db.commit()
+            except Exception as e:
+                logger.error(f"Failed to write session: {e}")
+
+        self._writer.submit(_run)
+
+    def create(self, user: Dict, access_token: str, lifetime: Optional[float] = None) -> Session:
+        """Create a new session for a user, ending no later than lifetime seconds from now"""
+        ttl = min(self.ttl, lifetime) if lifetime else self.ttl
+        session = Session(str(uuid.uuid4()), user, access_token, time.time() + ttl)
+        self.sessions[session.session_id] = session
+        while len(self.sessions) > self.max_entries:
+            evicted, _ = self.sessions.popitem(last=False)
+            self._write("DELETE FROM sessions WHERE id = ?", (evicted,))
+        self._write(
+            "INSERT OR REPLACE INTO sessions (id, user, access_token, expires_at) VALUES (?, ?, ?, ?)",
+            (session.session_id, json.dumps(user), access_token, session.expires_at)
+        )
+        return session
+
+    def get(self, session_id: Optional[str]) -> Optional[Session]:
+        """Get a live session, None if it is unknown or expired"""
+        session = self.sessions.get(session_id) if session_id else None
+        if session is None:
+            return None
+        if session.expires_at <= time.time():
+            self.delete(session_id)
+            return None
+        self.sessions.move_to_end(session_id)
+        return session
+
+    async def fetch(self, session_id: Optional[str]) -> Optional[Session]:
+        """Get a live session, reading the database for sessions created by other processes"""
+        session = self.get(session_id)
+        if session is not None or not session_id or self._db is None:
+            return session
+
+        def _read():
+            return self._db.execute(
+                "SELECT user, access_token, expires_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+
+        try:
+            row = await asyncio.get_running_loop().run_in_executor(self._writer, _read)
+        except Exception as e:
+            logger.error(f"Failed to read session: {e}")
+            return None
+        if row is None or row[2] <= time.time():
+            return None
+        session = self.sessions[session_id] = Session(session_id, json.loads(row[0]), row[1], row[2])
+        while len(self.sessions) > self.max_entries:
+            self.sessions.popitem(last=False)
+        return session
+
+    def delete(self, session_id: str) -> None:
+        if self.sessions.pop(session_id, None):
+            self._write("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def __len__(self) -> int:
+        return len(self.sessions)
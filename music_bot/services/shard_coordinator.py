@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+from services.audio_cache import DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES
+from services.guild_registry import GuildRegistry
+from services.http_client import DiscordHTTPClient
+
+logger = logging.getLogger(__name__)
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    """The Discord shard a guild's events arrive on"""
+    return (guild_id >> 22) % shard_count
+
+class ShardCoordinator:
+    """Runs the bot as worker processes that each own a share of the shards.
+
+    Worker i runs shards i, i + workers, ... on an AutoShardedBot together
+    with its own copy of the API, served on a Unix socket. Per-guild API
+    calls are forwarded to the worker that owns the guild's shard. Workers
+    that exit are started again after a delay. The coordinator's guild
+    registry follows the guild list of every worker's gateway connection.
+    """
+
+    RESTART_DELAY = 5  # Seconds before a worker that exited is started again
+    FOLLOW_DELAY = 1  # Seconds between attempts to follow a worker's guild list
+
+    def __init__(self, workers: int, http_client: DiscordHTTPClient, token: str, socket_dir: str,
+                 guild_registry: Optional[GuildRegistry] = None):
+        self.workers = workers
+        self.http_client = http_client
+        self.token = token
+        self.socket_dir = socket_dir
+        self.guild_registry = guild_registry
+        self.shard_count = 0
+        self.processes: Dict[int, asyncio.subprocess.Process] = {}
+        self.restarts: Dict[int, int] = {}
+        self._supervisors: List[asyncio.Task] = []
+        self._sessions: Dict[int, aiohttp.ClientSession] = {}
+        self._stopping = False
+        self.timeout = aiohttp.ClientTimeout(total=float(os.getenv("HTTP_TIMEOUT_SECONDS", "10")))
+
+    def socket_path(self, worker: int) -> str:
+        return os.path.join(self.socket_dir, f"worker-{worker}.sock")
+
+    def shard_ids(self, worker: int) -> List[int]:
+        return list(range(worker, self.shard_count, self.workers))
+
+    def worker_for_guild(self, guild_id: int) -> int:
+        return shard_for_guild(guild_id, self.shard_count) % self.workers
+
+    async def start(self) -> None:
+        """Decide the shard count and start the workers"""
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self.shard_count = await self._get_shard_count()
+        logger.info(f"Running {self.shard_count} shards on {self.workers} worker processes")
+        for worker in range(self.workers):
+            self._supervisors.append(asyncio.create_task(self._supervise(worker)))
+            if self.guild_registry:
+                self._supervisors.append(asyncio.create_task(self._follow_guilds(worker)))
+
+    async def _get_shard_count(self) -> int:
+        if os.getenv("SHARD_COUNT"):
+            shard_count = int(os.getenv("SHARD_COUNT"))
+        else:
+            try:
+                gateway = await self.http_client.get("/gateway/bot", bot_token=self.token)
+                shard_count = gateway["shards"]
+            except Exception as e:
+                logger.error(f"Failed to get the recommended shard count: {e}", exc_info=True)
+                shard_count = 1
+        # Every worker owns at least one shard
+        return max(shard_count, self.workers)
+
+    async def _supervise(self, worker: int) -> None:
+        main_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {
+            **os.environ,
+            "SHARD_WORKER_INDEX": str(worker),
+            "SHARD_WORKER_SOCKET": self.socket_path(worker),
+            "SHARD_IDS": ",".join(str(shard_id) for shard_id in self.shard_ids(worker)),
+            "SHARD_COUNT": str(self.shard_count),
+            # Each worker keeps its own audio cache, metadata and queue journal, with
+            # an equal share of the cache limits so the total stays as configured
+            "MUSIC_DATA_DIR": os.path.join(os.getenv("MUSIC_DATA_DIR", "music"), f"worker-{worker}"),
+            "AUDIO_CACHE_MAX_BYTES": str(int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES))) // self.workers),
+            "AUDIO_CACHE_MAX_ENTRIES": str(max(int(os.getenv("AUDIO_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))) // self.workers, 1))
+        }
+        while not self._stopping:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, "-m", "uvicorn", "main:app", "--uds", self.socket_path(worker),
+                    cwd=main_dir, env=env
+                )
+                self.processes[worker] = process
+                logger.info(f"Started worker {worker} (pid {process.pid}) for shards {env['SHARD_IDS']}")
+                returncode = await process.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to start worker {worker}: {e}", exc_info=True)
+                returncode = None
+            if self._stopping:
+                return
+            self.restarts[worker] = self.restarts.get(worker, 0) + 1
+            logger.error(f"Worker {worker} exited with {returncode}, restarting in {self.RESTART_DELAY}s")
+            await asyncio.sleep(self.RESTART_DELAY)
+
+    async def _follow_guilds(self, worker: int) -> None:
+        """Apply a worker's guild list and its changes to the coordinator's registry"""
+        while not self._stopping:
+            try:
+                response = await self.stream(worker, "/internal/guilds/stream")
+                try:
+                    event = None
+                    async for line in response.content:
+                        line = line.decode().rstrip("\n")
+                        if line.startswith("event: "):
+                            event = line[len("event: "):]
+                        elif line.startswith("data: "):
+                            self._apply_guild_event(worker, event, json.loads(line[len("data: "):]))
+                            event = None
+                finally:
+                    response.release()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Guild list of worker {worker} unavailable: {e}")
+            await asyncio.sleep(self.FOLLOW_DELAY)
+
+    def _apply_guild_event(self, worker: int, event: Optional[str], data) -> None:
+        if event == "snapshot":
+            self.guild_registry.load_source(worker, data, self.workers)
+        elif event == "add":
+            self.guild_registry.add_entry(worker, data)
+        elif event == "remove":
+            self.guild_registry.remove_entry(worker, data["id"])
+
+    def _session(self, worker: int) -> aiohttp.ClientSession:
+        session = self._sessions.get(worker)
+        if session is None or session.closed:
+            session = self._sessions[worker] = aiohttp.ClientSession(
+                connector=aiohttp.UnixConnector(path=self.socket_path(worker))
+            )
+        return session
+
+    async def request(self, worker: int, method: str, path: str, params: Optional[Dict] = None,
+                      headers: Optional[Dict] = None, body: Optional[bytes] = None) -> Tuple[int, bytes, str]:
+        """Send an API request to a worker, returning status, body and content type"""
+        async with self._session(worker).request(
+            method, f"http://worker-{worker}{path}", params=params, headers=headers, data=body, timeout=self.timeout
+        ) as response:
+            return response.status, await response.read(), response.content_type
+
+    async def stream(self, worker: int, path: str, headers: Optional[Dict] = None) -> aiohttp.ClientResponse:
+        """Open a streaming request to a worker, the caller releases the response"""
+        return await self._session(worker).get(
+            f"http://worker-{worker}{path}", headers=headers,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout.total)
+        )
+
+    async def gather(self, path: str) -> Dict[str, Dict]:
+        """GET a JSON endpoint from every worker"""
+        async def _get(worker: int) -> Dict:
+            try:
+                _, body, _ = await self.request(worker, "GET", path)
+                return json.loads(body)
+            except Exception as e:
+                return {"error": f"Worker {worker} unavailable: {e}"}
+
+        results = await asyncio.gather(*(_get(worker) for worker in range(self.workers)))
+        return {str(worker): result for worker, result in enumerate(results)}
+
+    async def stop(self) -> None:
+        """Stop the workers"""
+        self._stopping = True
+        for task in self._supervisors:
+            task.cancel()
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.terminate()
+        for process in self.processes.values():
+            try:
+                await asyncio.wait_for(process.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                process.kill()
+        for session in self._sessions.values():
+            await session.close()
+
+    def get_stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "shard_count": self.shard_count,
+            "processes": {
+                str(worker): {
+                    "pid": process.pid,
+                    "running": process.returncode is None,
+                    "shard_ids": self.shard_ids(worker),
+                    "restarts": self.restarts.get(worker, 0)
+                }
+                for worker, process in self.processes.items()
+            }
+        }
@@ -0,0 +1,58 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+class StartupTracker:
+    """Startup phase timings and the readiness of each subsystem.
+
+    Phases are timed from process start. Subsystems register a check that
+    is evaluated on every readiness query, and the first time each one
+    passes is recorded alongside the phases.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases: Dict[str, Dict[str, float]] = {}  # phase -> {"start", "seconds"}
+        self.ready_after: Dict[str, float] = {}  # subsystem -> seconds from start to first ready
+        self._checks: Dict[str, Callable[[], bool]] = {}
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @asynccontextmanager
+    async def phase(self, name: str):
+        """Time a startup phase"""
+        start = self.elapsed()
+        try:
+            yield
+        finally:
+            seconds = self.elapsed() - start
+            self.phases[name] = {"start": round(start, 3), "seconds": round(seconds, 3)}
+            logger.info(f"Startup phase '{name}' took {seconds:.3f}s (started at {start:.3f}s)")
+
+    def add_check(self, name: str, check: Callable[[], bool]) -> None:
+        """Register a subsystem and how to tell it is ready"""
+        self._checks[name] = check
+
+    def check(self, name: str) -> bool:
+        try:
+            ready = bool(self._checks[name]())
+        except Exception:
+            ready = False
+        if ready and name not in self.ready_after:
+            self.ready_after[name] = round(self.elapsed(), 3)
+            logger.info(f"Subsystem '{name}' ready {self.ready_after[name]:.3f}s after start")
+        return ready
+
+    def get_status(self) -> Dict:
+        subsystems = {name: self.check(name) for name in self._checks}
+        return {
+            "ready": all(subsystems.values()),
+            "subsystems": subsystems,
+            "ready_after": dict(self.ready_after),
+            "phases": dict(self.phases),
+            "uptime": round(self.elapsed(), 3)
+        }
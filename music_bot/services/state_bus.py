@@ -0,0 +1,236 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+def encode_message(message: Dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+class StateBusServer:
+    """Publishes guild state from the bot process to web processes.
+
+    Web processes connect over a Unix socket and receive newline
+    delimited JSON messages: a snapshot of every guild's queue on connect,
+    ended by a snapshot_end message, then playback state, each queue
+    operation and coalesced playback updates. They send
+    commands back on the same connection and get a reply per command.
+    Messages are encoded once for all clients, and a client that falls
+    too far behind is disconnected so it resyncs from a new snapshot.
+    """
+
+    def __init__(self, music_bot, path: str,
+                 build_playback: Callable[[int], Awaitable[Dict]]):
+        self.music_bot = music_bot
+        self.path = path
+        self.build_playback = build_playback
+        self.max_buffer = int(os.getenv("STATE_BUS_MAX_BUFFER", str(4 * 1024 * 1024)))
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._playback_pending: Set[int] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.messages_sent = 0
+        self.clients_dropped = 0
+        self.commands_handled = 0
+
+    async def start(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info(f"State bus listening on {self.path}")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        for writer in list(self._clients):
+            writer.close()
+
+    def _send(self, message: Dict) -> None:
+        if not self._clients:
+            return
+        data = encode_message(message)
+        for writer in list(self._clients):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                logger.warning("Dropping state bus client that stopped reading")
+                self.clients_dropped += 1
+                self._clients.discard(writer)
+                writer.close()
+                continue
+            writer.write(data)
+            self.messages_sent += 1
+
+    def queue_changed(self, guild_id: int, operation: Dict) -> None:
+        """Publish a queue operation"""
+        queue_manager = self.music_bot.queue_managers.get(guild_id)
+        if queue_manager:
+            self._send({"type": "queue_op", "guild_id": guild_id, "epoch": queue_manager.epoch, "operation": operation})
+
+    def playback_changed(self, guild_id: int) -> None:
+        """Publish the guild's playback state, once per batch of changes"""
+        if not self._clients:
+            return
+        self._playback_pending.add(guild_id)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_playback())
+
+    def guild_released(self, guild_id: int) -> None:
+        self._send({"type": "release", "guild_id": guild_id})
+
+    async def _flush_playback(self) -> None:
+        while self._playback_pending:
+            guild_id = self._playback_pending.pop()
+            try:
+                self._send(await self._playback_message(guild_id))
+            except Exception as e:
+                logger.error(f"Error publishing playback state for guild {guild_id}: {e}", exc_info=True)
+
+    async def _playback_message(self, guild_id: int) -> Dict:
+        status = self.music_bot.audio_player.statuses.get(guild_id)
+        return {
+            "type": "playback",
+            "guild_id": guild_id,
+            "data": await self.build_playback(guild_id),
+            # Lets the web process advance the position between updates
+            "playing": bool(status and status.is_playing and status.clock is not None),
+            "published_at": time.time()
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        logger.info("State bus client connected")
+        try:
+            # The queue snapshot is written and the client joins the broadcast
+            # without awaiting in between, so no operation is missed or applied twice
+            guild_ids = list(self.music_bot.queue_managers)
+            for guild_id in guild_ids:
+                queue_manager = self.music_bot.queue_managers[guild_id]
+                writer.write(encode_message({
+                    "type": "queue_snapshot",
+                    "guild_id": guild_id,
+                    "epoch": queue_manager.epoch,
+                    "version": queue_manager.version,
+                    "queue": queue_manager.get_queue_info()
+                }))
+            writer.write(encode_message({"type": "snapshot_end"}))
+            self._clients.add(writer)
+            for guild_id in guild_ids:
+                writer.write(encode_message(await self._playback_message(guild_id)))
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                asyncio.create_task(self._run_command(writer, json.loads(line)))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"State bus client error: {e}", exc_info=True)
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+            logger.info("State bus client disconnected")
+
+    async def _run_command(self, writer: asyncio.StreamWriter, message: Dict) -> None:
+        """Run a command sent by a web process and reply to it"""
+        self.commands_handled += 1
+        guild_id = message["guild_id"]
+        try:
+            if message["command"] == "seek":
+                reached = await self.music_bot.get_playback_controller(guild_id).seek(message["position"])
+                if reached is None:
+                    reply = {"status": 409, "data": {"error": "Nothing to seek"}}
+                else:
+                    reply = {"status": 200, "data": await self.build_playback(guild_id)}
+            else:
+                reply = {"status": 400, "data": {"error": f"Unknown command {message['command']}"}}
+        except Exception as e:
+            logger.error(f"Error running state bus command {message}: {e}", exc_info=True)
+            reply = {"status": 500, "data": {"error": str(e)}}
+        if not writer.is_closing():
+            writer.write(encode_message({"type": "reply", "id": message["id"], **reply}))
+
+    def get_stats(self) -> Dict:
+        return {
+            "clients": len(self._clients),
+            "messages_sent": self.messages_sent,
+            "clients_dropped": self.clients_dropped,
+            "commands_handled": self.commands_handled
+        }
+
+class StateBusClient:
+    """Connection from a web process to the bot process's state bus.
+
+    Messages are passed to on_message. The connection is made again after
+    it drops, and on_reset is called first so state can be rebuilt from
+    the new snapshot.
+    """
+
+    RECONNECT_DELAY = 1  # Seconds between connection attempts
+    COMMAND_TIMEOUT = 10
+
+    def __init__(self, path: str, on_message: Callable[[Dict], None], on_reset: Callable[[], None]):
+        self.path = path
+        self.on_message = on_message
+        self.on_reset = on_reset
+        self.connected = False
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._replies: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+        if self._writer:
+            self._writer.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # Snapshots can be large, lines are not limited to the default 64 KiB
+                reader, self._writer = await asyncio.open_unix_connection(self.path, limit=2 ** 26)
+                self.on_reset()
+                self.connected = True
+                logger.info(f"Connected to state bus at {self.path}")
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    message = json.loads(line)
+                    if message["type"] == "reply":
+                        future = self._replies.pop(message["id"], None)
+                        if future and not future.done():
+                            future.set_result(message)
+                    else:
+                        self.on_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"State bus connection to {self.path} failed: {e}")
+            finally:
+                self.connected = False
+                for future in self._replies.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError("State bus disconnected"))
+                self._replies.clear()
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+    async def command(self, command: str, guild_id: int, **args) -> Dict:
+        """Send a command to the bot process and wait for its reply"""
+        if not self.connected:
+            raise ConnectionError("State bus not connected")
+        command_id = next(self._ids)
+        future = self._replies[command_id] = asyncio.get_running_loop().create_future()
+        self._writer.write(encode_message({
+            "type": "command", "id": command_id, "command": command, "guild_id": guild_id, **args
+        }))
+        try:
+            return await asyncio.wait_for(future, self.COMMAND_TIMEOUT)
+        finally:
+            self._replies.pop(command_id, None)
@@ -0,0 +1,147 @@
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from services.broadcaster import Broadcaster
+from services.queue_manager import apply_operation
+
+logger = logging.getLogger(__name__)
+
+class QueueMirror:
+    """A guild's queue as published by the bot process.
+
+    Versions and epochs are the bot's own, so SSE event ids stay valid
+    across every web process.
+    """
+
+    def __init__(self, epoch: str, version: int = 0, queue: Optional[List[Dict]] = None):
+        self.epoch = epoch
+        self.version = version
+        self.queue: List[Dict] = queue or []
+        self.oplog = deque(maxlen=int(os.getenv("QUEUE_OPLOG_SIZE", "256")))
+
+    def event_id(self, version: int) -> str:
+        return f"{self.epoch}:{version}"
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        if not event_id:
+            return None
+        epoch, _, version = event_id.partition(":")
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        return int(version)
+
+    def get_operations_since(self, version: int) -> Optional[List[Dict]]:
+        if version == self.version:
+            return []
+        if version > self.version or not self.oplog or self.oplog[0]["version"] > version + 1:
+            return None
+        return [operation for operation in self.oplog if operation["version"] > version]
+
+class StateMirror:
+    """Guild state of the bot process, kept current from the state bus.
+
+    Queue operations are applied in order and passed on to local SSE
+    subscribers. Playback state is stored with the time it was published
+    and its position advanced while the song plays.
+    """
+
+    def __init__(self, broadcaster: Broadcaster):
+        self.broadcaster = broadcaster
+        self.queues: Dict[int, QueueMirror] = {}
+        self.playback: Dict[int, Dict] = {}  # guild_id -> last playback message
+        self._stale: Dict[int, QueueMirror] = {}  # Queues from before the reconnect, until the snapshot ends
+        self.messages_received = 0
+
+    def reset(self) -> None:
+        """Forget all state before a new snapshot arrives.
+
+        Previous queues are kept aside so subscribers can be told whether
+        the snapshot continues from what they have.
+        """
+        self.playback.clear()
+        self._stale = self.queues
+        self.queues = {}
+
+    def on_message(self, message: Dict) -> None:
+        self.messages_received += 1
+        kind = message["type"]
+        if kind == "snapshot_end":
+            self._drop_stale()
+            return
+        guild_id = message["guild_id"]
+        if kind == "queue_snapshot":
+            previous = self._stale.pop(guild_id, None)
+            self.queues[guild_id] = QueueMirror(message["epoch"], message["version"], message["queue"])
+            if previous is None or (previous.epoch, previous.version) != (message["epoch"], message["version"]):
+                # Changes were missed while disconnected, subscribers start over
+                self.broadcaster.publish("queue", guild_id, self.get_queue_data(guild_id), event="snapshot",
+                                         event_id=self.queues[guild_id].event_id(message["version"]))
+        elif kind == "queue_op":
+            self._apply(guild_id, message["epoch"], message["operation"])
+        elif kind == "playback":
+            self.playback[guild_id] = message
+            self.broadcaster.notify("currently_playing", guild_id)
+        elif kind == "release":
+            self.queues.pop(guild_id, None)
+            self.playback.pop(guild_id, None)
+
+    def _drop_stale(self) -> None:
+        """Empty the queues of guilds released while disconnected"""
+        for guild_id in self._stale:
+            self.broadcaster.publish("queue", guild_id, self.get_queue_data(guild_id), event="snapshot",
+                                     event_id=self.get_queue(guild_id).event_id(0))
+            self.broadcaster.notify("currently_playing", guild_id)
+        self._stale = {}
+
+    def _apply(self, guild_id: int, epoch: str, operation: Dict) -> None:
+        queue = self.queues.get(guild_id)
+        if queue is None or queue.epoch != epoch:
+            # The bot created a new queue for the guild, which starts empty
+            queue = self.queues[guild_id] = QueueMirror(epoch)
+        if operation["version"] != queue.version + 1:
+            logger.warning(f"Queue mirror for guild {guild_id} skipped from version {queue.version} "
+                           f"to {operation['version']}")
+        apply_operation(queue.queue, operation)
+        queue.version = operation["version"]
+        queue.oplog.append(operation)
+        self.broadcaster.publish("queue", guild_id, operation, event="delta",
+                                 event_id=queue.event_id(operation["version"]))
+
+    def get_queue(self, guild_id: int) -> QueueMirror:
+        queue = self.queues.get(guild_id)
+        return queue if queue is not None else QueueMirror("0")
+
+    def get_queue_data(self, guild_id: int) -> Dict:
+        queue = self.get_queue(guild_id)
+        return {"version": queue.version, "queue": list(queue.queue), "error": None}
+
+    async def get_currently_playing_data(self, guild_id: int) -> Dict:
+        """The guild's playback state, with the position advanced to now"""
+        message = self.playback.get(guild_id)
+        if message is None or not message["data"].get("current_song"):
+            return {
+                "guild_id": guild_id,
+                "is_playing": False,
+                "current_song": None,
+                "progress": "0:00/0:00",
+                "position": 0,
+                "duration": 0
+            }
+        data = dict(message["data"])
+        if message["playing"]:
+            position = data["position"] + time.time() - message["published_at"]
+            if data["duration"]:
+                position = min(position, data["duration"])
+            data["position"] = position
+            pos, dur = int(position), data["duration"]
+            data["progress"] = f"{pos//60}:{pos%60:02d}/{dur//60}:{dur%60:02d}"
+        return data
+
+    def get_stats(self) -> Dict:
+        return {
+            "queues": len(self.queues),
+            "playback": len(self.playback),
+            "messages_received": self.messages_received
+        }
@@ -0,0 +1,203 @@
+import asyncio
+import datetime
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import yt_dlp
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+
+logger = logging.getLogger(__name__)
+
+# Quota units charged by the YouTube Data API per call
+QUOTA_COSTS = {
+    "search.list": 100,
+    "videos.list": 1
+}
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")  # The daily quota resets at midnight Pacific
+except Exception:
+    QUOTA_TIMEZONE = datetime.timezone.utc
+
+class YouTubeAPI:
+    """YouTube Data API calls that never block the event loop.
+
+    Calls run on a small worker pool, each worker thread with its own HTTP
+    connection since the API client's transport is not thread-safe. The
+    service client is built by the first call that needs it.
+    Concurrent video lookups are sent together as videos.list calls of up
+    to 50 ids. Quota spent is tracked against the daily budget, and
+    searches move to yt-dlp when it runs low.
+    """
+
+    MAX_BATCH = 50
+    BATCH_WINDOW = 0.01  # Seconds to collect concurrent lookups into one call
+
+    def __init__(self, build_youtube: Callable[[], Any]):
+        self.build_youtube = build_youtube
+        self._youtube = None
+        self._build_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("YOUTUBE_API_WORKERS", "4")),
+            thread_name_prefix="youtube-api"
+        )
+        self._local = threading.local()
+        self.daily_quota = int(os.getenv("YOUTUBE_QUOTA_DAILY", "10000"))
+        self.quota_reserve = int(os.getenv("YOUTUBE_QUOTA_RESERVE", "500"))  # Left for video lookups
+        self._quota_day = self._today()
+        self.quota_spent: Dict[str, int] = {}
+        self.calls: Dict[str, int] = {}
+        self.fallback_searches = 0
+        self._exhausted = False
+        self._pending: Dict[str, asyncio.Future] = {}  # video id -> lookup waiting for the next batch
+        self._batch_task: Optional[asyncio.Task] = None
+        # Details returned by yt-dlp searches, until the video is looked up. Searches
+        # answered from elsewhere never look them up, so only the latest are kept
+        self._fallback_details: "OrderedDict[str, Dict]" = OrderedDict()
+        self.fallback_details_size = int(os.getenv("YOUTUBE_FALLBACK_DETAILS_SIZE", "256"))
+
+    @staticmethod
+    def _today() -> datetime.date:
+        return datetime.datetime.now(QUOTA_TIMEZONE).date()
+
+    @property
+    def youtube(self):
+        """The service client, built on first use"""
+        if self._youtube is None:
+            with self._build_lock:
+                if self._youtube is None:
+                    started = time.monotonic()
+                    self._youtube = self.build_youtube()
+                    logger.info(f"Built YouTube API client in {time.monotonic() - started:.3f}s")
+        return self._youtube
+
+    def _http(self):
+        if not hasattr(self._local, "http"):
+            self._local.http = build_http()
+        return self._local.http
+
+    @property
+    def quota_remaining(self) -> int:
+        if self._quota_day != self._today():
+            self._quota_day = self._today()
+            self.quota_spent.clear()
+            self.calls.clear()
+            self._exhausted = False
+        if self._exhausted:
+            return 0
+        return max(self.daily_quota - sum(self.quota_spent.values()), 0)
+
+    async def _execute(self, method: str, make_request: Callable[[Any], Any]) -> Dict:
+        """Build and run an API request on a worker and charge its quota"""
+        self.quota_spent[method] = self.quota_spent.get(method, 0) + QUOTA_COSTS[method]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, lambda: make_request(self.youtube).execute(http=self._http())
+            )
+        except HttpError as e:
+            if e.resp.status == 403 and b"quota" in (e.content or b"").lower():
+                logger.warning("YouTube API quota exhausted, using yt-dlp until the daily reset")
+                self._exhausted = True
+            raise
+
+    async def search(self, query: str) -> Optional[str]:
+        """Get the id of the top video result for a query"""
+        if self.quota_remaining - QUOTA_COSTS["search.list"] < self.quota_reserve:
+            return await self._search_fallback(query)
+        try:
+            response = await self._execute(
+                "search.list",
+                lambda youtube: youtube.search().list(q=query, part="id", type="video", maxResults=1)
+            )
+        except HttpError as e:
+            logger.error(f"YouTube search failed for '{query}': {e}")
+            return await self._search_fallback(query) if self._exhausted else None
+        if not response.get("items"):
+            return None
+        return response["items"][0]["id"]["videoId"]
+
+    async def _search_fallback(self, query: str) -> Optional[str]:
+        """Search with yt-dlp, which costs no API quota"""
+        self.fallback_searches += 1
+
+        def _search():
+            with yt_dlp.YoutubeDL({"quiet": True, "extract_flat": "in_playlist", "no_warnings": True}) as ytdl:
+                return ytdl.extract_info(f"ytsearch1:{query}", download=False)
+
+        try:
+            info = await asyncio.get_running_loop().run_in_executor(self.executor, _search)
+        except Exception as e:
+            logger.error(f"yt-dlp search failed for '{query}': {e}")
+            return None
+        entries = (info or {}).get("entries") or []
+        if not entries:
+            return None
+        entry = entries[0]
+        video_id = entry["id"]
+        self._fallback_details[video_id] = {
+            "snippet": {
+                "title": entry.get("title", ""),
+                "thumbnails": {"default": {"url": f"https://i.ytimg.com/vi/{video_id}/default.jpg"}}
+            },
+            "contentDetails": {"duration": f"PT{int(entry.get('duration') or 0)}S"}
+        }
+        self._fallback_details.move_to_end(video_id)
+        while len(self._fallback_details) > self.fallback_details_size:
+            self._fallback_details.popitem(last=False)
+        return video_id
+
+    async def get_video(self, video_id: str) -> Optional[Dict]:
+        """Get the snippet and contentDetails of a video"""
+        details = self._fallback_details.pop(video_id, None)
+        if details:
+            return details
+        future = self._pending.get(video_id)
+        if future is None:
+            future = self._pending[video_id] = asyncio.get_running_loop().create_future()
+            if self._batch_task is None or self._batch_task.done():
+                self._batch_task = asyncio.create_task(self._run_batches())
+        return await asyncio.shield(future)
+
+    async def _run_batches(self) -> None:
+        await asyncio.sleep(self.BATCH_WINDOW)
+        while self._pending:
+            batches = []
+            while self._pending:
+                ids = list(self._pending)[:self.MAX_BATCH]
+                batches.append({video_id: self._pending.pop(video_id) for video_id in ids})
+            await asyncio.gather(*(self._lookup(batch) for batch in batches))
+
+    async def _lookup(self, batch: Dict[str, asyncio.Future]) -> None:
+        try:
+            response = await self._execute(
+                "videos.list",
+                lambda youtube: youtube.videos().list(part="snippet,contentDetails", id=",".join(batch),
+                                                      maxResults=len(batch))
+            )
+            items = {item["id"]: item for item in response.get("items", [])}
+            for video_id, future in batch.items():
+                if not future.done():
+                    future.set_result(items.get(video_id))
+        except Exception as e:
+            logger.error(f"Video lookup failed for {len(batch)} ids: {e}")
+            for future in batch.values():
+                if not future.done():
+                    future.set_result(None)
+
+    def get_stats(self) -> Dict:
+        """Get quota spent per call type and fallback counts"""
+        return {
+            "quota_daily": self.daily_quota,
+            "quota_remaining": self.quota_remaining,
+            "quota_spent": dict(self.quota_spent),
+            "calls": dict(self.calls),
+            "fallback_searches": self.fallback_searches,
+            "exhausted": self._exhausted
+        }
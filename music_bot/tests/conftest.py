@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules import each other relative to the music_bot directory, as with PYTHONPATH=/music_bot
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
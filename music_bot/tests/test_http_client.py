@@ -0,0 +1,129 @@
+import asyncio
+import time
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from services.http_client import DiscordHTTPClient, DiscordHTTPError
+
+async def serve(routes):
+    """Start a local stand-in for the Discord API, returning it and a client pointed at it"""
+    app = web.Application()
+    app.router.add_routes(routes)
+    server = TestServer(app)
+    await server.start_server()
+    return server, DiscordHTTPClient(base_url=f"http://{server.host}:{server.port}")
+
+def test_requests_reuse_pooled_connections():
+    peers = set()
+
+    async def handler(request):
+        peers.add(request.transport.get_extra_info("peername")[1])
+        return web.json_response({"ok": True})
+
+    async def run():
+        server, client = await serve([web.get("/users/@me", handler)])
+        try:
+            for _ in range(5):
+                assert await client.get("/users/@me", bot_token="token") == {"ok": True}
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(run())
+    assert len(peers) == 1
+
+def test_concurrent_requests_on_a_route_are_not_serialized():
+    async def handler(request):
+        await asyncio.sleep(0.2)
+        return web.json_response({}, headers={"X-RateLimit-Remaining": "10", "X-RateLimit-Reset-After": "5"})
+
+    async def run():
+        server, client = await serve([web.get("/users/@me/guilds", handler)])
+        try:
+            started = time.monotonic()
+            await asyncio.gather(*(client.get("/users/@me/guilds", bot_token="token") for _ in range(5)))
+            return time.monotonic() - started
+        finally:
+            await client.close()
+            await server.close()
+
+    assert asyncio.run(run()) < 0.6
+
+def test_rate_limited_request_is_retried_after_retry_after():
+    calls = []
+
+    async def handler(request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return web.json_response({"retry_after": 0.3, "global": False}, status=429)
+        return web.json_response({"id": "1"})
+
+    async def run():
+        server, client = await serve([web.get("/gateway/bot", handler)])
+        try:
+            return await client.get("/gateway/bot", bot_token="token")
+        finally:
+            await client.close()
+            await server.close()
+
+    assert asyncio.run(run()) == {"id": "1"}
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.3
+
+def test_rate_limit_gives_up_after_max_retries():
+    async def handler(request):
+        return web.json_response({"retry_after": 0.01}, status=429)
+
+    async def run():
+        server, client = await serve([web.get("/gateway/bot", handler)])
+        try:
+            with pytest.raises(DiscordHTTPError) as error:
+                await client.get("/gateway/bot", bot_token="token")
+            assert error.value.status == 429
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(run())
+
+def test_exhausted_bucket_waits_for_reset():
+    calls = []
+
+    async def handler(request):
+        calls.append(time.monotonic())
+        return web.json_response({}, headers={
+            "X-RateLimit-Bucket": "abc",
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset-After": "0.3"
+        })
+
+    async def run():
+        server, client = await serve([web.get("/users/@me", handler)])
+        try:
+            await client.get("/users/@me", bot_token="token")
+            await client.get("/users/@me", bot_token="token")
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(run())
+    assert calls[1] - calls[0] >= 0.3
+
+def test_buckets_are_per_token():
+    calls = []
+
+    async def handler(request):
+        calls.append(time.monotonic())
+        return web.json_response({}, headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "1"})
+
+    async def run():
+        server, client = await serve([web.get("/users/@me", handler)])
+        try:
+            await client.get("/users/@me", access_token="first")
+            await client.get("/users/@me", access_token="second")
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(run())
+    assert calls[1] - calls[0] < 0.5
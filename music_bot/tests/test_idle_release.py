@@ -0,0 +1,84 @@
+import asyncio
+import os
+from types import SimpleNamespace
+import pytest
+from models.song import Song
+from services.playback_controller import PlaybackState
+
+GUILD_ID = 1
+
+@pytest.fixture
+def music_bot_factory(tmp_path, monkeypatch):
+    monkeypatch.setenv("MUSIC_DATA_DIR", str(tmp_path))
+    from bot import MusicBot
+
+    async def create():
+        discord_bot = SimpleNamespace(get_guild=lambda guild_id: None, voice_clients=[])
+        music_bot = MusicBot(discord_bot, build_youtube=lambda: None)
+        # The background loop starts with the default timeout, the tests then
+        # release idle guilds themselves without waiting
+        await asyncio.sleep(0)
+        music_bot.idle_timeout = 0
+        return music_bot
+
+    return create
+
+def make_song(video_id):
+    """A song whose file is already cached, so nothing is downloaded"""
+    filepath = os.path.join(os.environ["MUSIC_DATA_DIR"], f"{video_id}.opus")
+    with open(filepath, "wb") as f:
+        f.write(b"OggS")
+    return Song(id=video_id, title=video_id, duration=200, thumbnail="", webpage_url="",
+                is_downloaded=True, filepath=filepath)
+
+async def wait_for(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+def test_paused_guild_is_not_released(music_bot_factory):
+    async def run():
+        music_bot = await music_bot_factory()
+        queue_manager = music_bot.get_queue_manager(GUILD_ID)
+        queue_manager.current_song = make_song("a")
+        music_bot.get_playback_controller(GUILD_ID)._set_state(PlaybackState.PAUSED)
+
+        await music_bot.release_idle_guilds()
+        assert music_bot.queue_managers[GUILD_ID] is queue_manager
+
+        # Resumed and finished, the guild is idle again
+        queue_manager.current_song = None
+        music_bot.get_playback_controller(GUILD_ID)._set_state(PlaybackState.IDLE)
+        await music_bot.release_idle_guilds()
+        assert GUILD_ID not in music_bot.queue_managers
+
+    asyncio.run(run())
+
+def test_queued_guild_without_voice_is_not_released(music_bot_factory):
+    async def run():
+        music_bot = await music_bot_factory()
+        music_bot.get_queue_manager(GUILD_ID).restore([make_song("a"), make_song("b")])
+        await wait_for(lambda: music_bot.get_playback_controller(GUILD_ID).is_idle())
+
+        await music_bot.release_idle_guilds()
+        assert [song.id for song in music_bot.queue_managers[GUILD_ID].queue] == ["a", "b"]
+
+    asyncio.run(run())
+
+def test_released_queue_comes_back_on_next_use(music_bot_factory):
+    async def run():
+        music_bot = await music_bot_factory()
+        queue_manager = music_bot.get_queue_manager(GUILD_ID)
+        queue_manager.restore([make_song("a"), make_song("b")])
+        await music_bot.release_guild(GUILD_ID)
+        assert GUILD_ID not in music_bot.queue_managers
+
+        queue_manager = music_bot.get_queue_manager(GUILD_ID)
+        await wait_for(lambda: queue_manager.queue)
+        assert [song.id for song in queue_manager.queue] == ["a", "b"]
+        saved = await music_bot.queue_journal.get(GUILD_ID)
+        assert [song["id"] for song in saved["queue"]] == ["a", "b"]
+        assert saved["channel_id"] is None
+
+    asyncio.run(run())
@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+from models.song import Song
+from services.playback_controller import PlaybackController, PlaybackState
+from services.queue_manager import QueueManager
+
+GUILD_ID = 1
+
+class FakeVoiceClient:
+    def is_connected(self):
+        return True
+
+class FakeAudioPlayer:
+    prewarm_seconds = 10
+
+    def __init__(self):
+        self.played = []
+        self.paused = False
+
+    async def play(self, voice_client, source, duration, **kwargs):
+        self.played.append((source, kwargs["start"]))
+        return True
+
+    def pause(self, guild_id):
+        self.paused = True
+
+    def stop(self, guild_id):
+        pass
+
+class FakeDownloader:
+    progressive = False
+
+    def get_playback_gain(self, video_id):
+        return 0.0
+
+    async def get_seek_index(self, video_id):
+        return None
+
+class FakeMusicBot:
+    """Just enough of MusicBot to run one guild's queue and controller"""
+
+    def __init__(self, voice_client):
+        self.bot = SimpleNamespace(get_guild=lambda guild_id: SimpleNamespace(voice_client=voice_client))
+        self.audio_player = FakeAudioPlayer()
+        self.queue_downloader = FakeDownloader()
+        self.metadata_store = SimpleNamespace(get_duration=lambda video_id, duration: duration)
+        self.queue_manager = QueueManager(self, GUILD_ID)
+        self.controller = PlaybackController(self, GUILD_ID)
+
+    def get_queue_manager(self, guild_id):
+        return self.queue_manager
+
+    def on_queue_changed(self, guild_id, event, operation=None):
+        self.controller.on_queue_event(event)
+
+def make_song(video_id):
+    return Song(id=video_id, title=video_id, duration=200, thumbnail="", webpage_url="",
+                is_downloaded=True, filepath=f"/cache/{video_id}.opus")
+
+async def settle(controller):
+    await asyncio.sleep(0)
+    if controller._advance_task:
+        await controller._advance_task
+
+def test_restored_queue_starts_playing():
+    async def run():
+        music_bot = FakeMusicBot(FakeVoiceClient())
+        music_bot.queue_manager.restore([make_song("a"), make_song("b")])
+        await settle(music_bot.controller)
+
+        assert music_bot.audio_player.played == [("/cache/a.opus", 0)]
+        assert music_bot.controller.state == PlaybackState.PLAYING
+        assert [song.id for song in music_bot.queue_manager.queue] == ["b"]
+        music_bot.controller.close()
+
+    asyncio.run(run())
+
+def test_restored_current_song_resumes_before_queue():
+    async def run():
+        music_bot = FakeMusicBot(FakeVoiceClient())
+        music_bot.queue_manager.restore([make_song("b")])
+        music_bot.controller.restore(make_song("a"), 42.0, True)
+        await settle(music_bot.controller)
+
+        assert music_bot.audio_player.played == [("/cache/a.opus", 42.0)]
+        assert music_bot.audio_player.paused
+        assert [song.id for song in music_bot.queue_manager.queue] == ["b"]
+        music_bot.controller.close()
+
+    asyncio.run(run())
+
+def test_restored_queue_waits_without_voice():
+    async def run():
+        music_bot = FakeMusicBot(None)
+        music_bot.queue_manager.restore([make_song("a")])
+        await settle(music_bot.controller)
+
+        assert music_bot.audio_player.played == []
+        assert music_bot.controller.state == PlaybackState.IDLE
+        assert [song.id for song in music_bot.queue_manager.queue] == ["a"]
+
+    asyncio.run(run())
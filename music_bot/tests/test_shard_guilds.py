@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+import uvicorn
+from fastapi import FastAPI
+from routes import current_guilds
+from services.broadcaster import Broadcaster
+from services.guild_registry import GuildRegistry
+from services.shard_coordinator import ShardCoordinator
+
+def make_guild(guild_id, name):
+    return SimpleNamespace(id=guild_id, name=name, icon=None)
+
+async def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+def test_coordinator_registry_follows_worker_gateway(tmp_path):
+    async def run():
+        # One worker's API, serving its gateway-fed registry on the worker socket
+        worker_registry = GuildRegistry(http_client=None, token=None)
+        worker_registry.broadcaster = Broadcaster()
+        worker_registry.broadcaster.register("guilds", max_queued=1024)
+        app = FastAPI()
+        app.include_router(current_guilds.init_router(None, worker_registry))
+        coordinator_registry = GuildRegistry(http_client=None, token=None)
+        coordinator = ShardCoordinator(1, http_client=None, token=None, socket_dir=str(tmp_path),
+                                       guild_registry=coordinator_registry)
+        server = uvicorn.Server(uvicorn.Config(app, uds=coordinator.socket_path(0), log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        await wait_for(lambda: server.started)
+        following = asyncio.create_task(coordinator._follow_guilds(0))
+        try:
+            worker_registry.load([make_guild(1, "one"), make_guild(2, "two")])
+            await wait_for(lambda: coordinator_registry.ready)
+            assert sorted(coordinator_registry.guilds) == ["1", "2"]
+            version = coordinator_registry.version
+
+            worker_registry.add(make_guild(3, "three"))
+            worker_registry.remove(make_guild(1, "one"))
+            await wait_for(lambda: "1" not in coordinator_registry.guilds)
+            assert sorted(coordinator_registry.guilds) == ["2", "3"]
+            assert coordinator_registry.version == version + 2
+            # Served from the followed list, not over REST
+            assert [guild["name"] for guild in await coordinator_registry.get_guilds()] == ["two", "three"]
+        finally:
+            following.cancel()
+            server.should_exit = True
+            await serving
+            await coordinator.stop()
+
+    asyncio.run(run())
+
+def test_registry_is_ready_once_every_worker_reported():
+    registry = GuildRegistry(http_client=None, token=None)
+    registry.load_source(0, [{"id": "1", "name": "one", "icon": None}], sources=2)
+    assert not registry.ready
+    registry.load_source(1, [{"id": "2", "name": "two", "icon": None}], sources=2)
+    assert registry.ready
+
+    # A worker that reconnects replaces only its own guilds
+    registry.load_source(0, [{"id": "4", "name": "four", "icon": None}], sources=2)
+    assert sorted(registry.guilds) == ["2", "4"]
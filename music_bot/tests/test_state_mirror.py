@@ -0,0 +1,58 @@
+from services.state_mirror import StateMirror
+
+class FakeBroadcaster:
+    def __init__(self):
+        self.published = []
+        self.notified = []
+
+    def publish(self, channel, guild_id, data, event=None, event_id=None):
+        self.published.append((channel, guild_id, event, data))
+
+    def notify(self, channel, guild_id):
+        self.notified.append((channel, guild_id))
+
+def snapshot(guild_id, epoch, version, queue):
+    return {"type": "queue_snapshot", "guild_id": guild_id, "epoch": epoch, "version": version, "queue": queue}
+
+def test_queue_ops_are_applied_and_published():
+    broadcaster = FakeBroadcaster()
+    mirror = StateMirror(broadcaster)
+    mirror.on_message(snapshot(1, "e", 1, [{"id": "a"}]))
+    mirror.on_message({"type": "snapshot_end"})
+    mirror.on_message({"type": "queue_op", "guild_id": 1, "epoch": "e",
+                       "operation": {"version": 2, "op": "add", "index": 1, "song": {"id": "b"}}})
+
+    assert mirror.get_queue_data(1)["queue"] == [{"id": "a"}, {"id": "b"}]
+    assert mirror.get_queue(1).get_operations_since(1)[0]["op"] == "add"
+    assert broadcaster.published[-1][2] == "delta"
+
+def test_reconnect_drops_queues_released_while_disconnected():
+    broadcaster = FakeBroadcaster()
+    mirror = StateMirror(broadcaster)
+    mirror.on_message(snapshot(1, "e", 3, [{"id": "a"}]))
+    mirror.on_message(snapshot(2, "e", 5, [{"id": "b"}]))
+    mirror.on_message({"type": "snapshot_end"})
+    broadcaster.published.clear()
+
+    # Guild 2 was released while the bus was down, guild 1 did not change
+    mirror.reset()
+    mirror.on_message(snapshot(1, "e", 3, [{"id": "a"}]))
+    mirror.on_message({"type": "snapshot_end"})
+
+    assert set(mirror.queues) == {1}
+    assert mirror.get_queue_data(2)["queue"] == []
+    assert broadcaster.published == [("queue", 2, "snapshot", {"version": 0, "queue": [], "error": None})]
+    assert ("currently_playing", 2) in broadcaster.notified
+
+def test_reconnect_with_missed_changes_sends_a_snapshot():
+    broadcaster = FakeBroadcaster()
+    mirror = StateMirror(broadcaster)
+    mirror.on_message(snapshot(1, "e", 3, [{"id": "a"}]))
+    mirror.on_message({"type": "snapshot_end"})
+    broadcaster.published.clear()
+
+    mirror.reset()
+    mirror.on_message(snapshot(1, "e", 4, []))
+    mirror.on_message({"type": "snapshot_end"})
+
+    assert broadcaster.published == [("queue", 1, "snapshot", {"version": 4, "queue": [], "error": None})]
@@ -0,0 +1,152 @@
+import asyncio
+import httplib2
+from googleapiclient.errors import HttpError
+from services import youtube_api
+from services.youtube_api import YouTubeAPI
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self, http=None):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+class FakeYouTube:
+    """Stand-in for the YouTube Data API service client"""
+
+    def __init__(self, search_result=None):
+        self.search_result = search_result
+        self.video_calls = []
+        self.search_calls = []
+
+    def videos(self):
+        return self
+
+    def search(self):
+        return FakeSearch(self)
+
+    def list(self, part, id, maxResults):
+        ids = id.split(",")
+        self.video_calls.append(ids)
+        return FakeRequest({"items": [
+            {"id": video_id, "snippet": {"title": f"Title {video_id}"}} for video_id in ids if video_id != "missing"
+        ]})
+
+class FakeSearch:
+    def __init__(self, youtube):
+        self.youtube = youtube
+
+    def list(self, q, **kwargs):
+        self.youtube.search_calls.append(q)
+        return FakeRequest(self.youtube.search_result)
+
+class FakeYoutubeDL:
+    def __init__(self, options):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def extract_info(self, url, download=False):
+        query = url.split(":", 1)[1]
+        return {"entries": [{"id": f"yt-{query}", "title": query, "duration": 212}]}
+
+def make_api(youtube):
+    return YouTubeAPI(lambda: youtube)
+
+def test_concurrent_lookups_are_batched():
+    youtube = FakeYouTube()
+
+    async def run():
+        api = make_api(youtube)
+        try:
+            ids = [f"v{i}" for i in range(120)] + ["missing"]
+            return api, await asyncio.gather(*(api.get_video(video_id) for video_id in ids))
+        finally:
+            api.executor.shutdown()
+
+    api, results = asyncio.run(run())
+    assert sorted(len(call) for call in youtube.video_calls) == [21, 50, 50]
+    assert results[0]["snippet"]["title"] == "Title v0"
+    assert results[-1] is None
+    assert api.quota_spent == {"videos.list": 3}
+    assert api.calls == {"videos.list": 3}
+
+def test_repeated_lookup_of_a_pending_id_shares_the_call():
+    youtube = FakeYouTube()
+
+    async def run():
+        api = make_api(youtube)
+        try:
+            return await asyncio.gather(api.get_video("a"), api.get_video("a"))
+        finally:
+            api.executor.shutdown()
+
+    first, second = asyncio.run(run())
+    assert youtube.video_calls == [["a"]]
+    assert first == second
+
+def test_search_moves_to_yt_dlp_when_quota_runs_low(monkeypatch):
+    monkeypatch.setenv("YOUTUBE_QUOTA_DAILY", "700")
+    monkeypatch.setenv("YOUTUBE_QUOTA_RESERVE", "500")
+    monkeypatch.setattr(youtube_api.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    youtube = FakeYouTube({"items": [{"id": {"videoId": "api-result"}}]})
+
+    async def run():
+        api = make_api(youtube)
+        try:
+            results = [await api.search(query) for query in ("first", "second", "third")]
+            # Details of the fallback result are served without an API call
+            details = await api.get_video("yt-third")
+            return api, results, details
+        finally:
+            api.executor.shutdown()
+
+    api, results, details = asyncio.run(run())
+    assert results == ["api-result", "api-result", "yt-third"]
+    assert youtube.search_calls == ["first", "second"]
+    assert api.quota_spent == {"search.list": 200}
+    assert api.quota_remaining == 500
+    assert api.fallback_searches == 1
+    assert details["snippet"]["title"] == "third"
+    assert details["contentDetails"]["duration"] == "PT212S"
+    assert youtube.video_calls == []
+
+def test_quota_exhausted_error_switches_to_yt_dlp(monkeypatch):
+    monkeypatch.setattr(youtube_api.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    error = HttpError(httplib2.Response({"status": 403}), b'{"error": {"errors": [{"reason": "quotaExceeded"}]}}')
+    youtube = FakeYouTube(error)
+
+    async def run():
+        api = make_api(youtube)
+        try:
+            return api, await api.search("song")
+        finally:
+            api.executor.shutdown()
+
+    api, result = asyncio.run(run())
+    assert result == "yt-song"
+    assert api.quota_remaining == 0
+    assert api.get_stats()["exhausted"]
+
+def test_fallback_details_are_bounded(monkeypatch):
+    monkeypatch.setenv("YOUTUBE_QUOTA_DAILY", "0")
+    monkeypatch.setenv("YOUTUBE_FALLBACK_DETAILS_SIZE", "3")
+    monkeypatch.setattr(youtube_api.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+
+    async def run():
+        api = make_api(FakeYouTube())
+        try:
+            for i in range(10):
+                await api.search(f"q{i}")
+            return api
+        finally:
+            api.executor.shutdown()
+
+    api = asyncio.run(run())
+    assert list(api._fallback_details) == ["yt-q7", "yt-q8", "yt-q9"]
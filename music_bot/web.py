@@ -0,0 +1,68 @@
+import os
+from dotenv import load_dotenv
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from cors import add_cors
+from log_config import setup_logging
+from services.broadcaster import Broadcaster
+from services.guild_registry import GuildRegistry
+from services.http_client import DiscordHTTPClient
+from services.state_bus import StateBusClient
+from services.state_mirror import StateMirror
+
+from routes import mirror
+from routes import current_guilds
+from routes import auth
+
+# Serves the API apart from the voice process, from the guild state the bot
+# publishes on its state bus. Run alongside main.py started with the same
+# STATE_BUS_SOCKET, with as many workers as needed:
+#   uvicorn web:app --workers 4
+# Workers share login sessions through SQLite at SESSION_DB_PATH, which
+# defaults to sessions.db in MUSIC_DATA_DIR. Every worker must use the same
+# file, or a session made on one worker is unknown to the others.
+
+load_dotenv()
+if not os.getenv("SESSION_DB_PATH"):
+    session_dir = os.getenv("MUSIC_DATA_DIR", "music")
+    os.makedirs(session_dir, exist_ok=True)
+    os.environ["SESSION_DB_PATH"] = os.path.abspath(os.path.join(session_dir, "sessions.db"))
+# Workers log to stdout only, they would overwrite each other's file
+logger = setup_logging(None)
+
+app = FastAPI()
+add_cors(app)
+
+state_mirror = StateMirror(Broadcaster())
+state_bus = StateBusClient(
+    os.getenv("STATE_BUS_SOCKET", "/tmp/music_bot/state.sock"),
+    on_message=state_mirror.on_message,
+    on_reset=state_mirror.reset
+)
+
+# Shared pooled client for every Discord REST call
+http_client = DiscordHTTPClient()
+# Without a gateway connection the guild list is fetched over REST
+guild_registry = GuildRegistry(http_client, os.getenv("DISCORD_BOT_TOKEN"))
+
+@app.get("/healthz")
+async def health_check():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readiness_check():
+    status = {"ready": state_bus.connected, "subsystems": {"state_bus": state_bus.connected}}
+    return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
+
+app.include_router(mirror.init_router(state_mirror, state_bus))
+app.include_router(current_guilds.init_router(None, guild_registry))
+app.include_router(auth.init_router(None, http_client, guild_registry))
+
+@app.on_event("startup")
+async def startup_event():
+    state_bus.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await state_bus.stop()
+    await http_client.close()